@@ -45,10 +45,14 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'orcamento.middleware.ContagemConsultasMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # Papéis do usuário resolvidos uma vez por requisição (request.papeis);
+    # depois de SessionMiddleware e AuthenticationMiddleware
+    'orcamento.middleware.PapeisMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django_htmx.middleware.HtmxMiddleware',
@@ -67,6 +71,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'orcamento.context_processors.papeis',
             ],
         },
     },
@@ -136,3 +141,20 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 LOGIN_URL = 'orcamento:login'
 LOGIN_REDIRECT_URL = 'orcamento:index'
 LOGOUT_REDIRECT_URL = 'orcamento:login'
+
+# Cabeçalhos X-Consultas / X-Tempo-Consultas em cada resposta (comando teste_carga)
+CONTAR_CONSULTAS = False
+
+# Invalidação do snapshot de preços entre workers (ver orcamento/invalidacao_precos.py).
+# Cada processo consulta o backend no máximo uma vez a cada INTERVALO segundos.
+PRECOS_INVALIDACAO_BACKEND = 'orcamento.invalidacao_precos.BackendBanco'
+PRECOS_INVALIDACAO_INTERVALO = 2
+# PRECOS_INVALIDACAO_BACKEND = 'orcamento.invalidacao_precos.BackendRedis'
+# PRECOS_INVALIDACAO_REDIS_URL = 'redis://127.0.0.1:6379/0'
+# PRECOS_INVALIDACAO_BACKEND = 'orcamento.invalidacao_precos.BackendArquivo'
+# PRECOS_INVALIDACAO_ARQUIVO = BASE_DIR / 'precos.versao'
+
+# Reprecificação dos orçamentos abertos após alterar tabelas de preço (ver
+# orcamento/dependencias.py): em uma thread, fora da requisição do gestor.
+# Pendências (falha ou reinício do processo): recalcular_orcamentos --pendentes
+REPRECIFICACAO_EM_SEGUNDO_PLANO = True
@@ -4,8 +4,47 @@ from django.contrib.auth.models import User
 from .models import (
     TipoMaterial, TipoCorte, TabelaPreco, CoeficienteFator,
     ValorGoma, ValorCorte, Configuracao, Orcamento, Textura, Vendedor,
-    CorOrcamento, Batida, Fita
+    CorOrcamento, Batida, Fita, AlteracaoPreco
 )
+from .dependencias import reprecificacao_incremental
+from .versao_precos import alteracao_precos
+
+
+class AlteracaoPrecosAdminMixin:
+    """
+    Alterações feitas pelo admin entram no registro com o usuário e uma única
+    versão dos preços por requisição (inclusive edição em lista e exclusão em
+    lote), e reprecificam os orçamentos abertos afetados após o commit
+    """
+    def _com_alteracao(self, view, request, *args, **kwargs):
+        if request.method != 'POST':
+            return view(request, *args, **kwargs)
+        with reprecificacao_incremental(), alteracao_precos(usuario=request.user, descricao='Admin'):
+            return view(request, *args, **kwargs)
+
+    def changeform_view(self, request, *args, **kwargs):
+        return self._com_alteracao(super().changeform_view, request, *args, **kwargs)
+
+    def changelist_view(self, request, *args, **kwargs):
+        return self._com_alteracao(super().changelist_view, request, *args, **kwargs)
+
+    def delete_view(self, request, *args, **kwargs):
+        return self._com_alteracao(super().delete_view, request, *args, **kwargs)
+
+    # Gravações também chamadas fora das views acima (ações, subclasses);
+    # dentro delas os contextos aninhados reutilizam os da requisição
+
+    def save_model(self, request, obj, form, change):
+        with reprecificacao_incremental(), alteracao_precos(usuario=request.user, descricao='Admin'):
+            super().save_model(request, obj, form, change)
+
+    def delete_model(self, request, obj):
+        with reprecificacao_incremental(), alteracao_precos(usuario=request.user, descricao='Admin'):
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        with reprecificacao_incremental(), alteracao_precos(usuario=request.user, descricao='Admin'):
+            super().delete_queryset(request, queryset)
 
 
 class BatidaInline(admin.TabularInline):
@@ -17,7 +56,7 @@ class BatidaInline(admin.TabularInline):
 
 
 @admin.register(TipoMaterial)
-class TipoMaterialAdmin(admin.ModelAdmin):
+class TipoMaterialAdmin(AlteracaoPrecosAdminMixin, admin.ModelAdmin):
     list_display = ['nome', 'codigo', 'ordem', 'dupla_densidade', 'ativo']
     list_editable = ['ordem', 'dupla_densidade', 'ativo']
     search_fields = ['nome', 'codigo']
@@ -34,7 +73,7 @@ class TipoMaterialAdmin(admin.ModelAdmin):
 
 
 @admin.register(Batida)
-class BatidaAdmin(admin.ModelAdmin):
+class BatidaAdmin(AlteracaoPrecosAdminMixin, admin.ModelAdmin):
     list_display = ['tipo_material', 'numero_batidas', 'fator', 'descricao', 'ordem', 'ativo']
     list_editable = ['numero_batidas', 'fator', 'descricao', 'ordem', 'ativo']
     list_filter = ['tipo_material', 'ativo']
@@ -52,7 +91,7 @@ class BatidaAdmin(admin.ModelAdmin):
 
 
 @admin.register(Fita)
-class FitaAdmin(admin.ModelAdmin):
+class FitaAdmin(AlteracaoPrecosAdminMixin, admin.ModelAdmin):
     list_display = ['largura_mm', 'fator']
     list_editable = ['fator']
     ordering = ['largura_mm']
@@ -67,7 +106,7 @@ class FitaAdmin(admin.ModelAdmin):
 
 
 @admin.register(TipoCorte)
-class TipoCorteAdmin(admin.ModelAdmin):
+class TipoCorteAdmin(AlteracaoPrecosAdminMixin, admin.ModelAdmin):
     list_display = ['nome', 'codigo', 'codigo_calc', 'ativo']
     list_editable = ['ativo']
     search_fields = ['nome', 'codigo']
@@ -75,7 +114,7 @@ class TipoCorteAdmin(admin.ModelAdmin):
 
 
 @admin.register(TabelaPreco)
-class TabelaPrecoAdmin(admin.ModelAdmin):
+class TabelaPrecoAdmin(AlteracaoPrecosAdminMixin, admin.ModelAdmin):
     list_display = ['metragem', 'tipo_material', 'preco_metro']
     list_editable = ['preco_metro']
     list_filter = ['tipo_material']
@@ -95,7 +134,7 @@ class TabelaPrecoAdmin(admin.ModelAdmin):
 
 
 @admin.register(CoeficienteFator)
-class CoeficienteFatorAdmin(admin.ModelAdmin):
+class CoeficienteFatorAdmin(AlteracaoPrecosAdminMixin, admin.ModelAdmin):
     list_display = ['largura', 'tipo_material', 'codigo_corte', 'coeficiente']
     list_editable = ['coeficiente']
     list_filter = ['tipo_material', 'codigo_corte']
@@ -128,7 +167,7 @@ class ValorGomaAdmin(admin.ModelAdmin):
 
 
 @admin.register(ValorCorte)
-class ValorCorteAdmin(admin.ModelAdmin):
+class ValorCorteAdmin(AlteracaoPrecosAdminMixin, admin.ModelAdmin):
     list_display = ['largura', 'canvas', 'cetim']
     list_editable = ['canvas', 'cetim']
     ordering = ['largura']
@@ -142,7 +181,7 @@ class ValorCorteAdmin(admin.ModelAdmin):
 
 
 @admin.register(Configuracao)
-class ConfiguracaoAdmin(admin.ModelAdmin):
+class ConfiguracaoAdmin(AlteracaoPrecosAdminMixin, admin.ModelAdmin):
     list_display = ['chave', 'valor', 'descricao', 'tipo_dado']
     list_editable = ['valor']
     search_fields = ['chave', 'descricao']
@@ -160,6 +199,24 @@ class ConfiguracaoAdmin(admin.ModelAdmin):
         return False
 
 
+@admin.register(AlteracaoPreco)
+class AlteracaoPrecoAdmin(admin.ModelAdmin):
+    list_display = ['versao', 'criado_em', 'operacao', 'modelo', 'objeto_id', 'usuario', 'descricao']
+    list_filter = ['operacao', 'modelo']
+    search_fields = ['descricao', 'usuario__username']
+    readonly_fields = [campo.name for campo in AlteracaoPreco._meta.fields]
+
+    # Registro somente de inclusão
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
 class CorOrcamentoInline(admin.TabularInline):
     """Inline para adicionar cores ao orçamento"""
     model = CorOrcamento
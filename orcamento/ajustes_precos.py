@@ -0,0 +1,301 @@
+"""
+Ajustes em massa das tabelas de preço (TabelaPreco, CoeficienteFator e
+PrecoAcabamento), feitos no banco com instruções únicas.
+
+Um ajuste é uma transformação do valor (percentual, acréscimo e
+arredondamento a um passo, nesta ordem, e por fim às casas decimais do
+campo) aplicada às linhas que passam pelo filtro (material/acabamento, corte,
+faixa de metragem ou largura):
+
+- ajustar(): um UPDATE com a expressão sobre a própria coluna;
+- copiar(): para outro material/acabamento, um UPDATE das chaves que o
+  destino já tem (subconsulta na origem) e um INSERT ... SELECT das demais.
+
+previsao() monta o antes/depois com a mesma expressão SQL, então o que se vê
+é o que será gravado. Cada aplicação gera uma versão dos preços e um registro
+em massa (versao_precos.py), que desfazer() reverte.
+"""
+from decimal import Decimal
+
+from django.apps import apps
+from django.core.exceptions import ValidationError
+from django.core.validators import MinValueValidator
+from django.db import IntegrityError, connection, transaction
+from django.db.models import DecimalField, Exists, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Round
+
+from .models import CoeficienteFator, PrecoAcabamento, TabelaPreco
+from .versao_precos import alteracao_precos, dados_objeto, registrar_em_massa
+
+# Linhas exibidas na pré-visualização
+LIMITE_PREVISAO = 500
+
+
+class TabelaAjustavel:
+    """Uma tabela de preço e como filtrar e copiar suas linhas"""
+
+    def __init__(self, modelo, campo_valor, campo_grupo, campo_faixa, campo_corte=None):
+        self.modelo = modelo
+        self.campo_valor = campo_valor
+        # Material ou acabamento: filtro e origem/destino da cópia
+        self.campo_grupo = campo_grupo
+        self.campo_faixa = campo_faixa
+        self.campo_corte = campo_corte
+        # Chave única sem o grupo (unique_together do modelo)
+        self.chave = [campo for campo in (campo_faixa, campo_corte) if campo]
+        self.campos = [campo.attname for campo in modelo._meta.concrete_fields]
+
+    @property
+    def campo(self):
+        return self.modelo._meta.get_field(self.campo_valor)
+
+    def filtrar(self, grupos=None, cortes=None, faixa_min=None, faixa_max=None):
+        queryset = self.modelo.objects.order_by()
+        if grupos:
+            queryset = queryset.filter(**{f'{self.campo_grupo}__in': grupos})
+        if cortes and self.campo_corte:
+            queryset = queryset.filter(**{f'{self.campo_corte}__in': cortes})
+        if faixa_min is not None:
+            queryset = queryset.filter(**{f'{self.campo_faixa}__gte': faixa_min})
+        if faixa_max is not None:
+            queryset = queryset.filter(**{f'{self.campo_faixa}__lte': faixa_max})
+        return queryset
+
+    def expressao(self, percentual=None, acrescimo=None, passo=None):
+        """Novo valor em SQL, a partir da coluna"""
+        campo = self.campo
+        saida = DecimalField(max_digits=campo.max_digits, decimal_places=campo.decimal_places)
+        numero = DecimalField()
+        valor = F(self.campo_valor)
+        if percentual:
+            valor = valor * Value(1 + Decimal(percentual) / 100, output_field=numero)
+        if acrescimo:
+            valor = valor + Value(Decimal(acrescimo), output_field=numero)
+        if passo:
+            passo = Value(Decimal(passo), output_field=numero)
+            valor = Round(valor / passo, output_field=numero) * passo
+        return Round(valor, campo.decimal_places, output_field=saida)
+
+    def limites(self):
+        """(mínimo do validador, máximo representável) do campo"""
+        campo = self.campo
+        minimo = max((v.limit_value for v in campo.validators if isinstance(v, MinValueValidator)),
+                     default=None)
+        maximo = Decimal(10) ** (campo.max_digits - campo.decimal_places)
+        return minimo, maximo
+
+
+TABELAS = {
+    'tabela_precos': TabelaAjustavel(TabelaPreco, 'preco_metro', 'tipo_material_id', 'metragem'),
+    'coeficientes': TabelaAjustavel(CoeficienteFator, 'coeficiente', 'tipo_material_id', 'largura',
+                                    campo_corte='codigo_corte_id'),
+    'acabamentos': TabelaAjustavel(PrecoAcabamento, 'preco', 'acabamento_id', 'largura_mm'),
+}
+
+
+class Ajuste:
+    """Parâmetros de um ajuste: tabela, filtro, transformação e destino (cópia)"""
+
+    def __init__(self, tabela, grupos=None, cortes=None, faixa_min=None, faixa_max=None,
+                 percentual=None, acrescimo=None, passo=None, destino=None):
+        self.tabela = TABELAS[tabela]
+        self.filtro = {'grupos': grupos, 'cortes': cortes, 'faixa_min': faixa_min, 'faixa_max': faixa_max}
+        self.transformacao = {'percentual': percentual, 'acrescimo': acrescimo, 'passo': passo}
+        self.destino = destino
+
+    @property
+    def copia(self):
+        return self.destino is not None
+
+    def origem(self):
+        return self.tabela.filtrar(**self.filtro)
+
+    def expressao(self):
+        return self.tabela.expressao(**self.transformacao)
+
+    def _destino(self):
+        return self.tabela.modelo.objects.order_by().filter(**{self.tabela.campo_grupo: self.destino})
+
+    def _correspondente_origem(self):
+        """Linha da origem com a mesma chave da linha externa do destino"""
+        return self.origem().filter(**{campo: OuterRef(campo) for campo in self.tabela.chave})
+
+    def _correspondente_destino(self):
+        return self._destino().filter(**{campo: OuterRef(campo) for campo in self.tabela.chave})
+
+    def afetadas(self):
+        """Linhas que o ajuste altera (na cópia, as que o destino já tem)"""
+        if self.copia:
+            return self._destino().filter(Exists(self._correspondente_origem()))
+        return self.origem()
+
+    def descricao(self):
+        partes = [f'{nome}={valor}' for nome, valor in self.transformacao.items() if valor]
+        filtros = [f'{nome}={valor}' for nome, valor in self.filtro.items() if valor not in (None, [], ())]
+        acao = f'Cópia para #{self.destino}' if self.copia else 'Ajuste'
+        return f'{acao} em {self.tabela.modelo.__name__} ({", ".join(partes + filtros) or "sem alteração"})'
+
+
+def _linhas_previsao(ajuste):
+    """[(chave, grupo, atual, novo)] com a mesma expressão do UPDATE/INSERT"""
+    tabela = ajuste.tabela
+    if not ajuste.copia:
+        return ajuste.origem().annotate(novo=ajuste.expressao()).values_list(
+            *tabela.chave, tabela.campo_grupo, tabela.campo_valor, 'novo'
+        ).order_by(tabela.campo_grupo, *tabela.chave)
+    atual = Subquery(ajuste._correspondente_destino().values(tabela.campo_valor)[:1])
+    return ajuste.origem().annotate(
+        destino_grupo=Value(ajuste.destino, output_field=IntegerField()),
+        atual=atual, novo=ajuste.expressao(),
+    ).values_list(*tabela.chave, 'destino_grupo', 'atual', 'novo').order_by(*tabela.chave)
+
+
+def previsao(ajuste, limite=LIMITE_PREVISAO):
+    """
+    {'linhas': [{'chave', 'grupo', 'nome', 'atual', 'novo'}] (até limite), 'total',
+    'alteradas', 'criadas', 'erros'} sem gravar nada
+    """
+    tabela = ajuste.tabela
+    linhas = []
+    total = alteradas = criadas = 0
+    minimo, maximo = tabela.limites()
+    # Expressões não passam pelo quantize do campo em todos os bancos
+    casas = Decimal(10) ** -tabela.campo.decimal_places
+    erros = []
+    for *chave, grupo, atual, novo in _linhas_previsao(ajuste).iterator():
+        total += 1
+        novo = novo.quantize(casas)
+        atual = atual if atual is None else Decimal(atual).quantize(casas)
+        if atual is None:
+            criadas += 1
+        elif novo != atual:
+            alteradas += 1
+        if minimo is not None and novo < minimo and len(erros) < 10:
+            erros.append(f'{chave}: {novo} fica abaixo do mínimo {minimo}.')
+        if abs(novo) >= maximo and len(erros) < 10:
+            erros.append(f'{chave}: {novo} excede o máximo do campo.')
+        if len(linhas) < limite:
+            linhas.append({'chave': chave, 'grupo': grupo, 'atual': atual, 'novo': novo})
+    relacionado = tabela.modelo._meta.get_field(tabela.campo_grupo).related_model
+    nomes = dict(relacionado.objects.filter(pk__in={linha['grupo'] for linha in linhas}).values_list('pk', 'nome'))
+    for linha in linhas:
+        linha['nome'] = nomes.get(linha['grupo'])
+    return {'linhas': linhas, 'total': total, 'alteradas': alteradas, 'criadas': criadas, 'erros': erros}
+
+
+def _validar(ajuste):
+    if ajuste.copia and ajuste.destino in (ajuste.filtro['grupos'] or []):
+        raise ValidationError('O destino da cópia não pode estar entre as origens.')
+    if ajuste.copia and len(ajuste.filtro['grupos'] or []) != 1:
+        raise ValidationError('Na cópia, selecione exatamente uma origem.')
+    tabela = ajuste.tabela
+    minimo, maximo = tabela.limites()
+    novos = ajuste.origem().annotate(novo=ajuste.expressao())
+    invalidos = novos.filter(novo__gte=maximo) | novos.filter(novo__lte=-maximo)
+    if minimo is not None:
+        invalidos = invalidos | novos.filter(novo__lt=minimo)
+    if invalidos.exists():
+        raise ValidationError('O ajuste deixaria valores fora dos limites do campo; veja a pré-visualização.')
+
+
+def aplicar(ajuste, descricao=''):
+    """
+    Grava o ajuste (UPDATE, ou UPDATE + INSERT ... SELECT na cópia) em uma
+    transação. Retorna {'alteradas', 'criadas', 'alteracao'}
+    """
+    _validar(ajuste)
+    tabela = ajuste.tabela
+    modelo = tabela.modelo
+    descricao = descricao or ajuste.descricao()
+    with alteracao_precos(descricao=descricao), transaction.atomic():
+        afetadas = ajuste.afetadas()
+        antes = list(afetadas.values(*tabela.campos))
+        if ajuste.copia:
+            origem = ajuste._correspondente_origem().annotate(novo=ajuste.expressao())
+            alteradas = afetadas.update(**{tabela.campo_valor: Subquery(origem.values('novo')[:1])})
+            criadas = _inserir_copia(ajuste)
+        else:
+            alteradas = afetadas.update(**{tabela.campo_valor: ajuste.expressao()})
+            criadas = 0
+        if not alteradas and not criadas:
+            return {'alteradas': 0, 'criadas': 0, 'alteracao': None}
+        depois = list(ajuste.afetadas().values(*tabela.campos))
+        alteracao = registrar_em_massa(modelo, antes=antes, depois=depois, descricao=descricao)
+    return {'alteradas': alteradas, 'criadas': criadas, 'alteracao': alteracao}
+
+
+def _inserir_copia(ajuste):
+    """INSERT ... SELECT das chaves da origem que o destino ainda não tem"""
+    tabela = ajuste.tabela
+    meta = tabela.modelo._meta
+    faltantes = ajuste.origem().filter(~Exists(ajuste._correspondente_destino())).annotate(
+        destino_grupo=Value(ajuste.destino, output_field=IntegerField()),
+        novo=ajuste.expressao(),
+    ).values_list(*tabela.chave, 'destino_grupo', 'novo')
+    sql, params = faltantes.query.sql_with_params()
+    # values_list põe os campos do modelo antes das anotações, na ordem pedida
+    colunas = [meta.get_field(campo).column for campo in tabela.chave]
+    colunas += [meta.get_field(tabela.campo_grupo).column, meta.get_field(tabela.campo_valor).column]
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {quote(meta.db_table)} ({", ".join(map(quote, colunas))}) {sql}', params
+        )
+        return cursor.rowcount
+
+
+def _lista(dados):
+    if dados is None:
+        return []
+    return dados if isinstance(dados, list) else [dados]
+
+
+def _normalizar(modelo, dados):
+    """Valores do JSON do registro convertidos pelos campos do modelo"""
+    return {nome: modelo._meta.get_field(nome).to_python(valor) for nome, valor in dados.items()}
+
+
+def desfazer(alteracao):
+    """
+    Reverte um registro de AlteracaoPreco: restaura os valores de antes,
+    exclui as linhas criadas e recria as excluídas. Recusa (ValidationError)
+    se alguma linha mudou depois do registro.
+    """
+    modelo = apps.get_model('orcamento', alteracao.modelo)
+    antes = {dados['id']: _normalizar(modelo, dados) for dados in _lista(alteracao.dados.get('antes'))}
+    depois = {dados['id']: _normalizar(modelo, dados) for dados in _lista(alteracao.dados.get('depois'))}
+    if not antes and not depois:
+        raise ValidationError('Este registro não tem valores para desfazer.')
+    campos = [campo.attname for campo in modelo._meta.concrete_fields]
+
+    descricao = f'Desfaz a versão {alteracao.versao} (registro {alteracao.pk})'
+    with alteracao_precos(descricao=descricao), transaction.atomic():
+        atuais = {
+            dados['id']: dados for dados in
+            modelo.objects.select_for_update().filter(pk__in=set(antes) | set(depois)).values(*campos)
+        }
+        for pk in set(antes) | set(depois):
+            if atuais.get(pk) != depois.get(pk):
+                raise ValidationError(
+                    'Os valores mudaram depois desta alteração; desfaça primeiro as alterações mais recentes.')
+
+        restaurar = [modelo(**dados) for pk, dados in antes.items() if pk in depois]
+        recriar = [modelo(**dados) for pk, dados in antes.items() if pk not in depois]
+        excluir = [pk for pk in depois if pk not in antes]
+        if restaurar:
+            modelo.objects.bulk_update(restaurar, [campo for campo in campos if campo != 'id'])
+        try:
+            if recriar:
+                modelo.objects.bulk_create(recriar)
+        except IntegrityError:
+            raise ValidationError('Já existe outra linha com a mesma chave de uma linha a recriar.')
+        if excluir:
+            # delete() dispara os signals, que registram cada exclusão nesta versão
+            modelo.objects.filter(pk__in=excluir).delete()
+        if restaurar or recriar:
+            registrar_em_massa(
+                modelo, antes=[atuais[obj.pk] for obj in restaurar],
+                depois=[dados_objeto(obj) for obj in restaurar + recriar],
+                descricao=descricao,
+            )
+    return {'restauradas': len(restaurar), 'recriadas': len(recriar), 'excluidas': len(excluir)}
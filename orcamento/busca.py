@@ -0,0 +1,16 @@
+"""
+Normalização de texto para busca (sem acentos, minúsculas, espaços simples).
+
+Orcamento.cliente_busca guarda o nome do cliente normalizado; a listagem
+busca nele com "contains", o que no PostgreSQL usa o índice trigram (pg_trgm)
+criado na migração 0015 e, de quebra, ignora acentos ("joao" acha "João").
+"""
+import unicodedata
+
+
+def normalizar_busca(texto):
+    if not texto:
+        return ''
+    decomposto = unicodedata.normalize('NFKD', texto)
+    sem_acentos = ''.join(c for c in decomposto if not unicodedata.combining(c))
+    return ' '.join(sem_acentos.lower().split())
@@ -1,6 +1,21 @@
 from decimal import Decimal
 from typing import Dict
-from .models import TabelaPreco, CoeficienteFator, PrecoAcabamento, Configuracao, ValorCorte, Fita
+from .snapshot_precos import obter_snapshot
+
+# Fator de preço por tipo de cliente (U15/U16 da planilha)
+FATORES_TIPO_CLIENTE = {
+    'industria_novo': Decimal('1.0'),
+    'industria_antigo': Decimal('0.95'),
+    'comercio_novo': Decimal('1.1'),
+    'comercio_antigo': Decimal('1.05'),
+}
+
+# Nível do rastro (debug_info) montado pela calculadora: gravação e
+# recálculo em massa não usam o rastro e não devem pagar pela formatação
+RASTRO_NENHUM = 'nenhum'
+RASTRO_RESUMO = 'resumo'
+RASTRO_COMPLETO = 'completo'
+NIVEIS_RASTRO = (RASTRO_NENHUM, RASTRO_RESUMO, RASTRO_COMPLETO)
 
 
 class CalculadoraOrcamento:
@@ -9,16 +24,23 @@ class CalculadoraOrcamento:
     baseado na lógica da planilha Excel original
     """
 
-    def __init__(self, orcamento):
+    def __init__(self, orcamento, snapshot=None, total_unidades_cores=None, rastro=RASTRO_NENHUM):
+        if rastro not in NIVEIS_RASTRO:
+            raise ValueError(f'Nível de rastro inválido: {rastro}')
         self.orcamento = orcamento
-        self.configs = self._carregar_configuracoes()
-
-    def _carregar_configuracoes(self) -> Dict:
-        """Carrega todas as configurações do sistema"""
-        configs = {}
-        for config in Configuracao.objects.all():
-            configs[config.chave] = config.get_valor()
-        return configs
+        self.rastro = rastro
+        # Tabelas de consulta em memória (nenhuma query durante o cálculo)
+        self.snapshot = snapshot or obter_snapshot()
+        self.configs = self.snapshot.configs
+        # Soma das cores já conhecida (ex: orçamento temporário da pré-visualização)
+        self.total_unidades_cores = total_unidades_cores
+
+    def _somar_unidades_cores(self) -> int:
+        """Soma quantidade + demais de todas as cores do orçamento"""
+        if self.total_unidades_cores is not None:
+            return self.total_unidades_cores
+        # Total desnormalizado no orçamento (0 se ainda não foi salvo)
+        return self.orcamento.total_unidades_cores
 
     def _obter_preco_base(self) -> Decimal:
         """
@@ -28,18 +50,7 @@ class CalculadoraOrcamento:
         # Encontra a faixa de metragem apropriada (menor ou igual)
         metragem_lookup = self.orcamento.tabela_manual_metragem or self.orcamento.quantidade_metros
 
-        preco = TabelaPreco.objects.filter(
-            metragem__lte=metragem_lookup,
-            tipo_material=self.orcamento.tipo_material
-        ).order_by('-metragem').first()
-
-        if not preco:
-            # Se não encontrou, pega o primeiro disponível para esse material
-            preco = TabelaPreco.objects.filter(
-                tipo_material=self.orcamento.tipo_material
-            ).order_by('metragem').first()
-
-        return preco.preco_metro if preco else Decimal('0.0')
+        return self.snapshot.preco_base(self.orcamento.tipo_material_id, metragem_lookup)
 
     def _obter_coeficiente_fator(self) -> Decimal:
         """
@@ -47,70 +58,44 @@ class CalculadoraOrcamento:
         Equivalente ao VLOOKUP na tabela_fator da planilha
         """
         # Calcula o código baseado no comprimento do nome do corte (lógica da planilha)
-        codigo_calc = len(self.orcamento.tipo_corte.nome)
+        codigo_calc = len(self.snapshot.nome_corte(self.orcamento.tipo_corte_id))
 
-        coef = CoeficienteFator.objects.filter(
-            largura=self.orcamento.largura_mm,
-            tipo_material=self.orcamento.tipo_material,
-            codigo_corte__codigo_calc=codigo_calc
-        ).first()
-
-        if not coef:
-            # Tenta com a largura mais próxima menor ou igual
-            coef = CoeficienteFator.objects.filter(
-                largura__lte=self.orcamento.largura_mm,
-                tipo_material=self.orcamento.tipo_material,
-                codigo_corte__codigo_calc=codigo_calc
-            ).order_by('-largura').first()
-
-        # Default da planilha
-        return coef.coeficiente if coef else Decimal('0.75')
+        # Largura exata ou a mais próxima menor; default da planilha 0.75
+        return self.snapshot.coeficiente_fator(
+            self.orcamento.tipo_material_id, codigo_calc, self.orcamento.largura_mm
+        )
 
     def _obter_valor_goma(self):
         """
         Obtém o valor do acabamento (antiga goma) baseado na largura e acabamento
         Retorna (valor, largura_encontrada)
         """
-        if not self.orcamento.acabamento:
-            return Decimal('0.0'), 0
-
-        # Busca a menor largura que seja maior ou igual à largura do orçamento (Até X mm)
-        preco_obj = PrecoAcabamento.objects.filter(
-            largura_mm__gte=self.orcamento.largura_mm,
-            acabamento=self.orcamento.acabamento
-        ).order_by('largura_mm').first()
-
-        if not preco_obj:
-            # Se não encontrou maior, tenta pegar a maior disponível (fallback)
-            preco_obj = PrecoAcabamento.objects.filter(
-                acabamento=self.orcamento.acabamento
-            ).order_by('-largura_mm').first()
-
-        if not preco_obj:
+        if not self.orcamento.acabamento_id:
             return Decimal('0.0'), 0
 
-        return preco_obj.preco, preco_obj.largura_mm
+        # Menor largura que seja maior ou igual à largura do orçamento (Até X mm),
+        # com fallback para a maior disponível
+        return self.snapshot.valor_acabamento(self.orcamento.acabamento_id, self.orcamento.largura_mm)
 
     def _obter_valor_corte_especial(self) -> Decimal:
         """
         Obtém valor de corte especial (canvas, cetim)
         """
-        tipo_material_nome = self.orcamento.tipo_material.nome.lower()
+        tipo_material_nome = self.snapshot.material(self.orcamento.tipo_material_id)[0].lower()
 
         if 'canvas' not in tipo_material_nome and 'cetim' not in tipo_material_nome:
             return Decimal('0.0')
 
-        valor_corte = ValorCorte.objects.filter(
-            largura__lte=self.orcamento.largura_mm
-        ).order_by('-largura').first()
+        valor_corte = self.snapshot.valor_corte(self.orcamento.largura_mm)
 
         if not valor_corte:
             return Decimal('0.0')
 
+        canvas, cetim = valor_corte
         if 'canvas' in tipo_material_nome:
-            return valor_corte.canvas
+            return canvas
         elif 'cetim' in tipo_material_nome:
-            return valor_corte.cetim
+            return cetim
 
         return Decimal('0.0')
 
@@ -121,7 +106,7 @@ class CalculadoraOrcamento:
         """
         largura = self.orcamento.largura_mm
 
-        if self.orcamento.tipo_material.dupla_densidade:
+        if self.snapshot.material(self.orcamento.tipo_material_id)[1]:
             return largura // 2
 
         return largura
@@ -143,21 +128,13 @@ class CalculadoraOrcamento:
         """
         Calcula fator baseado no tipo de cliente
         """
-        fatores = {
-            'industria_novo': Decimal('1.0'),
-            'industria_antigo': Decimal('0.95'),
-            'comercio_novo': Decimal('1.1'),
-            'comercio_antigo': Decimal('1.05'),
-        }
-        return fatores.get(self.orcamento.tipo_cliente, Decimal('1.0'))
+        return FATORES_TIPO_CLIENTE.get(self.orcamento.tipo_cliente, Decimal('1.0'))
 
-    def _calcular_cc_coeficiente_corte(self) -> Decimal:
+    def _calcular_cc_coeficiente_corte(self, largura_real) -> Decimal:
         """
         Calcula o coeficiente CC (Coeficiente por Corte)
         baseado na largura real e quantidade
         """
-        largura_real = self._calcular_largura_real()
-
         # Fórmula da planilha para CC
         # Simplificada baseada no comprimento em relação à largura
         if self.orcamento.comprimento_mm > 0:
@@ -168,19 +145,12 @@ class CalculadoraOrcamento:
 
         return Decimal('1.0')
 
-    def _obter_fator_fita(self) -> Decimal:
+    def _obter_fator_fita(self, largura_real) -> Decimal:
         """
         Obtém o fator de conversão da fita baseado na largura real
         """
-        largura_real = self._calcular_largura_real()
-
-        fita = Fita.objects.filter(largura_mm=largura_real).first()
-        if not fita:
-            # Tenta encontrar o próximo menor
-            fita = Fita.objects.filter(
-                largura_mm__lte=largura_real).order_by('-largura_mm').first()
-
-        return fita.fator if fita else Decimal('0.0')
+        # Largura exata ou a próxima menor
+        return self.snapshot.fator_fita(largura_real)
 
     def _obter_coeficiente_metragem_cm(self) -> Decimal:
         """
@@ -194,8 +164,8 @@ class CalculadoraOrcamento:
         Obtém o fator da batida selecionada no orçamento
         Se não houver batida selecionada, retorna 1.0
         """
-        if self.orcamento.batida:
-            return self.orcamento.batida.fator
+        if self.orcamento.batida_id:
+            return self.snapshot.fator_batida(self.orcamento.batida_id)
         return Decimal('1.0')
 
     def calcular(self) -> Dict[str, Decimal]:
@@ -210,6 +180,10 @@ class CalculadoraOrcamento:
         5. Valor Total = Valor Unidade * Unidades
         6. Valor Metro = Valor Total / Metros
         7. Valor Milheiro = Valor Total / Milheiros
+
+        O debug_info do resultado depende de self.rastro: vazio (nenhum),
+        só os passos que entram no preço (resumo) ou todos, incluindo fita,
+        densidade das cores e batida (completo)
         """
 
         # Dados de entrada
@@ -252,22 +226,6 @@ class CalculadoraOrcamento:
         # Coeficiente fator
         coef_fator = self._obter_coeficiente_fator()
 
-        # Fator Fita (para debug)
-        fator_fita = self._obter_fator_fita()
-
-        # Calcula variável densidade_cores_fita
-        # Fórmula ajustada conforme Excel: =soma_cores * preco_base / fator_fita / comprimento
-
-        # Calcula soma de unidades das cores
-        total_unidades_cores = sum(
-            c.quantidade_unidades + c.quantidade_demais for c in self.orcamento.cores.all())
-
-        densidade_cores_fita = Decimal('0.0')
-        if fator_fita > 0 and comprimento_mm > 0:
-            densidade_cores_fita = (
-                Decimal(total_unidades_cores) * preco_base
-            ) / fator_fita / comprimento_mm
-
         # Valor base POR METRO
         valor_metro_base = preco_base * coef_fator
 
@@ -275,25 +233,13 @@ class CalculadoraOrcamento:
         valor_goma, largura_tabela_goma = self._obter_valor_goma()
         valor_metro_base = valor_metro_base + valor_goma
 
-        # CÁLCULO DA NOVA VARIÁVEL SOLICITADA:
-        # Nome sugerido: Fator Ajuste Densidade
-        # Fórmula: ((Densidade Cores Fita + Valor Acabamento) / Soma Unidades Cores) * Coeficiente Fator
-        fator_ajuste_densidade = Decimal('0.0')
-        if coef_fator > 0:
-            fator_ajuste_densidade = ((densidade_cores_fita + valor_goma) *
-                                      Decimal(comprimento_mm)) / coef_fator
-
-        # NOVO CÁLCULO: Fator Ajuste Densidade Ponderado
-        # Fórmula: Fator Ajuste Densidade × Fator da Batida
-        fator_batida = self._obter_fator_batida()
-        fator_ajuste_densidade_ponderado = fator_ajuste_densidade * fator_batida
-
         # Adicionar corte especial (canvas/cetim)
         valor_corte_especial = self._obter_valor_corte_especial()
         valor_metro_base = valor_metro_base + valor_corte_especial
 
         # CC - Coeficiente de Corte (V41 na planilha)
-        cc = self._calcular_cc_coeficiente_corte()
+        largura_real = self._calcular_largura_real()
+        cc = self._calcular_cc_coeficiente_corte(largura_real)
 
         # Percentual ultrassônico (SE(S25="sim";perc_ultrassonico;1))
         perc_ultrassonico = self._obter_percentual_ultrassonico()
@@ -340,54 +286,19 @@ class CalculadoraOrcamento:
         valor_total = valor_total.quantize(Decimal('0.01'))
         unidades = unidades.quantize(Decimal('0.01'))
 
-        # Estrutura de Debug
-
-        # Calcula soma de unidades das cores
-        total_unidades_cores = sum(
-            c.quantidade_unidades + c.quantidade_demais for c in self.orcamento.cores.all())
-
-        debug_info = {
-            'passos': [
-                {'label': 'Metragem', 'valor': f"{metros} m"},
-                {'label': 'Largura', 'valor': f"{largura_mm} mm"},
-                {'label': 'Largura Real',
-                    'valor': f"{self._calcular_largura_real()} mm"},
-                {'label': 'Comprimento', 'valor': f"{comprimento_mm} mm"},
-                {'label': 'Soma Unidades (Cores)',
-                 'valor': f"{total_unidades_cores} un"},
-                {'label': 'Unidades (Calculado)', 'valor': f"{unidades} un"},
-                {'label': 'Preço Base (Tabela)',
-                 'valor': f"R$ {preco_base:.5f}"},
-                {'label': 'Coeficiente Fator', 'valor': f"{coef_fator:.5f}"},
-                {'label': 'Fator Fita', 'valor': f"{fator_fita}"},
-                {'label': 'Densidade Cores Fita',
-                    'valor': f"{densidade_cores_fita:.9f}"},
-                {'label': 'Valor Base (Metro)',
-                 'valor': f"R$ {preco_base * coef_fator:.5f}"},
-                {'label': 'Acabamento',
-                    'valor': f"{self.orcamento.acabamento.nome} - R$ {valor_goma:.5f} (Tab. {largura_tabela_goma}mm)" if self.orcamento.acabamento else "Nenhum"},
-                {'label': 'densidade_cores_fita',
-                    'valor': f"R$ {densidade_cores_fita:.5f}"},
-                {'label': 'Valor Goma',
-                    'valor': f"{valor_goma}"},
-                {'label': 'Fator Ajuste Densidade',
-                    'valor': f"{fator_ajuste_densidade:.9f}"},
-                {'label': 'Fator Batida (Tabela)',
-                    'valor': f"{fator_batida}"},
-                {'label': 'Fator Ajuste Densidade Ponderado',
-                    'valor': f"{fator_ajuste_densidade_ponderado:.9f}"},
-                {'label': 'Valor Corte Especial',
-                    'valor': f"R$ {valor_corte_especial:.5f}"},
-                {'label': 'Fator Largura 60', 'valor': f"{fator_largura_60}"},
-                {'label': 'Fator Cliente', 'valor': f"{fator_cliente}"},
-                {'label': 'Perc. Ultrassônico', 'valor': f"{perc_ultrassonico}"},
-                {'label': 'Coef. Corte (CC)', 'valor': f"{cc:.5f}"},
-                {'label': 'Perc. Aumento Geral', 'valor': f"{perc_aumento_geral}"},
-                {'label': 'Valor Metro Final (Calc)',
-                 'valor': f"R$ {valor_metro_final:.5f}"},
-                {'label': 'Milheiros', 'valor': f"{milheiros}"},
-            ]
-        }
+        if self.rastro == RASTRO_NENHUM:
+            debug_info = {}
+        else:
+            debug_info = {'passos': self._montar_passos(
+                metros=metros, largura_mm=largura_mm, largura_real=largura_real,
+                comprimento_mm=comprimento_mm, unidades=unidades, preco_base=preco_base,
+                coef_fator=coef_fator, valor_goma=valor_goma,
+                largura_tabela_goma=largura_tabela_goma,
+                valor_corte_especial=valor_corte_especial, fator_largura_60=fator_largura_60,
+                fator_cliente=fator_cliente, perc_ultrassonico=perc_ultrassonico, cc=cc,
+                perc_aumento_geral=perc_aumento_geral, valor_metro_final=valor_metro_final,
+                milheiros=milheiros,
+            )}
 
         return {
             'valor_metro': valor_metro,
@@ -403,3 +314,88 @@ class CalculadoraOrcamento:
             'area_m2': area_etiqueta_m2,
             'debug_info': debug_info,
         }
+
+    def _montar_passos(self, metros, largura_mm, largura_real, comprimento_mm, unidades,
+                       preco_base, coef_fator, valor_goma, largura_tabela_goma,
+                       valor_corte_especial, fator_largura_60, fator_cliente,
+                       perc_ultrassonico, cc, perc_aumento_geral, valor_metro_final,
+                       milheiros):
+        """Passos do debug_info; no resumo ficam só os que entram no preço"""
+        if self.rastro == RASTRO_RESUMO:
+            return [
+                {'label': 'Metragem', 'valor': f"{metros} m"},
+                {'label': 'Largura Real', 'valor': f"{largura_real} mm"},
+                {'label': 'Comprimento', 'valor': f"{comprimento_mm} mm"},
+                {'label': 'Unidades (Calculado)', 'valor': f"{unidades} un"},
+                {'label': 'Preço Base (Tabela)', 'valor': f"R$ {preco_base:.5f}"},
+                {'label': 'Coeficiente Fator', 'valor': f"{coef_fator:.5f}"},
+                {'label': 'Valor Goma', 'valor': f"{valor_goma}"},
+                {'label': 'Valor Corte Especial', 'valor': f"R$ {valor_corte_especial:.5f}"},
+                {'label': 'Coef. Corte (CC)', 'valor': f"{cc:.5f}"},
+                {'label': 'Valor Metro Final (Calc)', 'valor': f"R$ {valor_metro_final:.5f}"},
+                {'label': 'Milheiros', 'valor': f"{milheiros}"},
+            ]
+
+        # Valores que só aparecem no debug (não entram no preço)
+        fator_fita = self._obter_fator_fita(largura_real)
+
+        # Calcula variável densidade_cores_fita
+        # Fórmula ajustada conforme Excel: =soma_cores * preco_base / fator_fita / comprimento
+        total_unidades_cores = self._somar_unidades_cores()
+        densidade_cores_fita = Decimal('0.0')
+        if fator_fita > 0 and comprimento_mm > 0:
+            densidade_cores_fita = (
+                Decimal(total_unidades_cores) * preco_base
+            ) / fator_fita / comprimento_mm
+
+        # Fator Ajuste Densidade
+        # Fórmula: ((Densidade Cores Fita + Valor Acabamento) / Soma Unidades Cores) * Coeficiente Fator
+        fator_ajuste_densidade = Decimal('0.0')
+        if coef_fator > 0:
+            fator_ajuste_densidade = ((densidade_cores_fita + valor_goma) *
+                                      Decimal(comprimento_mm)) / coef_fator
+
+        # Fator Ajuste Densidade Ponderado = Fator Ajuste Densidade × Fator da Batida
+        fator_batida = self._obter_fator_batida()
+        fator_ajuste_densidade_ponderado = fator_ajuste_densidade * fator_batida
+
+        return [
+            {'label': 'Metragem', 'valor': f"{metros} m"},
+            {'label': 'Largura', 'valor': f"{largura_mm} mm"},
+            {'label': 'Largura Real',
+                'valor': f"{largura_real} mm"},
+            {'label': 'Comprimento', 'valor': f"{comprimento_mm} mm"},
+            {'label': 'Soma Unidades (Cores)',
+             'valor': f"{total_unidades_cores} un"},
+            {'label': 'Unidades (Calculado)', 'valor': f"{unidades} un"},
+            {'label': 'Preço Base (Tabela)',
+             'valor': f"R$ {preco_base:.5f}"},
+            {'label': 'Coeficiente Fator', 'valor': f"{coef_fator:.5f}"},
+            {'label': 'Fator Fita', 'valor': f"{fator_fita}"},
+            {'label': 'Densidade Cores Fita',
+                'valor': f"{densidade_cores_fita:.9f}"},
+            {'label': 'Valor Base (Metro)',
+             'valor': f"R$ {preco_base * coef_fator:.5f}"},
+            {'label': 'Acabamento',
+                'valor': f"{self.snapshot.acabamentos.get(self.orcamento.acabamento_id)} - R$ {valor_goma:.5f} (Tab. {largura_tabela_goma}mm)" if self.orcamento.acabamento_id else "Nenhum"},
+            {'label': 'densidade_cores_fita',
+                'valor': f"R$ {densidade_cores_fita:.5f}"},
+            {'label': 'Valor Goma',
+                'valor': f"{valor_goma}"},
+            {'label': 'Fator Ajuste Densidade',
+                'valor': f"{fator_ajuste_densidade:.9f}"},
+            {'label': 'Fator Batida (Tabela)',
+                'valor': f"{fator_batida}"},
+            {'label': 'Fator Ajuste Densidade Ponderado',
+                'valor': f"{fator_ajuste_densidade_ponderado:.9f}"},
+            {'label': 'Valor Corte Especial',
+                'valor': f"R$ {valor_corte_especial:.5f}"},
+            {'label': 'Fator Largura 60', 'valor': f"{fator_largura_60}"},
+            {'label': 'Fator Cliente', 'valor': f"{fator_cliente}"},
+            {'label': 'Perc. Ultrassônico', 'valor': f"{perc_ultrassonico}"},
+            {'label': 'Coef. Corte (CC)', 'valor': f"{cc:.5f}"},
+            {'label': 'Perc. Aumento Geral', 'valor': f"{perc_aumento_geral}"},
+            {'label': 'Valor Metro Final (Calc)',
+             'valor': f"R$ {valor_metro_final:.5f}"},
+            {'label': 'Milheiros', 'valor': f"{milheiros}"},
+        ]
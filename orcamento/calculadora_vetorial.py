@@ -0,0 +1,255 @@
+"""
+Calculadora vetorizada (NumPy) para reprecificação em massa e simulações.
+
+Aplica a mesma cadeia de fórmulas da CalculadoraOrcamento a colunas inteiras
+de orçamentos: as consultas de faixa do snapshot viram searchsorted por grupo
+(material, acabamento, ...) e a aritmética é feita em float64, com os mesmos
+arredondamentos no final. O resultado bate com a calculadora Decimal no
+centavo (comando validar_calculo_vetorial), exceto quando o valor cai, dentro
+do erro do float, exatamente na metade da última casa: aí o Decimal decide
+pelas suas 28 casas de precisão e o float não tem como reproduzir. Essas
+linhas voltam marcadas em 'empates' para quem precisar recalculá-las com a
+CalculadoraOrcamento.
+
+Só os valores gravados no orçamento são calculados; o que a calculadora usa
+apenas no debug (fator da fita, densidade das cores, fator da batida) fica de
+fora, por isso a soma das cores não é uma coluna de entrada.
+"""
+from decimal import Decimal
+
+import numpy as np
+
+from .calculadora import FATORES_TIPO_CLIENTE
+from .indice_faixas import PISO, PRIMEIRO, ULTIMO
+from .models import TipoMaterial, TipoCorte
+from .snapshot_precos import obter_snapshot
+
+# Colunas de entrada (campos de precificação do orçamento, FKs como *_id;
+# 0 em acabamento_id e tabela_manual_metragem significa "não informado")
+COLUNAS = [
+    'tipo_material_id', 'tipo_corte_id', 'acabamento_id', 'largura_mm', 'comprimento_mm',
+    'quantidade_metros', 'quantidade_unidades', 'tabela_manual_metragem',
+    'tem_ultrassonico', 'tipo_cliente',
+]
+
+# Casas decimais do quantize de cada resultado na CalculadoraOrcamento
+CASAS = {
+    'unidades': 2,
+    'milheiros': 2,
+    'valor_unidade': 5,
+    'valor_total': 2,
+    'valor_metro': 5,
+    'valor_milheiro': 2,
+}
+
+# Distância relativa da metade da última casa dentro da qual o valor em float
+# é tratado como empate (o erro acumulado das contas fica abaixo de 1e-14)
+TOLERANCIA_EMPATE = 1e-13
+
+# Corte especial por material
+SEM_CORTE, CANVAS, CETIM = 0, 1, 2
+
+
+def quantizar(valores, casas):
+    """
+    Arredonda como Decimal.quantize (meia para par) na casa informada.
+    Retorna (valores arredondados, máscara das linhas em empate)
+    """
+    escala = 10.0 ** casas
+    x = valores * escala
+    base = np.floor(x)
+    empate = np.abs(x - base - 0.5) <= TOLERANCIA_EMPATE * np.maximum(1.0, np.abs(x))
+    return np.where(empate, base + np.mod(base, 2), np.rint(x)) / escala, empate
+
+
+def _mapear(ids, mapa, excecao, descricao):
+    """mapa[id] para cada linha, consultando cada id distinto uma vez"""
+    distintos, inverso = np.unique(ids, return_inverse=True)
+    valores = []
+    for pk in distintos.tolist():
+        if pk not in mapa:
+            raise excecao(f'{descricao} {pk} não encontrado')
+        valores.append(mapa[pk])
+    return np.array(valores)[inverso.reshape(-1)] if valores else np.zeros(0)
+
+
+def _consultar(indice, x, padrao, extrair=float):
+    """Versão vetorizada de IndiceFaixas.valor (modo e fallback do índice)"""
+    resultado = np.full(len(x), padrao, dtype=float)
+    if indice is None or not len(indice):
+        return resultado
+
+    chaves = np.asarray(indice.chaves)
+    if indice.modo == PISO:
+        pos = np.searchsorted(chaves, x, side='right') - 1
+        encontrado = pos >= 0
+    else:
+        pos = np.searchsorted(chaves, x, side='left')
+        encontrado = pos < len(chaves)
+
+    if indice.fallback == PRIMEIRO:
+        pos = np.where(encontrado, pos, 0)
+        encontrado[:] = True
+    elif indice.fallback == ULTIMO:
+        pos = np.where(encontrado, pos, len(chaves) - 1)
+        encontrado[:] = True
+
+    valores = np.array([extrair(valor) for valor in indice.valores], dtype=float)
+    resultado[encontrado] = valores[pos[encontrado]]
+    return resultado
+
+
+def _consultar_por_grupo(grupos, x, indices, padrao):
+    """Consulta cada linha no índice do seu grupo (ex: material ou (material, código))"""
+    resultado = np.full(len(x), padrao, dtype=float)
+    if not len(x):
+        return resultado
+    distintos, inverso = np.unique(grupos, axis=0, return_inverse=True)
+    inverso = inverso.reshape(-1)
+    for i, grupo in enumerate(distintos.tolist()):
+        indice = indices.get(tuple(grupo) if isinstance(grupo, list) else grupo)
+        if indice is None:
+            continue
+        linhas = inverso == i
+        resultado[linhas] = _consultar(indice, x[linhas], padrao)
+    return resultado
+
+
+class CalculadoraVetorial:
+    """
+    Precifica colunas de orçamentos de uma vez com um snapshot de preços.
+    Uso:
+        colunas = carregar_colunas(Orcamento.objects.filter(...))
+        valores = CalculadoraVetorial().calcular(colunas)
+        valores['valor_total']  # array com um valor por orçamento
+    """
+
+    def __init__(self, snapshot=None):
+        self.snapshot = snapshot or obter_snapshot()
+        configs = self.snapshot.configs
+        self.perc_ultrassonico = float(Decimal(str(configs.get('perc_ultrassonico', Decimal('1.15')))))
+        self.perc_aumento_geral = float(Decimal(str(configs.get('perc_aumento_geral', Decimal('1.0')))))
+
+        self.dupla_densidade = {}
+        self.corte_especial = {}
+        for pk, (nome, dupla_densidade) in self.snapshot.materiais.items():
+            nome = nome.lower()
+            self.dupla_densidade[pk] = dupla_densidade
+            self.corte_especial[pk] = (
+                CANVAS if 'canvas' in nome else CETIM if 'cetim' in nome else SEM_CORTE
+            )
+        # Código do corte calculado como na planilha (tamanho do nome)
+        self.codigo_calc = {pk: len(nome) for pk, nome in self.snapshot.cortes.items()}
+
+    def calcular(self, colunas):
+        """
+        Recebe um dict de arrays com as COLUNAS (colunas extras são ignoradas)
+        e retorna um dict de arrays com os mesmos valores de
+        CalculadoraOrcamento.calcular: unidades, milheiros, valor_unidade,
+        valor_total, valor_metro, valor_milheiro (arredondados), preco_base,
+        coef_fator, valor_goma e cc, mais 'empates': máscara das linhas em que
+        algum arredondamento caiu na metade da casa (ver docstring do módulo)
+        """
+        snapshot = self.snapshot
+        material = np.asarray(colunas['tipo_material_id'], dtype=np.int64)
+        corte = np.asarray(colunas['tipo_corte_id'], dtype=np.int64)
+        acabamento = np.asarray(colunas['acabamento_id'], dtype=np.int64)
+        largura = np.asarray(colunas['largura_mm'], dtype=np.int64)
+        comprimento = np.asarray(colunas['comprimento_mm'], dtype=np.int64)
+        metros = np.asarray(colunas['quantidade_metros'], dtype=np.int64)
+        unidades_digitadas = np.asarray(colunas['quantidade_unidades'], dtype=np.int64)
+        metragem_manual = np.asarray(colunas['tabela_manual_metragem'], dtype=np.int64)
+        ultrassonico = np.asarray(colunas['tem_ultrassonico'], dtype=bool)
+        tipo_cliente = np.asarray(colunas['tipo_cliente'], dtype=str)
+
+        dupla_densidade = _mapear(
+            material, self.dupla_densidade, TipoMaterial.DoesNotExist, 'Material').astype(bool)
+        corte_especial = _mapear(material, self.corte_especial, TipoMaterial.DoesNotExist, 'Material')
+        codigo_calc = _mapear(
+            corte, self.codigo_calc, TipoCorte.DoesNotExist, 'Tipo de corte').astype(np.int64)
+        fator_cliente = np.ones(len(material))
+        for tipo, fator in FATORES_TIPO_CLIENTE.items():
+            fator_cliente[tipo_cliente == tipo] = float(fator)
+
+        com_comprimento = comprimento > 0
+        comprimento_seguro = np.where(com_comprimento, comprimento, 1)
+
+        # Unidades e milheiros (ARREDONDAR.PARA.BAIXO em inteiros, sem erro de float)
+        unidades = np.where(
+            com_comprimento, metros * 1000.0 / comprimento_seguro, unidades_digitadas.astype(float)
+        )
+        centesimos_milheiro = np.where(
+            com_comprimento, (metros * 100) // comprimento_seguro, unidades_digitadas // 10
+        )
+        milheiros = np.where(centesimos_milheiro == 0, 1, centesimos_milheiro) / 100.0
+
+        # Consultas de faixa
+        metragem = np.where(metragem_manual != 0, metragem_manual, metros)
+        preco_base = _consultar_por_grupo(material, metragem, snapshot.precos, 0.0)
+        coef_fator = _consultar_por_grupo(
+            np.column_stack([material, codigo_calc]), largura, snapshot.coeficientes, 0.75
+        )
+        valor_goma = _consultar_por_grupo(acabamento, largura, snapshot.precos_acabamento, 0.0)
+        canvas = _consultar(snapshot.valores_corte, largura, 0.0, extrair=lambda v: v[0])
+        cetim = _consultar(snapshot.valores_corte, largura, 0.0, extrair=lambda v: v[1])
+        valor_corte = np.select([corte_especial == CANVAS, corte_especial == CETIM], [canvas, cetim], 0.0)
+
+        # Fatores
+        largura_real = np.where(dupla_densidade, largura // 2, largura)
+        cc = np.where(
+            com_comprimento, np.maximum(largura_real / comprimento_seguro * 1.2, 0.5), 1.0
+        )
+        fator_largura_60 = np.where(largura == 60, 1.49, 1.0)
+        perc_ultrassonico = np.where(ultrassonico, self.perc_ultrassonico, 1.0)
+
+        valor_metro_base = preco_base * coef_fator + valor_goma + valor_corte
+        valor_metro_final = (
+            fator_largura_60 * valor_metro_base * fator_cliente * perc_ultrassonico
+            * cc * self.perc_aumento_geral
+        )
+        valor_unidade = valor_metro_final * (comprimento / 1000.0)
+        valor_total = valor_unidade * unidades
+        valor_metro = np.where(metros > 0, valor_total / np.where(metros > 0, metros, 1), 0.0)
+        valor_milheiro = valor_total / milheiros
+
+        resultado = {
+            'unidades': unidades,
+            'milheiros': milheiros,
+            'valor_unidade': valor_unidade,
+            'valor_total': valor_total,
+            'valor_metro': valor_metro,
+            'valor_milheiro': valor_milheiro,
+        }
+        empates = np.zeros(len(material), dtype=bool)
+        for chave, valor in resultado.items():
+            resultado[chave], empate = quantizar(valor, CASAS[chave])
+            empates |= empate
+        resultado.update(
+            preco_base=preco_base, coef_fator=coef_fator, valor_goma=valor_goma, cc=cc, empates=empates)
+        return resultado
+
+
+def carregar_colunas(queryset, extras=()):
+    """
+    Lê as COLUNAS (mais pk e os campos extras) do queryset em ordem de pk,
+    em blocos, direto para arrays. Retorna um dict nome -> array
+    """
+    campos = ['pk', *COLUNAS, *extras]
+    listas = [[] for _ in campos]
+    for linha in queryset.order_by('pk').values_list(*campos).iterator(chunk_size=5000):
+        for lista, valor in zip(listas, linha):
+            lista.append(valor)
+
+    colunas = {}
+    for campo, valores in zip(campos, listas):
+        if campo == 'tipo_cliente':
+            colunas[campo] = np.array(valores, dtype=str)
+        elif campo in ('acabamento_id', 'tabela_manual_metragem'):
+            colunas[campo] = np.array([valor or 0 for valor in valores], dtype=np.int64)
+        elif campo == 'tem_ultrassonico':
+            colunas[campo] = np.array(valores, dtype=bool)
+        elif valores and isinstance(valores[0], Decimal):
+            colunas[campo] = np.array(valores, dtype=float)
+        else:
+            colunas[campo] = np.array(valores)
+    return colunas
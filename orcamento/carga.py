@@ -0,0 +1,337 @@
+"""
+Teste de carga dos fluxos de orçamento por HTTP.
+
+Roda contra um servidor já no ar (runserver, gunicorn...) que use o mesmo
+banco deste processo: materiais, cortes e os orçamentos de cada usuário são
+lidos daqui antes de começar. Cada usuário virtual é uma thread com sessão
+própria (cookies e CSRF), logada como um vendedor ou o gestor da massa
+(massa_dados.usuarios_carga), que repete uma mistura ponderada das ações de
+FLUXOS até acabar o tempo. Redirecionamentos não são seguidos, então cada
+requisição é medida sozinha.
+
+Com CONTAR_CONSULTAS = True no servidor, o cabeçalho X-Consultas
+(ContagemConsultasMiddleware) dá as consultas SQL de cada requisição.
+Os orçamentos criados levam o prefixo da massa e saem com remover_massa().
+"""
+import http.cookiejar
+import json
+import math
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter, defaultdict
+
+from django.urls import reverse
+
+from .massa_dados import NOMES, PREFIXO_MASSA
+from .models import Orcamento, TipoCorte, TipoMaterial
+
+# Ação -> peso na mistura de tráfego
+FLUXOS = {
+    'listar': 30,
+    'detalhar': 20,
+    'calcular': 25,
+    'criar': 8,
+    'editar': 7,
+    'status': 5,
+    'dashboard': 5,
+}
+
+LARGURAS = [10, 12, 15, 20, 25, 30, 40, 50, 70, 100]
+COMPRIMENTOS = [10, 25, 40, 60, 100]
+METRAGENS = [100, 300, 500, 1000, 2500, 5000]
+CODIGOS_COR = ['F01', 'T30', 'T31', 'P12', 'B07', 'V22']
+
+
+def percentil(ordenados, p):
+    """Percentil p (0 a 100) de uma lista já ordenada, pelo método nearest-rank"""
+    if not ordenados:
+        return 0.0
+    posicao = max(math.ceil(p / 100 * len(ordenados)), 1)
+    return ordenados[posicao - 1]
+
+
+class Medicoes:
+    """Latências, erros e consultas por endpoint, compartilhadas entre as threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tempos = defaultdict(list)
+        self._consultas = defaultdict(list)
+        self._erros = Counter()
+        self.falhas = Counter()
+
+    def registrar(self, nome, duracao, ok, consultas=None):
+        with self._lock:
+            self._tempos[nome].append(duracao)
+            if consultas is not None:
+                self._consultas[nome].append(consultas)
+            if not ok:
+                self._erros[nome] += 1
+
+    def registrar_falha(self, acao, erro):
+        """Exceção no próprio usuário virtual (não é tempo de resposta)"""
+        with self._lock:
+            self.falhas[f'{acao}: {type(erro).__name__}'] += 1
+
+    @staticmethod
+    def _linha(nome, tempos, erros, consultas, segundos):
+        tempos = sorted(tempos)
+        return {
+            'endpoint': nome,
+            'requisicoes': len(tempos),
+            'erros': erros,
+            'rps': len(tempos) / segundos if segundos else 0.0,
+            'p50_ms': percentil(tempos, 50) * 1000,
+            'p95_ms': percentil(tempos, 95) * 1000,
+            'p99_ms': percentil(tempos, 99) * 1000,
+            'consultas': sum(consultas) / len(consultas) if consultas else None,
+            'consultas_max': max(consultas) if consultas else None,
+        }
+
+    def relatorio(self, segundos):
+        """Uma linha por endpoint (ordem alfabética) e a linha TOTAL no fim"""
+        with self._lock:
+            linhas = [
+                self._linha(nome, self._tempos[nome], self._erros[nome],
+                            self._consultas[nome], segundos)
+                for nome in sorted(self._tempos)
+            ]
+            todos = [t for tempos in self._tempos.values() for t in tempos]
+            consultas = [c for lista in self._consultas.values() for c in lista]
+            linhas.append(self._linha(
+                'TOTAL', todos, sum(self._erros.values()), consultas, segundos))
+        return linhas
+
+
+class Resposta:
+    def __init__(self, status, conteudo=b'', cabecalhos=None):
+        self.status = status
+        self.conteudo = conteudo
+        self.cabecalhos = cabecalhos or {}
+
+
+class _SemRedirecionar(urllib.request.HTTPRedirectHandler):
+    """Devolve o 3xx como resposta em vez de seguir"""
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class ClienteHttp:
+    """Sessão HTTP de um usuário virtual: cookies, token CSRF e medição"""
+
+    def __init__(self, base_url, medicoes, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.medicoes = medicoes
+        self.timeout = timeout
+        self.cookies = http.cookiejar.CookieJar()
+        self._opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(self.cookies), _SemRedirecionar)
+
+    def _csrf(self):
+        return next((c.value for c in self.cookies if c.name == 'csrftoken'), '')
+
+    def requisitar(self, nome, caminho, dados=None, cabecalhos=None, esperado=(200,)):
+        """GET (ou POST se houver dados) medido sob o nome do endpoint"""
+        url = self.base_url + caminho
+        cabecalhos = dict(cabecalhos or {})
+        corpo = None
+        if dados is not None:
+            token = self._csrf()
+            corpo = urllib.parse.urlencode(dict(dados, csrfmiddlewaretoken=token)).encode()
+            cabecalhos.update({'X-CSRFToken': token, 'Referer': url})
+
+        inicio = time.perf_counter()
+        try:
+            try:
+                resposta = self._opener.open(
+                    urllib.request.Request(url, data=corpo, headers=cabecalhos), timeout=self.timeout)
+            except urllib.error.HTTPError as erro:
+                resposta = erro  # 3xx não seguidos, 4xx e 5xx
+            with resposta:
+                conteudo = resposta.read()
+        except OSError:
+            # Conexão recusada, timeout...
+            self.medicoes.registrar(nome, time.perf_counter() - inicio, False)
+            return Resposta(0)
+        duracao = time.perf_counter() - inicio
+
+        consultas = resposta.headers.get('X-Consultas')
+        status = resposta.getcode()
+        self.medicoes.registrar(
+            nome, duracao, status in esperado, int(consultas) if consultas else None)
+        return Resposta(status, conteudo, resposta.headers)
+
+
+class DadosCarga:
+    """IDs lidos do banco uma vez, antes de disparar os usuários"""
+
+    def __init__(self, usuarios, amostra=500):
+        self.materiais = list(TipoMaterial.objects.filter(ativo=True).values_list('pk', flat=True))
+        self.cortes = list(TipoCorte.objects.filter(ativo=True).values_list('pk', flat=True))
+        if not self.materiais or not self.cortes:
+            raise ValueError('Cadastre ao menos um tipo de material e um tipo de corte')
+        # Orçamentos mais recentes visíveis para cada usuário (detalhe)
+        self.orcamentos = {}
+        for username, gestor in usuarios:
+            visiveis = Orcamento.objects.filter(ativo=True)
+            if not gestor:
+                visiveis = visiveis.filter(vendedor__user__username=username)
+            self.orcamentos[username] = list(
+                visiveis.order_by('-data_emissao', '-id').values_list('pk', flat=True)[:amostra])
+
+
+class UsuarioVirtual(threading.Thread):
+    """Um vendedor (ou o gestor) usando o sistema até o prazo `ate` (time.monotonic)"""
+
+    def __init__(self, numero, cliente, username, senha, gestor, dados, ate, pesos, semente):
+        super().__init__(name=f'carga-{numero}', daemon=True)
+        self.numero = numero
+        self.cliente = cliente
+        self.username = username
+        self.senha = senha
+        self.gestor = gestor
+        self.dados = dados
+        self.ate = ate
+        self.acoes = list(pesos)
+        self.pesos = list(pesos.values())
+        self.rnd = random.Random(semente)
+        self.calculo_seq = 0
+        self.criados = 0
+        # Orçamentos criados por este usuário e ainda digitando
+        self.editaveis = []
+
+    # ---------- Ações ----------
+
+    def login(self):
+        caminho = reverse('orcamento:login')
+        self.cliente.requisitar('GET login', caminho)
+        resposta = self.cliente.requisitar(
+            'POST login', caminho, {'username': self.username, 'password': self.senha},
+            esperado=(302,))
+        return resposta.status == 302
+
+    def listar(self):
+        filtros = self.rnd.choice([
+            {},
+            {'status': self.rnd.choice(Orcamento.STATUS_ABERTOS)},
+            {'cliente': self.rnd.choice(NOMES)},
+            {'tipo_material': self.rnd.choice(self.dados.materiais)},
+        ])
+        caminho = reverse('orcamento:orcamento_list')
+        if filtros:
+            caminho += '?' + urllib.parse.urlencode(filtros)
+        self.cliente.requisitar('GET orcamento_list', caminho)
+
+    def detalhar(self):
+        pks = self.dados.orcamentos.get(self.username) or self.editaveis
+        if not pks:
+            return self.criar()
+        pk = self.rnd.choice(pks)
+        self.cliente.requisitar(
+            'GET orcamento_detail', reverse('orcamento:orcamento_detail', args=[pk]))
+
+    def calcular(self):
+        self.calculo_seq += 1
+        dados = dict(self._formulario(), calculo_sessao=f'carga-{self.numero}',
+                     calculo_seq=self.calculo_seq)
+        self.cliente.requisitar(
+            'POST calcular_ajax', reverse('orcamento:calcular_ajax'), dados,
+            cabecalhos={'HX-Request': 'true'}, esperado=(200, 204))
+
+    def criar(self):
+        caminho = reverse('orcamento:orcamento_create')
+        self.cliente.requisitar('GET orcamento_create', caminho)
+        resposta = self.cliente.requisitar(
+            'POST orcamento_create', caminho, self._formulario(numerar=True), esperado=(302,))
+        encontrado = re.search(r'/orcamentos/(\d+)/', resposta.cabecalhos.get('Location', ''))
+        if encontrado:
+            self.editaveis.append(int(encontrado.group(1)))
+
+    def editar(self):
+        if not self.editaveis:
+            return self.criar()
+        caminho = reverse('orcamento:orcamento_update', args=[self.rnd.choice(self.editaveis)])
+        self.cliente.requisitar('GET orcamento_update', caminho)
+        self.cliente.requisitar(
+            'POST orcamento_update', caminho, dict(self._formulario(), acao='salvar'),
+            esperado=(302,))
+
+    def status(self):
+        if not self.editaveis:
+            return self.criar()
+        novo_status = 'aprovado' if self.gestor else 'aguardando'
+        self.cliente.requisitar(
+            'GET orcamento_status',
+            reverse('orcamento:orcamento_status', args=[self.editaveis.pop(), novo_status]),
+            esperado=(302,))
+
+    def dashboard(self):
+        nome = 'dashboard_gestor' if self.gestor else 'dashboard_vendedor'
+        self.cliente.requisitar(f'GET {nome}', reverse(f'orcamento:{nome}'))
+
+    # ---------- Execução ----------
+
+    def _formulario(self, numerar=False):
+        rnd = self.rnd
+        cores = [
+            {'posicao': posicao, 'codigo': rnd.choice(CODIGOS_COR),
+             'unidades': rnd.randint(100, 5000), 'demais': 0}
+            for posicao in ['Fd', '1', '2', '3'][:rnd.randint(1, 4)]
+        ]
+        dados = {
+            'cliente': f'{PREFIXO_MASSA} Carga {rnd.choice(NOMES)}',
+            'tipo_cliente': rnd.choice([t for t, _ in Orcamento.TIPO_CLIENTE_CHOICES]),
+            'tipo_material': rnd.choice(self.dados.materiais),
+            'tipo_corte': rnd.choice(self.dados.cortes),
+            'largura_mm': rnd.choice(LARGURAS),
+            'comprimento_mm': rnd.choice(COMPRIMENTOS),
+            'quantidade_metros': rnd.choice(METRAGENS),
+            'cor_urdume': 'branco',
+            'valor_frete': '0',
+            'cores_data': json.dumps({'cores1': cores}),
+        }
+        if numerar:
+            self.criados += 1
+            dados['numero_pedido'] = f'{PREFIXO_MASSA}-carga-{self.numero}-{self.criados}'
+        return dados
+
+    def run(self):
+        if not self.login():
+            return
+        while time.monotonic() < self.ate:
+            acao = self.rnd.choices(self.acoes, self.pesos)[0]
+            try:
+                getattr(self, acao)()
+            except Exception as erro:
+                self.cliente.medicoes.registrar_falha(acao, erro)
+
+
+def executar_carga(base_url, usuarios, senha, quantidade, duracao, pesos=None, semente=0):
+    """
+    Dispara `quantidade` usuários virtuais (distribuídos entre as contas de
+    `usuarios`, lista de (username, is_gestor)) por `duracao` segundos.
+    Retorna (Medicoes, segundos efetivos)
+    """
+    pesos = pesos or FLUXOS
+    dados = DadosCarga(usuarios)
+    medicoes = Medicoes()
+    inicio = time.monotonic()
+    ate = inicio + duracao
+    threads = []
+    for numero in range(quantidade):
+        username, gestor = usuarios[numero % len(usuarios)]
+        threads.append(UsuarioVirtual(
+            numero, ClienteHttp(base_url, medicoes), username, senha, gestor, dados, ate, pesos,
+            semente=semente * 1000 + numero,
+        ))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return medicoes, time.monotonic() - inicio
@@ -0,0 +1,97 @@
+"""
+Coalescência das requisições da pré-visualização do cálculo.
+
+O formulário numera cada pedido de cálculo (calculo_seq) dentro de uma sessão
+do formulário (calculo_sessao, gerada ao abrir a página). O maior número já
+recebido fica no cache do Django; um pedido com número menor já foi superado
+por um mais novo do mesmo formulário e é descartado sem calcular. Se um pedido
+mais novo chegar enquanto este calcula, a resposta também é descartada antes
+de renderizar. Em ambos os casos a view responde 204, que o HTMX ignora.
+
+Pedidos sem calculo_seq (clientes antigos, integrações) não são afetados.
+Com vários processos o cache precisa ser compartilhado, como em papeis.py.
+
+Configuração: CALCULO_COALESCER (padrão True) e CALCULO_SEQ_TTL (segundos).
+"""
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+
+_lock = threading.Lock()
+_contadores = {
+    'recebidos': 0,
+    'descartados_antes': 0,
+    'descartados_depois': 0,
+}
+
+
+def _contar(nome):
+    with _lock:
+        _contadores[nome] += 1
+
+
+def _chave(user_id, sessao):
+    return f'orcamento:calculo:seq:{user_id}:{sessao}'
+
+
+class PedidoCalculo:
+    """Posição de um pedido de cálculo na sequência do seu formulário"""
+
+    def __init__(self, user_id, sessao, seq):
+        self.chave = _chave(user_id, sessao)
+        self.seq = seq
+
+    @classmethod
+    def da_requisicao(cls, request):
+        """PedidoCalculo do POST ou None se o cliente não numera os pedidos"""
+        if not getattr(settings, 'CALCULO_COALESCER', True):
+            return None
+        sessao = request.POST.get('calculo_sessao', '')[:64]
+        try:
+            seq = int(request.POST.get('calculo_seq', ''))
+        except ValueError:
+            return None
+        if not sessao:
+            return None
+        _contar('recebidos')
+        return cls(request.user.pk, sessao, seq)
+
+    def registrar(self):
+        """
+        Registra o pedido como o mais novo do formulário. Retorna False se um
+        pedido mais novo já chegou (este está obsoleto e não deve ser calculado)
+        """
+        ultimo = cache.get(self.chave)
+        if ultimo is not None and ultimo > self.seq:
+            _contar('descartados_antes')
+            return False
+        # Sem operação atômica de máximo no cache: dois pedidos simultâneos
+        # podem gravar fora de ordem, e no pior caso os dois são respondidos
+        cache.set(self.chave, self.seq, getattr(settings, 'CALCULO_SEQ_TTL', 600))
+        return True
+
+    def superado(self):
+        """True se um pedido mais novo chegou enquanto este calculava"""
+        ultimo = cache.get(self.chave)
+        if ultimo is not None and ultimo > self.seq:
+            _contar('descartados_depois')
+            return True
+        return False
+
+
+def estatisticas():
+    with _lock:
+        contadores = dict(_contadores)
+    descartados = contadores['descartados_antes'] + contadores['descartados_depois']
+    contadores['calculos_evitados'] = contadores['descartados_antes']
+    contadores['taxa_descarte'] = (
+        round(descartados / contadores['recebidos'], 4) if contadores['recebidos'] else 0.0
+    )
+    return contadores
+
+
+def zerar_estatisticas():
+    with _lock:
+        for nome in _contadores:
+            _contadores[nome] = 0
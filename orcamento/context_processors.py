@@ -3,6 +3,9 @@ Context processors para o app orcamento
 """
 from django.conf import settings
 
+from .papeis import papeis_do_usuario
+
+
 def system_info(request):
     """
     Retorna informações gerais do sistema disponíveis em todos os templates
@@ -11,3 +14,14 @@ def system_info(request):
         'SYSTEM_NAME': getattr(settings, 'SYSTEM_NAME', 'Futura Etiquetas'),
         'SYSTEM_VERSION': getattr(settings, 'SYSTEM_VERSION', '1.0.0'),
     }
+
+
+def papeis(request):
+    """
+    Papéis do usuário para os templates: os de request.papeis (PapeisMiddleware)
+    ou, sem o middleware, resolvidos aqui
+    """
+    papeis_requisicao = getattr(request, 'papeis', None)
+    if papeis_requisicao is None:
+        papeis_requisicao = papeis_do_usuario(getattr(request, 'user', None), getattr(request, 'session', None))
+    return {'papeis': papeis_requisicao}
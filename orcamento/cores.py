@@ -0,0 +1,117 @@
+"""
+Sincronização das cores de um orçamento com o JSON enviado pelo formulário
+(cores_data: {"cores1": [...], "cores2": [...]}, uma lista por densidade).
+
+Em vez de apagar todas as cores e criar uma a uma, compara o enviado com o
+que está gravado pela chave única (densidade, posição) e aplica só as
+diferenças: um bulk_create, um bulk_update e um delete, na mesma transação.
+Os totais desnormalizados do orçamento (total_unidades_cores, quantidade de
+cores por densidade) saem do próprio JSON, sem reler as cores.
+"""
+import json
+
+from django.db import transaction
+
+from .models import CorOrcamento
+
+# Chave do JSON -> densidade gravada
+LISTAS_DENSIDADE = {'cores1': '1', 'cores2': '2'}
+CAMPOS_ATUALIZAVEIS = ['codigo_cor', 'quantidade_unidades', 'quantidade_demais', 'ordem']
+
+
+class ResultadoCores:
+    """Contagem das alterações e soma de unidades (quantidade + demais) das cores"""
+
+    def __init__(self, inseridas=0, atualizadas=0, removidas=0, total_unidades=0):
+        self.inseridas = inseridas
+        self.atualizadas = atualizadas
+        self.removidas = removidas
+        self.total_unidades = total_unidades
+
+    def __repr__(self):
+        return (f'<ResultadoCores +{self.inseridas} ~{self.atualizadas} -{self.removidas} '
+                f'total={self.total_unidades}>')
+
+
+def _inteiro(valor):
+    return int(valor) if valor not in (None, '') else 0
+
+
+def ler_cores(cores_data):
+    """
+    Converte o cores_data (texto JSON ou dict) em {(densidade, posicao): campos}.
+    Cores sem código são ignoradas. ValueError se o JSON for inválido ou se
+    uma posição se repetir na mesma densidade
+    """
+    if not cores_data:
+        return {}
+    dados = json.loads(cores_data) if isinstance(cores_data, str) else cores_data
+    if not isinstance(dados, dict):
+        raise ValueError('cores_data deve ser um objeto JSON')
+
+    cores = {}
+    for lista, densidade in LISTAS_DENSIDADE.items():
+        for ordem, cor in enumerate(dados.get(lista) or []):
+            if not cor.get('codigo'):
+                continue
+            chave = (densidade, cor.get('posicao') or 'Fd')
+            if chave in cores:
+                raise ValueError(f'Posição {chave[1]} repetida na {densidade}ª densidade')
+            cores[chave] = {
+                'codigo_cor': cor['codigo'],
+                'quantidade_unidades': _inteiro(cor.get('unidades')),
+                'quantidade_demais': _inteiro(cor.get('demais')),
+                'ordem': ordem,
+            }
+    return cores
+
+
+def totais_cores(cores):
+    """Totais desnormalizados do orçamento (Orcamento.CAMPOS_TOTAIS_CORES) das cores lidas"""
+    densidades = [densidade for densidade, _ in cores]
+    return {
+        'total_unidades_cores': sum(
+            c['quantidade_unidades'] + c['quantidade_demais'] for c in cores.values()),
+        'total_demais_cores': sum(c['quantidade_demais'] for c in cores.values()),
+        'qtd_cores_densidade1': densidades.count('1'),
+        'qtd_cores_densidade2': densidades.count('2'),
+    }
+
+
+def sincronizar_cores(orcamento, cores_data):
+    """
+    Grava as cores enviadas para o orçamento (já salvo) aplicando só as
+    diferenças, e os totais das cores no próprio orçamento. Retorna um
+    ResultadoCores
+    """
+    enviadas = ler_cores(cores_data)
+
+    with transaction.atomic():
+        existentes = {
+            (cor.densidade, cor.posicao): cor
+            for cor in CorOrcamento.objects.filter(orcamento=orcamento).select_for_update()
+        }
+
+        novas, alteradas = [], []
+        for chave, campos in enviadas.items():
+            cor = existentes.pop(chave, None)
+            if cor is None:
+                densidade, posicao = chave
+                novas.append(CorOrcamento(
+                    orcamento=orcamento, densidade=densidade, posicao=posicao, **campos))
+            elif any(getattr(cor, campo) != valor for campo, valor in campos.items()):
+                for campo, valor in campos.items():
+                    setattr(cor, campo, valor)
+                alteradas.append(cor)
+
+        if existentes:
+            CorOrcamento.objects.filter(pk__in=[cor.pk for cor in existentes.values()]).delete()
+        if alteradas:
+            CorOrcamento.objects.bulk_update(alteradas, CAMPOS_ATUALIZAVEIS)
+        if novas:
+            CorOrcamento.objects.bulk_create(novas)
+
+        totais = totais_cores(enviadas)
+        orcamento.gravar_totais_cores(totais)
+
+    return ResultadoCores(len(novas), len(alteradas), len(existentes), totais['total_unidades_cores'])
@@ -0,0 +1,262 @@
+"""
+Reprecificação incremental dos orçamentos abertos.
+
+Cada orçamento depende de poucas chaves das tabelas de preço: material +
+faixa de metragem (TabelaPreco), material + código de corte + faixa de
+largura (CoeficienteFator), acabamento + faixa de largura (PrecoAcabamento),
+largura real (Fita) e largura para canvas/cetim (ValorCorte), além do
+material, corte e batida escolhidos.
+
+Comparando o snapshot anterior com o novo, calculamos as faixas que mudaram
+de resultado e montamos um filtro que seleciona apenas os orçamentos cujas
+consultas mudaram. Só esses são recalculados.
+
+Exclusões com SET_NULL (acabamento) apagam a referência antes da troca de
+snapshot, então o filtro não acharia esses orçamentos: eles são coletados
+antes da exclusão (signals.py) e incluídos explicitamente.
+
+A reprecificação roda depois do commit, em uma thread separada da requisição
+(REPRECIFICACAO_EM_SEGUNDO_PLANO). Se falhar ou for interrompida, os
+orçamentos abertos continuam com a versão antiga dos preços: o próximo save
+os recalcula, e o comando recalcular_orcamentos --pendentes os recalcula todos.
+"""
+import logging
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Q
+
+from .indice_faixas import IndiceFaixas, PISO, TETO, PRIMEIRO, ULTIMO, faixas_alteradas
+from .models import Orcamento
+from .recalculo import recalcular_orcamentos
+from .snapshot_precos import obter_snapshot
+
+# Filtro que casa com todos os orçamentos (Q() vazio é ignorado no |)
+TODOS = Q(pk__isnull=False)
+
+_local = threading.local()
+# Uma reprecificação por vez no processo (os deltas do resumo de vendas
+# partem dos valores lidos no início)
+_lock = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+
+def _q_faixa(campo, inicio, fim, modo, multiplicador=1):
+    """Q para uma faixa: [inicio, fim) no PISO, (inicio, fim] no TETO"""
+    if inicio is None and fim is None:
+        return TODOS
+    filtro = Q()
+    if inicio is not None:
+        lookup = 'gte' if modo == PISO else 'gt'
+        filtro &= Q(**{f'{campo}__{lookup}': inicio * multiplicador})
+    if fim is not None:
+        lookup = 'lt' if modo == PISO else 'lte'
+        filtro &= Q(**{f'{campo}__{lookup}': fim * multiplicador})
+    return filtro
+
+
+def _q_faixas(campo, faixas, modo, multiplicador=1):
+    """OU das faixas; None se a lista estiver vazia"""
+    filtro = None
+    for inicio, fim in faixas:
+        q = _q_faixa(campo, inicio, fim, modo, multiplicador)
+        filtro = q if filtro is None else filtro | q
+    return filtro
+
+
+def _faixas_indices(antigo, novo, chave, modo, fallback=None):
+    """Faixas alteradas entre os índices de uma chave (ausente = índice vazio)"""
+    vazio = IndiceFaixas([], modo, fallback=fallback)
+    return faixas_alteradas(antigo.get(chave, vazio), novo.get(chave, vazio))
+
+
+def _ids_alterados(antigo, novo):
+    """Chaves cujo valor mudou, foi incluído ou removido"""
+    return {
+        chave for chave in set(antigo) | set(novo)
+        if antigo.get(chave) != novo.get(chave)
+    }
+
+
+def filtro_afetados(antigo, novo):
+    """
+    Q dos orçamentos cujo cálculo pode mudar ao trocar o snapshot antigo pelo
+    novo, ou None se nenhuma consulta mudou de resultado.
+    """
+    if dict(antigo.configs) != dict(novo.configs):
+        # Percentuais gerais afetam todos os orçamentos
+        return TODOS
+
+    partes = []
+
+    # Entidades: nome/dupla densidade do material, nome do corte (define o
+    # codigo_calc) e fator da batida
+    materiais = _ids_alterados(antigo.materiais, novo.materiais)
+    if materiais:
+        partes.append(Q(tipo_material_id__in=materiais))
+    cortes = _ids_alterados(antigo.cortes, novo.cortes)
+    if cortes:
+        partes.append(Q(tipo_corte_id__in=cortes))
+    batidas = _ids_alterados(antigo.batidas, novo.batidas)
+    if batidas:
+        partes.append(Q(batida_id__in=batidas))
+
+    # TabelaPreco: a metragem consultada é a manual ou, sem ela, a digitada
+    sem_manual = Q(tabela_manual_metragem__isnull=True) | Q(tabela_manual_metragem=0)
+    for material_id in set(antigo.precos) | set(novo.precos):
+        faixas = _faixas_indices(antigo.precos, novo.precos, material_id, PISO, PRIMEIRO)
+        if not faixas:
+            continue
+        partes.append(Q(tipo_material_id=material_id) & (
+            (sem_manual & _q_faixas('quantidade_metros', faixas, PISO))
+            | (~sem_manual & _q_faixas('tabela_manual_metragem', faixas, PISO))
+        ))
+
+    # CoeficienteFator: agrupado por código de corte calculado (tamanho do nome)
+    for material_id, codigo_calc in set(antigo.coeficientes) | set(novo.coeficientes):
+        faixas = _faixas_indices(
+            antigo.coeficientes, novo.coeficientes, (material_id, codigo_calc), PISO
+        )
+        cortes_calc = [pk for pk, nome in novo.cortes.items() if len(nome) == codigo_calc]
+        if not faixas or not cortes_calc:
+            continue
+        partes.append(
+            Q(tipo_material_id=material_id, tipo_corte_id__in=cortes_calc)
+            & _q_faixas('largura_mm', faixas, PISO)
+        )
+
+    # PrecoAcabamento: menor largura >= largura do orçamento
+    for acabamento_id in set(antigo.precos_acabamento) | set(novo.precos_acabamento):
+        faixas = _faixas_indices(
+            antigo.precos_acabamento, novo.precos_acabamento, acabamento_id, TETO, ULTIMO
+        )
+        if faixas:
+            partes.append(
+                Q(acabamento_id=acabamento_id) & _q_faixas('largura_mm', faixas, TETO)
+            )
+
+    # ValorCorte: só materiais canvas/cetim
+    faixas = faixas_alteradas(antigo.valores_corte, novo.valores_corte)
+    especiais = [
+        pk for pk, (nome, _) in novo.materiais.items()
+        if 'canvas' in nome.lower() or 'cetim' in nome.lower()
+    ]
+    if faixas and especiais:
+        partes.append(
+            Q(tipo_material_id__in=especiais) & _q_faixas('largura_mm', faixas, PISO)
+        )
+
+    # Fita: consultada pela largura real (metade da largura na dupla densidade;
+    # largura // 2 em [a, b) equivale a largura em [2a, 2b))
+    faixas = faixas_alteradas(antigo.fitas, novo.fitas)
+    if faixas:
+        duplas = [pk for pk, (_, dupla) in novo.materiais.items() if dupla]
+        partes.append(
+            (~Q(tipo_material_id__in=duplas) & _q_faixas('largura_mm', faixas, PISO))
+            | (Q(tipo_material_id__in=duplas) & _q_faixas('largura_mm', faixas, PISO, 2))
+        )
+
+    if not partes:
+        return None
+    filtro = partes[0]
+    for parte in partes[1:]:
+        filtro |= parte
+    return filtro
+
+
+def orcamentos_afetados(antigo, novo, incluir=()):
+    """
+    Queryset dos orçamentos abertos afetados pela troca de snapshot, mais os
+    de pks em incluir (ainda abertos)
+    """
+    filtro = filtro_afetados(antigo, novo)
+    if incluir:
+        filtro = Q(pk__in=incluir) if filtro is None else filtro | Q(pk__in=incluir)
+    if filtro is None:
+        return Orcamento.objects.none()
+    return Orcamento.objects.filter(status__in=Orcamento.STATUS_ABERTOS).filter(filtro)
+
+
+def reprecificar_afetados(antigo, novo=None, incluir=()):
+    """
+    Recalcula os orçamentos abertos afetados e passa os demais abertos que
+    estavam na versão antiga dos preços para a nova (o cálculo deles não
+    muda). Retorna o resumo do recálculo.
+    """
+    novo = novo or obter_snapshot()
+    resumo = recalcular_orcamentos(orcamentos_afetados(antigo, novo, incluir), snapshot=novo)
+    if antigo.versao_precos is not None and antigo.versao_precos != novo.versao_precos:
+        Orcamento.objects.filter(
+            status__in=Orcamento.STATUS_ABERTOS, versao_precos=antigo.versao_precos
+        ).exclude(pk__in=[pk for pk, _ in resumo['erros']]).update(versao_precos=novo.versao_precos)
+    return resumo
+
+
+@contextmanager
+def reprecificacao_incremental():
+    """
+    Envolve uma alteração nas tabelas de preço: guarda o snapshot vigente na
+    entrada e, após o commit, agenda a reprecificação só dos orçamentos
+    afetados. Blocos aninhados usam o externo. Produz o conjunto de pks a
+    reprecificar além dos achados pelo filtro (ver incluir_dependentes).
+    """
+    externo = getattr(_local, 'incluidos', None)
+    if externo is not None:
+        yield externo
+        return
+
+    antigo = obter_snapshot()
+    incluidos = _local.incluidos = set()
+    try:
+        yield incluidos
+    finally:
+        _local.incluidos = None
+    transaction.on_commit(lambda: agendar_reprecificacao(antigo, incluidos))
+
+
+def agendar_reprecificacao(antigo, incluir=()):
+    """
+    Reprecifica os afetados em uma thread, sem prender a requisição, ou na
+    hora com REPRECIFICACAO_EM_SEGUNDO_PLANO = False (testes, scripts)
+    """
+    if getattr(settings, 'REPRECIFICACAO_EM_SEGUNDO_PLANO', True):
+        threading.Thread(
+            target=_reprecificar, args=(antigo, incluir, True), name='reprecificacao', daemon=True
+        ).start()
+    else:
+        _reprecificar(antigo, incluir)
+
+
+def _reprecificar(antigo, incluir, em_thread=False):
+    # A alteração já foi confirmada: uma falha aqui não pode virar erro dela
+    try:
+        with _lock:
+            reprecificar_afetados(antigo, incluir=incluir)
+    except Exception:
+        logger.exception('Falha na reprecificação incremental; os orçamentos abertos ficam '
+                         'pendentes (recalcular_orcamentos --pendentes)')
+    finally:
+        if em_thread:
+            connections.close_all()
+
+
+def incluir_dependentes(instance):
+    """
+    Antes de excluir um objeto das tabelas de preço: guarda os orçamentos
+    abertos que o referenciam para a reprecificação em curso. Fora de
+    reprecificacao_incremental() não faz nada.
+    """
+    incluidos = getattr(_local, 'incluidos', None)
+    if incluidos is None:
+        return
+    campos = [
+        campo.name for campo in Orcamento._meta.concrete_fields
+        if campo.is_relation and campo.related_model is type(instance)
+    ]
+    for campo in campos:
+        incluidos.update(Orcamento.objects.filter(
+            status__in=Orcamento.STATUS_ABERTOS, **{campo: instance}
+        ).values_list('pk', flat=True))
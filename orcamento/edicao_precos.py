@@ -0,0 +1,172 @@
+"""
+Edição em lote das grades pivot (pivots_precos.py).
+
+A página envia só as células alteradas, cada uma com o valor que o usuário
+viu (original). O lote inteiro é validado antes de gravar: posição existente
+na grade, valor aceito pelo campo do modelo e original igual ao gravado, o
+que detecta edição simultânea por outro gestor. Aplicado com um bulk_update
+e um bulk_create em uma transação, gera uma única versão dos preços com o
+conjunto de mudanças no registro (registrar_em_massa). A reprecificação
+incremental fica com a view (ReprecificacaoMixin).
+"""
+import abc
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .models import CoeficienteFator, PrecoAcabamento, TabelaPreco
+from .pivots_precos import obter_pivot
+from .versao_precos import alteracao_precos, dados_objeto, registrar_em_massa
+
+# Limite de células por lote
+MAXIMO_CELULAS = 5000
+
+
+class GradeEdicao(abc.ABC):
+    """Como as células de uma grade pivot mapeiam para linhas do modelo"""
+
+    def __init__(self, modelo, campo_linha, campo_coluna, campo_valor, campo_fixo=None):
+        self.modelo = modelo
+        self.campo_linha = campo_linha
+        self.campo_coluna = campo_coluna
+        self.campo_valor = campo_valor
+        # Campo com o mesmo valor em toda a grade (o material, nos coeficientes)
+        self.campo_fixo = campo_fixo
+
+    @abc.abstractmethod
+    def posicoes(self, pivot, fixo):
+        """(linhas, colunas) válidas da grade"""
+
+
+class _GradeLinhasCadastro(GradeEdicao):
+    """Linhas = cadastro (material, acabamento), colunas = faixas existentes"""
+
+    def __init__(self, *args, chave_linha, chave_colunas, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.chave_linha = chave_linha
+        self.chave_colunas = chave_colunas
+
+    def posicoes(self, pivot, fixo):
+        linhas = {linha[self.chave_linha]['id'] for linha in pivot['linhas']}
+        return linhas, set(pivot[self.chave_colunas])
+
+
+class _GradeCoeficientes(GradeEdicao):
+    """Linhas = larguras, colunas = cortes, de um material"""
+
+    def posicoes(self, pivot, fixo):
+        material = pivot.get(fixo)
+        if material is None:
+            return set(), set()
+        return ({linha['largura'] for linha in material['linhas']},
+                {corte['id'] for corte in material['cortes']})
+
+
+GRADES = {
+    'tabela_precos': _GradeLinhasCadastro(
+        TabelaPreco, 'tipo_material_id', 'metragem', 'preco_metro',
+        chave_linha='material', chave_colunas='metragens'),
+    'acabamentos': _GradeLinhasCadastro(
+        PrecoAcabamento, 'acabamento_id', 'largura_mm', 'preco',
+        chave_linha='acabamento', chave_colunas='larguras'),
+    'coeficientes': _GradeCoeficientes(
+        CoeficienteFator, 'largura', 'codigo_corte_id', 'coeficiente',
+        campo_fixo='tipo_material_id'),
+}
+
+
+def _decimal(texto):
+    """Valor digitado ('15,69' ou '15.69'), ou None se vazio"""
+    texto = str(texto if texto is not None else '').strip()
+    if not texto:
+        return None
+    if ',' in texto:
+        texto = texto.replace('.', '').replace(',', '.')
+    return Decimal(texto)
+
+
+def _validar(grade, alteracoes, linhas_validas, colunas_validas):
+    """({(linha, coluna): (original, valor)} das células válidas, mensagens de erro)"""
+    campo = grade.modelo._meta.get_field(grade.campo_valor)
+    erros = []
+    celulas = {}
+    if len(alteracoes) > MAXIMO_CELULAS:
+        raise ValidationError(f'No máximo {MAXIMO_CELULAS} células por lote.')
+    for alteracao in alteracoes:
+        try:
+            linha, coluna = int(alteracao['linha']), int(alteracao['coluna'])
+        except (KeyError, TypeError, ValueError):
+            erros.append(f'Célula inválida: {alteracao!r}')
+            continue
+        if linha not in linhas_validas or coluna not in colunas_validas:
+            erros.append(f'Célula {linha}/{coluna} não existe na grade.')
+            continue
+        try:
+            original = _decimal(alteracao.get('original'))
+            valor = _decimal(alteracao.get('valor'))
+        except InvalidOperation:
+            erros.append(f'Célula {linha}/{coluna}: valor inválido "{alteracao.get("valor")}".')
+            continue
+        if valor is None:
+            erros.append(f'Célula {linha}/{coluna}: informe um valor (para excluir use a visão lista).')
+            continue
+        try:
+            valor = campo.clean(valor, None)
+        except ValidationError as e:
+            erros.append(f'Célula {linha}/{coluna}: {" ".join(e.messages)}')
+            continue
+        celulas[(linha, coluna)] = (original, valor)
+    return celulas, erros
+
+
+def aplicar_edicao(nome, alteracoes, fixo=None, descricao=''):
+    """
+    Aplica um lote de células ({'linha', 'coluna', 'valor', 'original'}) na
+    grade. Retorna {'alterados': n, 'criados': n}; nada é gravado se houver
+    erro (ValidationError com a lista de mensagens).
+    """
+    grade = GRADES[nome]
+    linhas_validas, colunas_validas = grade.posicoes(obter_pivot(nome), fixo)
+    celulas, erros = _validar(grade, alteracoes, linhas_validas, colunas_validas)
+    if not celulas and not erros:
+        return {'alterados': 0, 'criados': 0}
+
+    fixos = {grade.campo_fixo: fixo} if grade.campo_fixo else {}
+    with alteracao_precos(descricao=descricao), transaction.atomic():
+        existentes = {
+            (getattr(obj, grade.campo_linha), getattr(obj, grade.campo_coluna)): obj
+            for obj in grade.modelo.objects.select_for_update().filter(
+                **fixos,
+                **{f'{grade.campo_linha}__in': {linha for linha, _ in celulas}},
+                **{f'{grade.campo_coluna}__in': {coluna for _, coluna in celulas}},
+            )
+        }
+        antes, alterados, novos = [], [], []
+        for (linha, coluna), (original, valor) in celulas.items():
+            obj = existentes.get((linha, coluna))
+            atual = getattr(obj, grade.campo_valor) if obj is not None else None
+            if atual != original:
+                erros.append(f'Célula {linha}/{coluna} foi alterada por outra pessoa '
+                             f'(agora: {atual if atual is not None else "vazia"}).')
+                continue
+            if obj is None:
+                novos.append(grade.modelo(**fixos, **{
+                    grade.campo_linha: linha, grade.campo_coluna: coluna, grade.campo_valor: valor,
+                }))
+            elif atual != valor:
+                antes.append(dados_objeto(obj))
+                setattr(obj, grade.campo_valor, valor)
+                alterados.append(obj)
+        if erros:
+            raise ValidationError(erros)
+        if not alterados and not novos:
+            return {'alterados': 0, 'criados': 0}
+
+        grade.modelo.objects.bulk_update(alterados, [grade.campo_valor])
+        grade.modelo.objects.bulk_create(novos)
+        registrar_em_massa(
+            grade.modelo, antes=antes, depois=[dados_objeto(obj) for obj in alterados + novos],
+            descricao=descricao,
+        )
+    return {'alterados': len(alterados), 'criados': len(novos)}
@@ -1,5 +1,10 @@
 from django import forms
-from .models import Orcamento, TipoMaterial, Batida, CoeficienteFator, TabelaPreco, Vendedor
+from django.conf import settings
+from .models import (
+    Orcamento, TipoMaterial, TipoCorte, Acabamento, Batida, CoeficienteFator, TabelaPreco, Vendedor
+)
+from .matriz_precos import CAMPOS_MATRIZ, larguras_padrao, metragens_padrao
+from .snapshot_precos import obter_snapshot
 
 
 class OrcamentoForm(forms.ModelForm):
@@ -266,3 +271,109 @@ class TabelaPrecoForm(forms.ModelForm):
                 'placeholder': 'R$ 0.00'
             })
         }
+
+
+def _lista_inteiros(valor, campo):
+    """'40, 50,60' -> [40, 50, 60] (ordenada, sem repetidos)"""
+    try:
+        numeros = {int(parte) for parte in valor.replace(';', ',').split(',') if parte.strip()}
+    except ValueError:
+        raise forms.ValidationError(f'Informe {campo} separadas por vírgula (números inteiros).')
+    if any(numero <= 0 for numero in numeros):
+        raise forms.ValidationError(f'As {campo} devem ser maiores que zero.')
+    return sorted(numeros)
+
+
+class MatrizPrecosForm(forms.Form):
+    """Parâmetros da tabela de preços de venda (largura x metragem x comprimento)"""
+    CLASSE = 'w-full px-4 py-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-blue-500'
+
+    tipo_material = forms.ModelChoiceField(
+        queryset=TipoMaterial.objects.filter(ativo=True), label='Material',
+        widget=forms.Select(attrs={'class': CLASSE}),
+    )
+    tipo_corte = forms.ModelChoiceField(
+        queryset=TipoCorte.objects.filter(ativo=True), label='Tipo de corte',
+        widget=forms.Select(attrs={'class': CLASSE}),
+    )
+    acabamento = forms.ModelChoiceField(
+        queryset=Acabamento.objects.filter(ativo=True), required=False, label='Acabamento',
+        empty_label='Nenhum', widget=forms.Select(attrs={'class': CLASSE}),
+    )
+    tipo_cliente = forms.ChoiceField(
+        choices=Orcamento.TIPO_CLIENTE_CHOICES, initial='comercio_novo', label='Tipo de cliente',
+        widget=forms.Select(attrs={'class': CLASSE}),
+    )
+    tem_ultrassonico = forms.BooleanField(
+        required=False, label='Ultrassônico',
+        widget=forms.CheckboxInput(attrs={'class': 'w-4 h-4 text-blue-600 rounded focus:ring-2 focus:ring-blue-500'}),
+    )
+    larguras = forms.CharField(
+        required=False, label='Larguras (mm)',
+        widget=forms.TextInput(attrs={'class': CLASSE, 'placeholder': 'Vazio: larguras da tabela de coeficientes'}),
+    )
+    metragens = forms.CharField(
+        required=False, label='Metragens',
+        widget=forms.TextInput(attrs={'class': CLASSE, 'placeholder': 'Vazio: metragens da tabela de preços'}),
+    )
+    comprimentos = forms.CharField(
+        initial='40', label='Comprimentos (mm)',
+        widget=forms.TextInput(attrs={'class': CLASSE, 'placeholder': 'Ex: 40, 50, 60'}),
+    )
+    campo = forms.ChoiceField(
+        choices=CAMPOS_MATRIZ, initial='valor_milheiro', label='Valor',
+        widget=forms.Select(attrs={'class': CLASSE}),
+    )
+
+    def clean_larguras(self):
+        return _lista_inteiros(self.cleaned_data['larguras'], 'larguras')
+
+    def clean_metragens(self):
+        return _lista_inteiros(self.cleaned_data['metragens'], 'metragens')
+
+    def clean_comprimentos(self):
+        comprimentos = _lista_inteiros(self.cleaned_data['comprimentos'], 'comprimentos')
+        if not comprimentos:
+            raise forms.ValidationError('Informe ao menos um comprimento.')
+        return comprimentos
+
+    def clean(self):
+        cleaned_data = super().clean()
+        material = cleaned_data.get('tipo_material')
+        corte = cleaned_data.get('tipo_corte')
+        if self.errors or material is None or corte is None:
+            return cleaned_data
+
+        snapshot = obter_snapshot()
+        if not cleaned_data['larguras']:
+            cleaned_data['larguras'] = larguras_padrao(snapshot, material.pk, corte.pk)
+        if not cleaned_data['metragens']:
+            cleaned_data['metragens'] = metragens_padrao(snapshot, material.pk)
+        if not cleaned_data['larguras'] or not cleaned_data['metragens']:
+            raise forms.ValidationError(
+                'Não há larguras ou metragens cadastradas para este material; informe-as manualmente.'
+            )
+
+        celulas = (len(cleaned_data['larguras']) * len(cleaned_data['metragens'])
+                   * len(cleaned_data['comprimentos']))
+        limite = getattr(settings, 'MATRIZ_PRECOS_MAX_CELULAS', 20000)
+        if celulas > limite:
+            raise forms.ValidationError(
+                f'A tabela teria {celulas} valores; o limite é {limite}. Reduza larguras, metragens ou comprimentos.'
+            )
+        return cleaned_data
+
+    def parametros(self):
+        """Argumentos de gerar_matriz/obter_matriz a partir do formulário válido"""
+        dados = self.cleaned_data
+        return {
+            'material_id': dados['tipo_material'].pk,
+            'tipo_corte_id': dados['tipo_corte'].pk,
+            'acabamento_id': dados['acabamento'].pk if dados['acabamento'] else None,
+            'tipo_cliente': dados['tipo_cliente'],
+            'tem_ultrassonico': dados['tem_ultrassonico'],
+            'larguras': dados['larguras'],
+            'metragens': dados['metragens'],
+            'comprimentos': dados['comprimentos'],
+            'campo': dados['campo'],
+        }
@@ -1,5 +1,8 @@
+from decimal import Decimal
+
 from django import forms
-from .models import Acabamento, PrecoAcabamento
+from .ajustes_precos import Ajuste
+from .models import Acabamento, PrecoAcabamento, TipoCorte, TipoMaterial
 
 class AcabamentoForm(forms.ModelForm):
     """Formulário para Acabamento"""
@@ -46,3 +49,73 @@ class PrecoAcabamentoForm(forms.ModelForm):
             }),
         }
 
+
+CLASSE_CAMPO = 'w-full px-4 py-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-blue-500'
+
+
+class AjustePrecosForm(forms.Form):
+    """Ajuste em massa (percentual, acréscimo, arredondamento) ou cópia com ajuste"""
+    tabela = forms.ChoiceField(choices=[
+        ('tabela_precos', 'Tabela de preços (R$/metro)'),
+        ('coeficientes', 'Coeficientes fator'),
+        ('acabamentos', 'Preços de acabamento'),
+    ], widget=forms.Select(attrs={'class': CLASSE_CAMPO}))
+    materiais = forms.ModelMultipleChoiceField(
+        queryset=TipoMaterial.objects.all(), required=False,
+        widget=forms.SelectMultiple(attrs={'class': CLASSE_CAMPO, 'size': 6}),
+        help_text='Tabela de preços e coeficientes. Vazio = todos.')
+    acabamentos = forms.ModelMultipleChoiceField(
+        queryset=Acabamento.objects.all(), required=False,
+        widget=forms.SelectMultiple(attrs={'class': CLASSE_CAMPO, 'size': 6}),
+        help_text='Preços de acabamento. Vazio = todos.')
+    cortes = forms.ModelMultipleChoiceField(
+        queryset=TipoCorte.objects.all(), required=False,
+        widget=forms.SelectMultiple(attrs={'class': CLASSE_CAMPO, 'size': 6}),
+        help_text='Só coeficientes. Vazio = todos.')
+    faixa_min = forms.IntegerField(required=False, min_value=0, label='Metragem/largura de',
+                                   widget=forms.NumberInput(attrs={'class': CLASSE_CAMPO}))
+    faixa_max = forms.IntegerField(required=False, min_value=0, label='até',
+                                   widget=forms.NumberInput(attrs={'class': CLASSE_CAMPO}))
+    percentual = forms.DecimalField(required=False, max_digits=7, decimal_places=3, label='Percentual (%)',
+                                    widget=forms.NumberInput(attrs={'class': CLASSE_CAMPO, 'step': '0.001',
+                                                                    'placeholder': 'Ex: 5 ou -2,5'}))
+    acrescimo = forms.DecimalField(required=False, max_digits=12, decimal_places=5, label='Acréscimo',
+                                   widget=forms.NumberInput(attrs={'class': CLASSE_CAMPO, 'step': '0.00001'}))
+    passo = forms.DecimalField(required=False, max_digits=12, decimal_places=5, min_value=Decimal('0.00001'),
+                               label='Arredondar para múltiplos de',
+                               widget=forms.NumberInput(attrs={'class': CLASSE_CAMPO, 'step': '0.00001',
+                                                               'placeholder': 'Ex: 0,05'}))
+    destino_material = forms.ModelChoiceField(
+        queryset=TipoMaterial.objects.all(), required=False, label='Copiar para o material',
+        widget=forms.Select(attrs={'class': CLASSE_CAMPO}))
+    destino_acabamento = forms.ModelChoiceField(
+        queryset=Acabamento.objects.all(), required=False, label='Copiar para o acabamento',
+        widget=forms.Select(attrs={'class': CLASSE_CAMPO}))
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if self.errors:
+            return cleaned_data
+        acabamentos = cleaned_data['tabela'] == 'acabamentos'
+        grupos = cleaned_data['acabamentos' if acabamentos else 'materiais']
+        destino = cleaned_data['destino_acabamento' if acabamentos else 'destino_material']
+        faixa_min, faixa_max = cleaned_data.get('faixa_min'), cleaned_data.get('faixa_max')
+        if faixa_min is not None and faixa_max is not None and faixa_min > faixa_max:
+            raise forms.ValidationError('A faixa inicial deve ser menor ou igual à final.')
+        if destino is None and not any(cleaned_data.get(campo) for campo in ('percentual', 'acrescimo', 'passo')):
+            raise forms.ValidationError('Informe um percentual, acréscimo ou arredondamento (ou um destino para copiar).')
+        if destino is not None and (len(grupos) != 1 or destino in grupos):
+            raise forms.ValidationError('Para copiar, selecione exatamente uma origem, diferente do destino.')
+        cleaned_data['grupos'] = [grupo.pk for grupo in grupos]
+        cleaned_data['destino'] = destino.pk if destino is not None else None
+        return cleaned_data
+
+    def ajuste(self):
+        dados = self.cleaned_data
+        return Ajuste(
+            dados['tabela'], grupos=dados['grupos'],
+            cortes=[corte.pk for corte in dados['cortes']] if dados['tabela'] == 'coeficientes' else None,
+            faixa_min=dados['faixa_min'], faixa_max=dados['faixa_max'],
+            percentual=dados['percentual'], acrescimo=dados['acrescimo'], passo=dados['passo'],
+            destino=dados['destino'],
+        )
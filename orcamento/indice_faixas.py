@@ -0,0 +1,122 @@
+"""
+Índice ordenado para as consultas por faixa das tabelas de preço.
+
+As tabelas da planilha são consultadas como PROCV aproximado: "maior chave
+menor ou igual a x" (metragem, largura do coeficiente, fita, corte especial)
+ou "menor chave maior ou igual a x" (largura do acabamento), cada uma com a
+sua regra de fallback. O IndiceFaixas guarda as chaves ordenadas e responde
+com bisect em O(log n).
+"""
+from bisect import bisect_left, bisect_right
+
+# Modos de busca
+PISO = 'piso'      # maior chave <= x
+TETO = 'teto'      # menor chave >= x
+
+# Fallbacks quando a busca não encontra nada
+PRIMEIRO = 'primeiro'  # menor chave do índice
+ULTIMO = 'ultimo'      # maior chave do índice
+
+
+class IndiceFaixas:
+    """
+    Chaves ordenadas + valores correspondentes, imutável após criado.
+    Chaves repetidas ficam com o primeiro valor informado.
+    """
+    __slots__ = ('chaves', 'valores', 'modo', 'fallback')
+
+    def __init__(self, pares, modo=PISO, fallback=None):
+        if modo not in (PISO, TETO):
+            raise ValueError(f'Modo de busca inválido: {modo}')
+        if fallback not in (None, PRIMEIRO, ULTIMO):
+            raise ValueError(f'Fallback inválido: {fallback}')
+
+        chaves = []
+        valores = []
+        for chave, valor in sorted(pares, key=lambda par: par[0]):
+            if chaves and chaves[-1] == chave:
+                continue
+            chaves.append(chave)
+            valores.append(valor)
+
+        self.chaves = tuple(chaves)
+        self.valores = tuple(valores)
+        self.modo = modo
+        self.fallback = fallback
+
+    def __len__(self):
+        return len(self.chaves)
+
+    def __repr__(self):
+        return f'<IndiceFaixas {self.modo} n={len(self.chaves)}>'
+
+    def piso(self, x):
+        """Posição da maior chave <= x, ou None"""
+        pos = bisect_right(self.chaves, x) - 1
+        return pos if pos >= 0 else None
+
+    def teto(self, x):
+        """Posição da menor chave >= x, ou None"""
+        pos = bisect_left(self.chaves, x)
+        return pos if pos < len(self.chaves) else None
+
+    def posicao(self, x):
+        """Posição resolvida para x aplicando o modo e o fallback do índice"""
+        pos = self.piso(x) if self.modo == PISO else self.teto(x)
+        if pos is None and self.chaves:
+            if self.fallback == PRIMEIRO:
+                pos = 0
+            elif self.fallback == ULTIMO:
+                pos = len(self.chaves) - 1
+        return pos
+
+    def buscar(self, x):
+        """Retorna (chave, valor) resolvido para x, ou None"""
+        pos = self.posicao(x)
+        if pos is None:
+            return None
+        return self.chaves[pos], self.valores[pos]
+
+    def valor(self, x, padrao=None):
+        """Retorna apenas o valor resolvido para x (ou o padrão)"""
+        pos = self.posicao(x)
+        return self.valores[pos] if pos is not None else padrao
+
+
+def faixas_alteradas(antigo, novo):
+    """
+    Intervalos de x em que os dois índices (mesmo modo e fallback) resolvem
+    valores diferentes. Retorna [(inicio, fim), ...] com None nas pontas
+    abertas: [inicio, fim) no modo PISO e (inicio, fim] no modo TETO.
+    As chaves precisam ser numéricas.
+    """
+    if (antigo.modo, antigo.fallback) != (novo.modo, novo.fallback):
+        raise ValueError('Índices com modo ou fallback diferentes')
+
+    pontos = sorted(set(antigo.chaves) | set(novo.chaves))
+    if not pontos:
+        return []
+
+    # Entre dois pontos consecutivos o resultado dos dois índices é constante,
+    # então basta comparar uma amostra de cada segmento
+    if antigo.modo == PISO:
+        segmentos = [(None, pontos[0], pontos[0] - 1)]
+        segmentos += [
+            (p, pontos[i + 1] if i + 1 < len(pontos) else None, p)
+            for i, p in enumerate(pontos)
+        ]
+    else:
+        segmentos = [(None, pontos[0], pontos[0])]
+        segmentos += [(pontos[i - 1], p, p) for i, p in enumerate(pontos) if i > 0]
+        segmentos += [(pontos[-1], None, pontos[-1] + 1)]
+
+    faixas = []
+    for inicio, fim, amostra in segmentos:
+        if antigo.valor(amostra) == novo.valor(amostra):
+            continue
+        if faixas and faixas[-1][1] == inicio:
+            # Segmento contíguo ao anterior: estende a faixa
+            faixas[-1] = (faixas[-1][0], fim)
+        else:
+            faixas.append((inicio, fim))
+    return faixas
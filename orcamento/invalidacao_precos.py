@@ -0,0 +1,140 @@
+"""
+Invalidação do snapshot de preços entre processos.
+
+Com vários workers (gunicorn), os signals só invalidam o snapshot do processo
+que fez a alteração; os demais continuariam com os preços antigos. Cada
+processo guarda a versão global vista ao carregar o snapshot e a compara com
+a do backend no máximo uma vez a cada PRECOS_INVALIDACAO_INTERVALO segundos;
+se mudou, o próximo obter_snapshot() recarrega as tabelas.
+
+Backends (PRECOS_INVALIDACAO_BACKEND):
+- BackendBanco (padrão): lê VersaoPrecos, uma consulta de uma linha.
+- BackendRedis: contador no Redis (PRECOS_INVALIDACAO_REDIS_URL), incrementado
+  após o commit de cada versão nova; não consulta o banco. Requer o pacote redis.
+- BackendArquivo: arquivo (PRECOS_INVALIDACAO_ARQUIVO) regravado após cada
+  versão nova; a verificação é um stat(), sem banco nem rede. Só vale para
+  workers na mesma máquina (ou sistema de arquivos compartilhado).
+
+Com Redis ou arquivo, uma alteração confirmada por um processo que morra
+antes de publicar só é vista pelos outros na próxima publicação.
+"""
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+from .models import VersaoPrecos
+
+BACKEND_PADRAO = 'orcamento.invalidacao_precos.BackendBanco'
+
+
+class BackendBanco:
+    """Versão lida da linha única de VersaoPrecos"""
+
+    def versao(self):
+        return VersaoPrecos.objects.filter(pk=1).values_list('versao', flat=True).first() or 0
+
+    def publicar(self):
+        # A própria transação já gravou a versão nova
+        pass
+
+
+class BackendRedis:
+    CHAVE = 'orcamento:precos:versao'
+
+    def __init__(self):
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured('BackendRedis requer o pacote redis (pip install redis)')
+        url = getattr(settings, 'PRECOS_INVALIDACAO_REDIS_URL', 'redis://127.0.0.1:6379/0')
+        self.cliente = redis.Redis.from_url(url, socket_timeout=1)
+        self.erros = redis.RedisError
+
+    def versao(self):
+        try:
+            return ('redis', int(self.cliente.get(self.CHAVE) or 0))
+        except self.erros:
+            # Redis fora do ar: volta a consultar o banco até ele voltar
+            return ('banco', BackendBanco().versao())
+
+    def publicar(self):
+        # INCR e não SET da versão: publicações fora de ordem continuam mudando o valor
+        try:
+            self.cliente.incr(self.CHAVE)
+        except self.erros:
+            pass
+
+
+class BackendArquivo:
+    def __init__(self):
+        caminho = getattr(settings, 'PRECOS_INVALIDACAO_ARQUIVO', None)
+        if not caminho:
+            raise ImproperlyConfigured('BackendArquivo requer PRECOS_INVALIDACAO_ARQUIVO')
+        self.caminho = os.fspath(caminho)
+
+    def versao(self):
+        try:
+            info = os.stat(self.caminho)
+        except FileNotFoundError:
+            return None
+        return (info.st_ino, info.st_mtime_ns, info.st_size)
+
+    def publicar(self):
+        # Arquivo novo trocado por os.replace: muda o inode mesmo se o mtime
+        # tiver pouca resolução
+        temporario = f'{self.caminho}.{os.getpid()}.{threading.get_ident()}'
+        with open(temporario, 'w') as arquivo:
+            arquivo.write(f'{time.time_ns()}\n')
+        os.replace(temporario, self.caminho)
+
+
+class VerificadorVersao:
+    """Consulta o backend no máximo uma vez por intervalo e guarda o último valor"""
+
+    def __init__(self, backend, intervalo):
+        self.backend = backend
+        self.intervalo = intervalo
+        self._ultima = None
+        self._proxima = 0.0
+
+    def versao(self, forcar=False):
+        agora = time.monotonic()
+        if forcar or agora >= self._proxima:
+            self._ultima = self.backend.versao()
+            self._proxima = agora + self.intervalo
+        return self._ultima
+
+    def publicar(self):
+        self.backend.publicar()
+
+
+_verificador = None
+_verificador_lock = threading.Lock()
+
+
+def obter_verificador():
+    """Verificador do processo, criado na primeira chamada com as configurações atuais"""
+    global _verificador
+    if _verificador is None:
+        with _verificador_lock:
+            if _verificador is None:
+                backend = import_string(getattr(settings, 'PRECOS_INVALIDACAO_BACKEND', BACKEND_PADRAO))
+                _verificador = VerificadorVersao(
+                    backend(), getattr(settings, 'PRECOS_INVALIDACAO_INTERVALO', 2))
+    return _verificador
+
+
+def reiniciar_verificador():
+    """Descarta o verificador; o próximo acesso relê as configurações"""
+    global _verificador
+    with _verificador_lock:
+        _verificador = None
+
+
+def publicar_versao():
+    """Avisa os outros processos de uma versão nova (chamado após o commit)"""
+    obter_verificador().publicar()
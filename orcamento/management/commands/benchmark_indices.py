@@ -0,0 +1,150 @@
+import statistics
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count, Sum
+
+from orcamento.busca import normalizar_busca
+from orcamento.massa_dados import gerar_orcamentos, orcamentos_massa, remover_massa, vendedores_massa
+from orcamento.models import Orcamento, HistoricoStatusOrcamento
+from orcamento.resumos import resumo_status
+from orcamento.vendas_mensais import reconstruir_vendas_mensais
+
+
+class Command(BaseCommand):
+    help = ('Gera uma massa de orçamentos e compara planos (EXPLAIN) e tempos das '
+            'consultas da listagem e dashboards sem e com os índices')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--quantidade', type=int, default=1_000_000,
+                            help='Orçamentos sintéticos na massa (padrão 1.000.000)')
+        parser.add_argument('--repeticoes', type=int, default=5,
+                            help='Execuções por consulta; mostra a mediana (padrão 5)')
+        parser.add_argument('--lote', type=int, default=5000, help='Tamanho do bulk_create')
+        parser.add_argument('--sem-explain', action='store_true', help='Não imprime os planos')
+        parser.add_argument('--remover', action='store_true',
+                            help='Remove a massa sintética ao final')
+
+    # ---------- Massa ----------
+
+    def _preparar_massa(self, quantidade, lote):
+        existentes = orcamentos_massa().count()
+        if existentes >= quantidade:
+            self.stdout.write(f'Massa existente: {existentes} orçamentos')
+            return
+        faltam = quantidade - existentes
+        self.stdout.write(f'Gerando {faltam} orçamentos sintéticos...')
+        inicio = time.monotonic()
+
+        def progresso(inseridos):
+            if inseridos % (lote * 20) == 0 or inseridos == faltam:
+                taxa = inseridos / (time.monotonic() - inicio)
+                self.stdout.write(f'  {inseridos}/{faltam} ({taxa:.0f} orc/s)')
+
+        gerar_orcamentos(faltam, lote=lote, semente=existentes, progresso=progresso)
+        reconstruir_vendas_mensais()
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    # ---------- Índices ----------
+
+    def _indices(self):
+        return [(Orcamento, indice) for indice in Orcamento._meta.indexes] + [
+            (HistoricoStatusOrcamento, indice) for indice in HistoricoStatusOrcamento._meta.indexes
+        ]
+
+    def _remover_indices(self):
+        with connection.schema_editor() as editor:
+            for modelo, indice in self._indices():
+                editor.remove_index(modelo, indice)
+            if connection.vendor == 'postgresql':
+                editor.execute('DROP INDEX IF EXISTS orc_cliente_busca_trgm_idx')
+
+    def _criar_indices(self):
+        with connection.schema_editor() as editor:
+            for modelo, indice in self._indices():
+                editor.add_index(modelo, indice)
+            if connection.vendor == 'postgresql':
+                editor.execute(
+                    'CREATE INDEX IF NOT EXISTS orc_cliente_busca_trgm_idx '
+                    'ON orcamento_orcamento USING gin (cliente_busca gin_trgm_ops)'
+                )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    # ---------- Consultas ----------
+
+    def _consultas(self):
+        """(nome, queryset para EXPLAIN, função que executa a consulta real sem cache)"""
+        mes_atual = date.today().replace(day=1)
+        vendedor = vendedores_massa(1)[0]
+        ativos = Orcamento.objects.filter(ativo=True)
+        lista = ativos.select_related('tipo_material', 'vendedor').order_by('-data_emissao', '-id')
+        por_status = ativos.values('status').annotate(total=Count('pk')).order_by()
+        do_vendedor = Orcamento.objects.filter(
+            vendedor=vendedor, ativo=True, data_emissao__gte=mes_atual)
+        recentes = ativos.order_by('-criado_em')[:10]
+        aguardando = lista.filter(status='aguardando')[:21]
+        busca = lista.filter(cliente_busca__contains=normalizar_busca('Conceição 12'))[:21]
+        orcamento_id = orcamentos_massa().values_list('pk', flat=True).first()
+        historico = HistoricoStatusOrcamento.objects.filter(
+            orcamento_id=orcamento_id).order_by('-data_mudanca')
+
+        return [
+            ('Listagem (1ª página)', lista[:21], lambda: list(lista[:21])),
+            ('Contagens por status', por_status, lambda: resumo_status(ativos, mes_atual)),
+            ('Vendedor no mês', do_vendedor,
+             lambda: do_vendedor.aggregate(total=Count('pk'), valor=Sum('valor_total'))),
+            ('Orçamentos recentes', recentes, lambda: list(recentes.all())),
+            ('Filtro por status', aguardando, lambda: list(aguardando.all())),
+            ('Busca por cliente', busca, lambda: list(busca.all())),
+            ('Histórico de status', historico, lambda: list(historico.all())),
+        ]
+
+    def _medir(self, consultas, repeticoes, explain):
+        resultados = {}
+        for nome, queryset, executar in consultas:
+            tempos = []
+            for _ in range(repeticoes):
+                inicio = time.perf_counter()
+                executar()
+                tempos.append((time.perf_counter() - inicio) * 1000)
+            resultados[nome] = statistics.median(tempos)
+            self.stdout.write(f'  {nome}: {resultados[nome]:.2f} ms')
+            if explain:
+                for linha in queryset.explain().splitlines():
+                    self.stdout.write(f'      {linha}')
+        return resultados
+
+    def handle(self, *args, **options):
+        self._preparar_massa(options['quantidade'], options['lote'])
+        total = Orcamento.objects.count()
+        self.stdout.write(f'Orçamentos na tabela: {total} ({connection.vendor})')
+        self.stdout.write('=' * 60)
+
+        consultas = self._consultas()
+        explain = not options['sem_explain']
+
+        self._remover_indices()
+        try:
+            self.stdout.write(self.style.WARNING('\nSEM índices'))
+            sem = self._medir(consultas, options['repeticoes'], explain)
+        finally:
+            self._criar_indices()
+
+        self.stdout.write(self.style.SUCCESS('\nCOM índices'))
+        com = self._medir(consultas, options['repeticoes'], explain)
+
+        self.stdout.write('\n' + '=' * 60)
+        self.stdout.write(f'{"Consulta":<32}{"sem (ms)":>10}{"com (ms)":>10}{"ganho":>8}')
+        for nome, _, _ in consultas:
+            ganho = sem[nome] / com[nome] if com[nome] else 0
+            self.stdout.write(f'{nome:<32}{sem[nome]:>10.2f}{com[nome]:>10.2f}{ganho:>7.1f}x')
+
+        if options['remover']:
+            removidos = remover_massa()
+            reconstruir_vendas_mensais()
+            self.stdout.write(f'\nMassa removida: {removidos} orçamentos')
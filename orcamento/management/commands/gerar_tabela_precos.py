@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from orcamento.forms import MatrizPrecosForm
+from orcamento.matriz_precos import CAMPOS_MATRIZ, FORMATOS, exportar
+from orcamento.models import Orcamento, TipoMaterial, TipoCorte, Acabamento
+
+
+class Command(BaseCommand):
+    help = ('Gera a tabela de preços de venda (larguras x metragens por comprimento) de um '
+            'material, corte e acabamento em CSV, XLSX ou HTML')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--material', required=True, help='ID ou código do tipo de material')
+        parser.add_argument('--corte', required=True, help='ID ou código do tipo de corte')
+        parser.add_argument('--acabamento', help='ID ou código do acabamento (padrão: nenhum)')
+        parser.add_argument('--tipo-cliente', default='comercio_novo',
+                            choices=[t for t, _ in Orcamento.TIPO_CLIENTE_CHOICES])
+        parser.add_argument('--ultrassonico', action='store_true', help='Com ultrassônico')
+        parser.add_argument('--larguras', default='',
+                            help='Larguras em mm separadas por vírgula (padrão: tabela de coeficientes)')
+        parser.add_argument('--metragens', default='',
+                            help='Metragens separadas por vírgula (padrão: tabela de preços do material)')
+        parser.add_argument('--comprimentos', default='40',
+                            help='Comprimentos em mm separados por vírgula (padrão 40)')
+        parser.add_argument('--campo', default='valor_milheiro', choices=[c for c, _ in CAMPOS_MATRIZ])
+        parser.add_argument('--formato', default='csv', choices=list(FORMATOS))
+        parser.add_argument('--saida', help='Arquivo de saída (padrão: saída padrão)')
+
+    def _pk(self, modelo, valor, descricao):
+        filtro = Q(pk=int(valor)) if valor.isdigit() else Q(codigo__iexact=valor)
+        pk = modelo.objects.filter(filtro).values_list('pk', flat=True).first()
+        if pk is None:
+            raise CommandError(f'{descricao} não encontrado: {valor}')
+        return pk
+
+    def handle(self, *args, **options):
+        form = MatrizPrecosForm({
+            'tipo_material': self._pk(TipoMaterial, options['material'], 'Tipo de material'),
+            'tipo_corte': self._pk(TipoCorte, options['corte'], 'Tipo de corte'),
+            'acabamento': (self._pk(Acabamento, options['acabamento'], 'Acabamento')
+                           if options['acabamento'] else ''),
+            'tipo_cliente': options['tipo_cliente'],
+            'tem_ultrassonico': options['ultrassonico'],
+            'larguras': options['larguras'],
+            'metragens': options['metragens'],
+            'comprimentos': options['comprimentos'],
+            'campo': options['campo'],
+        })
+        if not form.is_valid():
+            erros = [f'{campo}: {" ".join(mensagens)}' for campo, mensagens in form.errors.items()]
+            raise CommandError('; '.join(erros))
+
+        if options['formato'] == 'xlsx' and not options['saida']:
+            raise CommandError('--formato xlsx exige --saida')
+
+        conteudo = exportar(options['formato'], **form.parametros())
+        if options['saida']:
+            with open(options['saida'], 'wb') as arquivo:
+                arquivo.write(conteudo)
+            self.stderr.write(self.style.SUCCESS(f'Tabela gravada em {options["saida"]}'))
+        else:
+            self.stdout.write(conteudo.decode('utf-8-sig'), ending='')
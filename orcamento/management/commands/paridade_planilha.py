@@ -0,0 +1,109 @@
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+
+from orcamento.calculadora import CalculadoraOrcamento
+from orcamento.paridade import avaliar, carregar_casos, comparar, erros_avaliacao, salvar_casos
+from orcamento.snapshot_precos import obter_snapshot
+
+PLANILHAS_PADRAO = [
+    'futuraDesprotegidaModelo1.xlsx', 'futuraDesprotegidaModelo2.xlsx',
+    'futuraDesprotegidaModelo3.xlsx', 'ATUAL.xlsx',
+]
+
+
+class Command(BaseCommand):
+    help = ('Compara a calculadora com os valores gravados nas planilhas originais '
+            '(resultado e passos do debug_info) e, com --calculadora, uma implementação '
+            'candidata com a atual')
+
+    def add_arguments(self, parser):
+        parser.add_argument('caminhos', nargs='*',
+                            help='Planilhas .xlsx, pastas com planilhas ou casos .json '
+                                 '(padrão: as planilhas modelo da raiz do projeto)')
+        parser.add_argument('--salvar-casos', help='Grava os casos extraídos neste arquivo JSON')
+        parser.add_argument('--calculadora',
+                            help='Caminho de uma classe com a interface de CalculadoraOrcamento '
+                                 'a comparar com a atual (ex: pacote.modulo.Classe)')
+        parser.add_argument('--tolerancia', type=float, default=1e-6,
+                            help='Diferença relativa aceita contra a planilha (padrão 1e-6)')
+        parser.add_argument('--mostrar', type=int, default=20,
+                            help='Divergências listadas (padrão 20)')
+        parser.add_argument('--estrito', action='store_true',
+                            help='Falha (código de saída 1) se houver divergência com a planilha')
+
+    def _casos(self, caminhos):
+        caminhos = caminhos or [
+            Path(settings.BASE_DIR) / nome for nome in PLANILHAS_PADRAO
+            if (Path(settings.BASE_DIR) / nome).exists()
+        ]
+        if not caminhos:
+            raise CommandError('Nenhuma planilha informada ou encontrada na raiz do projeto')
+        inicio = time.monotonic()
+        try:
+            casos = carregar_casos(caminhos)
+        except (OSError, KeyError, ValueError, TypeError) as e:
+            raise CommandError(f'Erro ao ler os casos: {e}')
+        self.stdout.write(f'{len(casos)} casos lidos em {time.monotonic() - inicio:.2f}s')
+        return casos
+
+    def _relatorio(self, titulo, divergencias, total_casos, mostrar):
+        self.stdout.write(f'\n{titulo}')
+        if not divergencias:
+            self.stdout.write(self.style.SUCCESS('  sem divergências'))
+            return
+        por_etapa = defaultdict(list)
+        for divergencia in divergencias:
+            por_etapa[divergencia.etapa].append(divergencia)
+        self.stdout.write(f'  {"Etapa":<36}{"casos":>8}{"maior dif. rel.":>18}')
+        for etapa, lista in por_etapa.items():
+            maior = max(d.diferenca_relativa for d in lista)
+            self.stdout.write(f'  {etapa:<36}{len(lista):>4}/{total_casos:<3}{maior:>18.3%}')
+        for d in divergencias[:mostrar]:
+            self.stdout.write(self.style.ERROR(
+                f'  {d.origem} | {d.etapa}: esperado {d.esperado} / obtido {d.obtido}'))
+
+    def handle(self, *args, **options):
+        casos = self._casos(options['caminhos'])
+        if options['salvar_casos']:
+            salvar_casos(casos, options['salvar_casos'])
+            self.stdout.write(f'Casos gravados em {options["salvar_casos"]}')
+
+        snapshot = obter_snapshot()
+        atual, segundos = avaliar(casos, CalculadoraOrcamento, snapshot)
+        self.stdout.write(
+            f'CalculadoraOrcamento: {len(casos)} casos em {segundos * 1000:.2f} ms '
+            f'({segundos / max(len(casos), 1) * 1e6:.0f} µs/caso)')
+        for origem, mensagem in erros_avaliacao(atual).items():
+            self.stdout.write(self.style.ERROR(f'  [ERRO] {origem}: {mensagem}'))
+
+        esperados = {caso.origem: caso.esperados() for caso in casos}
+        divergencias = comparar(esperados, atual, options['tolerancia'])
+        self._relatorio('Planilha x CalculadoraOrcamento', divergencias, len(casos), options['mostrar'])
+
+        if options['calculadora']:
+            try:
+                classe = import_string(options['calculadora'])
+            except ImportError as e:
+                raise CommandError(str(e))
+            candidata, segundos_candidata = avaliar(casos, classe, snapshot)
+            self.stdout.write(
+                f'\n{classe.__name__}: {len(casos)} casos em {segundos_candidata * 1000:.2f} ms '
+                f'(atual: {segundos * 1000:.2f} ms)')
+            for origem, mensagem in erros_avaliacao(candidata).items():
+                self.stdout.write(self.style.ERROR(f'  [ERRO] {origem}: {mensagem}'))
+            # Reescrita precisa ser idêntica à atual em todos os passos
+            divergencias_candidata = comparar(atual, candidata, tolerancia=0)
+            self._relatorio(f'CalculadoraOrcamento x {classe.__name__}', divergencias_candidata,
+                            len(casos), options['mostrar'])
+            if divergencias_candidata or erros_avaliacao(candidata):
+                raise CommandError(
+                    f'{classe.__name__} diverge da calculadora atual em '
+                    f'{len(divergencias_candidata)} valores')
+
+        if options['estrito'] and (divergencias or erros_avaliacao(atual)):
+            raise CommandError(f'{len(divergencias)} divergências com a planilha')
@@ -1,43 +1,73 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+
+from orcamento.management.filtros import adicionar_filtros, filtrar_orcamentos
 from orcamento.models import Orcamento
-import traceback
+from orcamento.recalculo import recalcular_orcamentos, TAMANHO_LOTE_PADRAO
+from orcamento.versao_precos import versao_atual
+
 
 class Command(BaseCommand):
-    help = 'Recalcula todos os orçamentos existentes'
+    help = 'Recalcula os orçamentos existentes em lotes (bulk_update), opcionalmente em paralelo'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Calcula e conta as diferenças sem gravar')
+        adicionar_filtros(parser)
+        parser.add_argument('--pendentes', action='store_true',
+                            help='Apenas orçamentos abertos calculados com outra versão dos preços '
+                                 '(reprecificação que falhou ou foi interrompida)')
+        parser.add_argument('--chunk-size', type=int, default=TAMANHO_LOTE_PADRAO,
+                            help=f'Orçamentos por lote (padrão {TAMANHO_LOTE_PADRAO})')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Processos em paralelo (padrão 1). Use com PostgreSQL; '
+                                 'no SQLite as gravações concorrentes são serializadas')
 
     def handle(self, *args, **options):
-        self.stdout.write('Recalculando orcamentos...')
+        queryset = filtrar_orcamentos(Orcamento.objects.all(), options)
+        if options['pendentes']:
+            queryset = queryset.filter(status__in=Orcamento.STATUS_ABERTOS).exclude(
+                versao_precos=versao_atual())
+
+        if options['chunk_size'] < 1 or options['workers'] < 1:
+            raise CommandError('--chunk-size e --workers devem ser maiores que zero')
+
+        total = queryset.count()
+        modo = ' (dry-run, nada será gravado)' if options['dry_run'] else ''
+        self.stdout.write(f'Recalculando {total} orcamentos{modo}...')
         self.stdout.write('=' * 60)
-        
-        orcamentos = Orcamento.objects.all()
-        total = orcamentos.count()
-        
-        self.stdout.write(f'Encontrados {total} orcamentos')
-        
-        sucesso = 0
-        erro = 0
-        
-        for i, orcamento in enumerate(orcamentos, 1):
-            self.stdout.write(f'\n[{i}/{total}] Orcamento #{orcamento.id} - {orcamento.cliente}')
-            self.stdout.write(f'  Antes: Total = R$ {orcamento.valor_total}, Unidades = {orcamento.quantidade_unidades}')
-            
-            try:
-                # Recalcula valores
-                orcamento.calcular_valores()
-                orcamento.save()
-                
-                # Recarrega do banco
-                orcamento.refresh_from_db()
-                
-                self.stdout.write(f'  Depois: Total = R$ {orcamento.valor_total}, Unidades = {orcamento.quantidade_unidades}')
-                self.stdout.write(self.style.SUCCESS('  [OK] Recalculado com sucesso'))
-                sucesso += 1
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f'  [ERRO] {e}'))
-                self.stdout.write(traceback.format_exc())
-                erro += 1
-        
+
+        verbosidade = options['verbosity']
+
+        def progresso(resumo):
+            if verbosidade < 1 or not total:
+                return
+            taxa = resumo['processados'] / resumo['segundos'] if resumo['segundos'] else 0
+            self.stdout.write(
+                f'  [{resumo["processados"]}/{total}] '
+                f'{resumo["processados"] * 100 / total:.1f}% - '
+                f'{resumo["alterados"]} alterados - {taxa:.0f} orc/s'
+            )
+
+        resumo = recalcular_orcamentos(
+            queryset,
+            tamanho_lote=options['chunk_size'],
+            workers=options['workers'],
+            dry_run=options['dry_run'],
+            progresso=progresso,
+        )
+
+        segundos = resumo['segundos']
+        taxa = resumo['processados'] / segundos if segundos else 0
+
         self.stdout.write('\n' + '=' * 60)
-        self.stdout.write(self.style.SUCCESS(f'\nConcluido!'))
-        self.stdout.write(f'  Sucesso: {sucesso}')
-        self.stdout.write(f'  Erros: {erro}')
+        self.stdout.write(self.style.SUCCESS('Concluido!'))
+        self.stdout.write(f'  Processados: {resumo["processados"]}')
+        self.stdout.write(f'  Alterados: {resumo["alterados"]}'
+                          + (' (não gravados)' if options['dry_run'] else ''))
+        self.stdout.write(f'  Erros: {len(resumo["erros"])}')
+        self.stdout.write(f'  Tempo: {segundos:.1f}s ({taxa:.0f} orc/s)')
+
+        for pk, mensagem in resumo['erros'][:20]:
+            self.stdout.write(self.style.ERROR(f'  [ERRO] Orcamento #{pk}: {mensagem}'))
+        if len(resumo['erros']) > 20:
+            self.stdout.write(f'  ... e mais {len(resumo["erros"]) - 20} erros')
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from orcamento.vendas_mensais import reconstruir_vendas_mensais
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói o resumo mensal de vendas por vendedor a partir dos orçamentos'
+
+    def handle(self, *args, **options):
+        linhas = reconstruir_vendas_mensais()
+        self.stdout.write(self.style.SUCCESS(f'Resumo de vendas reconstruído: {linhas} linhas'))
@@ -0,0 +1,86 @@
+import time
+from decimal import Decimal, InvalidOperation
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from orcamento.calculadora_vetorial import CalculadoraVetorial, carregar_colunas
+from orcamento.management.filtros import adicionar_filtros, filtrar_orcamentos, ids_materiais
+from orcamento.models import Orcamento
+from orcamento.snapshot_precos import obter_snapshot
+
+
+class Command(BaseCommand):
+    help = ('Simula um reajuste percentual da tabela de preços sobre os orçamentos '
+            'existentes (calculadora vetorizada, nada é gravado)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--percentual', required=True,
+                            help='Reajuste da tabela de preços em %% (ex: 3 ou -2.5)')
+        adicionar_filtros(parser)
+
+    def _somar_por(self, chaves, valores):
+        """{chave: (quantidade, soma)} agrupando valores pela chave de cada linha"""
+        distintas, inverso = np.unique(chaves, return_inverse=True)
+        inverso = inverso.reshape(-1)
+        quantidades = np.bincount(inverso, minlength=len(distintas))
+        somas = np.bincount(inverso, weights=valores, minlength=len(distintas))
+        return {
+            chave: (int(quantidade), soma)
+            for chave, quantidade, soma in zip(distintas.tolist(), quantidades, somas)
+        }
+
+    def handle(self, *args, **options):
+        try:
+            percentual = Decimal(options['percentual'])
+        except InvalidOperation:
+            raise CommandError('--percentual deve ser um número')
+        fator = 1 + percentual / 100
+
+        queryset = filtrar_orcamentos(Orcamento.objects.all(), options)
+        materiais = ids_materiais(options['material']) if options['material'] else None
+
+        inicio = time.monotonic()
+        colunas = carregar_colunas(queryset, extras=['status'])
+        leitura = time.monotonic() - inicio
+
+        inicio = time.monotonic()
+        snapshot = obter_snapshot()
+        atual = CalculadoraVetorial(snapshot).calcular(colunas)['valor_total']
+        simulado = CalculadoraVetorial(
+            snapshot.reajustado(fator, materiais=materiais)
+        ).calcular(colunas)['valor_total']
+        calculo = time.monotonic() - inicio
+
+        total = len(atual)
+        self.stdout.write(
+            f'Reajuste de {percentual}% na tabela de preços'
+            + (f' (materiais {sorted(materiais)})' if materiais else '')
+        )
+        self.stdout.write(f'{total} orçamentos - leitura {leitura:.2f}s, cálculo {calculo:.2f}s')
+        self.stdout.write('=' * 60)
+        if not total:
+            return
+
+        soma_atual, soma_simulada = atual.sum(), simulado.sum()
+        variacao = (soma_simulada / soma_atual - 1) * 100 if soma_atual else 0
+        self.stdout.write(f'  Tabela vigente: R$ {soma_atual:>16,.2f}')
+        self.stdout.write(f'  Total simulado: R$ {soma_simulada:>16,.2f}')
+        self.stdout.write(f'  Diferença:      R$ {soma_simulada - soma_atual:>16,.2f} ({variacao:+.2f}%)')
+        self.stdout.write(f'  Orçamentos alterados: {int(np.count_nonzero(simulado != atual))}')
+
+        nomes = {pk: nome for pk, (nome, _) in snapshot.materiais.items()}
+        agrupamentos = [
+            ('Por material', colunas['tipo_material_id'], nomes.get),
+            ('Por status', colunas['status'], dict(Orcamento.STATUS_CHOICES).get),
+        ]
+        for titulo, chaves, rotulo in agrupamentos:
+            self.stdout.write(f'\n{titulo}:')
+            antes = self._somar_por(chaves, atual)
+            depois = self._somar_por(chaves, simulado)
+            for chave, (quantidade, soma) in antes.items():
+                diferenca = depois[chave][1] - soma
+                self.stdout.write(
+                    f'  {str(rotulo(chave) or chave):<24}{quantidade:>9} orç.  '
+                    f'R$ {soma:>14,.2f} -> {depois[chave][1]:>14,.2f}  ({diferenca:+,.2f})'
+                )
@@ -0,0 +1,103 @@
+import json
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from orcamento.carga import FLUXOS, executar_carga
+from orcamento.massa_dados import gerar_orcamentos, orcamentos_massa, usuarios_carga
+from orcamento.models import TabelaPreco
+from orcamento.vendas_mensais import reconstruir_vendas_mensais
+
+
+class Command(BaseCommand):
+    help = ('Teste de carga por HTTP dos fluxos de orçamento (login, listagem, detalhe, '
+            'pré-visualização, criação/edição com cores, status e dashboards) contra um '
+            'servidor no ar que use o mesmo banco; mostra p50/p95/p99, vazão e consultas '
+            'por endpoint')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000',
+                            help='Endereço do servidor (padrão http://127.0.0.1:8000)')
+        parser.add_argument('--usuarios', type=int, default=10,
+                            help='Usuários virtuais simultâneos (padrão 10)')
+        parser.add_argument('--duracao', type=float, default=60, help='Segundos de carga (padrão 60)')
+        parser.add_argument('--vendedores', type=int, default=10,
+                            help='Contas de vendedor da massa usadas no login (padrão 10)')
+        parser.add_argument('--senha', default='carga-massa',
+                            help='Senha gravada nas contas da massa')
+        parser.add_argument('--pesos', default='',
+                            help='Mistura de ações, ex: listar=30,calcular=50 (padrão: todas, ver carga.FLUXOS)')
+        parser.add_argument('--semente', type=int, default=0, help='Semente dos sorteios')
+        parser.add_argument('--preparar', action='store_true',
+                            help='Popula as tabelas de preço se vazias e completa a massa de orçamentos')
+        parser.add_argument('--quantidade', type=int, default=100_000,
+                            help='Orçamentos sintéticos com --preparar (padrão 100.000)')
+        parser.add_argument('--json', help='Grava o relatório também neste arquivo JSON')
+
+    def _pesos(self, texto):
+        if not texto:
+            return FLUXOS
+        pesos = {}
+        for item in texto.split(','):
+            acao, _, peso = item.partition('=')
+            acao = acao.strip()
+            if acao not in FLUXOS:
+                raise CommandError(f'Ação desconhecida: {acao} (opções: {", ".join(FLUXOS)})')
+            try:
+                pesos[acao] = int(peso)
+            except ValueError:
+                raise CommandError(f'Peso inválido para {acao}: {peso!r}')
+        return pesos
+
+    def _preparar(self, quantidade, vendedores):
+        if not TabelaPreco.objects.exists():
+            self.stdout.write('Tabelas de preço vazias: populando pela planilha...')
+            call_command('popular_dados_planilha', stdout=self.stdout)
+        faltam = quantidade - orcamentos_massa().count()
+        if faltam > 0:
+            self.stdout.write(f'Gerando {faltam} orçamentos sintéticos...')
+            inicio = time.monotonic()
+            gerar_orcamentos(faltam, semente=quantidade - faltam, vendedores=vendedores)
+            reconstruir_vendas_mensais()
+            self.stdout.write(f'  concluído em {time.monotonic() - inicio:.0f}s')
+
+    def handle(self, *args, **options):
+        pesos = self._pesos(options['pesos'])
+        if options['preparar']:
+            self._preparar(options['quantidade'], options['vendedores'])
+        usuarios = usuarios_carga(options['senha'], options['vendedores'])
+
+        self.stdout.write(
+            f'{options["usuarios"]} usuários virtuais contra {options["url"]} '
+            f'por {options["duracao"]:.0f}s...')
+        medicoes, segundos = executar_carga(
+            options['url'], usuarios, options['senha'], options['usuarios'], options['duracao'],
+            pesos=pesos, semente=options['semente'],
+        )
+        linhas = medicoes.relatorio(segundos)
+
+        self.stdout.write('=' * 100)
+        self.stdout.write(
+            f'{"Endpoint":<26}{"req":>7}{"erros":>7}{"req/s":>8}'
+            f'{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"consultas":>11}{"máx":>6}')
+        for linha in linhas:
+            consultas = f'{linha["consultas"]:.1f}' if linha['consultas'] is not None else '-'
+            maximo = linha['consultas_max'] if linha['consultas_max'] is not None else '-'
+            self.stdout.write(
+                f'{linha["endpoint"]:<26}{linha["requisicoes"]:>7}{linha["erros"]:>7}'
+                f'{linha["rps"]:>8.1f}{linha["p50_ms"]:>9.1f}{linha["p95_ms"]:>9.1f}'
+                f'{linha["p99_ms"]:>9.1f}{consultas:>11}{maximo:>6}')
+        if linhas[-1]['consultas'] is None:
+            self.stdout.write(self.style.WARNING(
+                'Sem X-Consultas nas respostas: rode o servidor com CONTAR_CONSULTAS = True'))
+        for falha, vezes in sorted(medicoes.falhas.items()):
+            self.stdout.write(self.style.ERROR(f'Falha no usuário virtual ({falha}): {vezes}x'))
+
+        if options['json']:
+            with open(options['json'], 'w', encoding='utf-8') as arquivo:
+                json.dump({
+                    'url': options['url'], 'usuarios': options['usuarios'],
+                    'segundos': round(segundos, 2), 'pesos': pesos, 'endpoints': linhas,
+                }, arquivo, ensure_ascii=False, indent=2)
+            self.stdout.write(f'Relatório gravado em {options["json"]}')
@@ -0,0 +1,84 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from orcamento.calculadora import CalculadoraOrcamento
+from orcamento.calculadora_vetorial import CASAS, CalculadoraVetorial, carregar_colunas
+from orcamento.management.filtros import adicionar_filtros, filtrar_orcamentos
+from orcamento.models import Orcamento
+from orcamento.recalculo import iterar_lotes_pks
+from orcamento.snapshot_precos import obter_snapshot
+
+
+class Command(BaseCommand):
+    help = ('Compara a calculadora vetorizada (NumPy) com a calculadora Decimal, '
+            'campo a campo, após os arredondamentos')
+
+    def add_arguments(self, parser):
+        adicionar_filtros(parser)
+        parser.add_argument('--limite', type=int,
+                            help='Valida apenas os N primeiros orçamentos (por id)')
+        parser.add_argument('--mostrar', type=int, default=20,
+                            help='Divergências listadas (padrão 20)')
+
+    def handle(self, *args, **options):
+        queryset = filtrar_orcamentos(Orcamento.objects.all(), options)
+        if options['limite']:
+            ultimo = queryset.order_by('pk').values_list('pk', flat=True)[options['limite'] - 1:].first()
+            if ultimo is not None:
+                queryset = queryset.filter(pk__lte=ultimo)
+
+        snapshot = obter_snapshot()
+
+        inicio = time.monotonic()
+        colunas = carregar_colunas(queryset)
+        carregado = time.monotonic()
+        vetorial = CalculadoraVetorial(snapshot).calcular(colunas)
+        calculado = time.monotonic()
+        posicoes = {pk: i for i, pk in enumerate(colunas['pk'].tolist())}
+        self.stdout.write(
+            f'Vetorial: {len(posicoes)} orçamentos em {calculado - carregado:.2f}s '
+            f'(+{carregado - inicio:.2f}s de leitura)'
+        )
+
+        divergencias = []
+        divergencias_empate = 0
+        erros = []
+        inicio = time.monotonic()
+        for pks in iterar_lotes_pks(queryset):
+            for orcamento in Orcamento.objects.filter(pk__in=pks).prefetch_related('cores'):
+                try:
+                    valores = CalculadoraOrcamento(orcamento, snapshot=snapshot).calcular()
+                except Exception as e:
+                    erros.append((orcamento.pk, str(e)))
+                    continue
+                i = posicoes[orcamento.pk]
+                for campo, casas in CASAS.items():
+                    # Mesmo arredondamento dos dois lados: qualquer diferença é
+                    # de pelo menos uma unidade na última casa
+                    if abs(float(valores[campo]) - vetorial[campo][i]) < 0.5 * 10 ** -casas:
+                        continue
+                    if vetorial['empates'][i]:
+                        divergencias_empate += 1
+                    else:
+                        divergencias.append((orcamento.pk, campo, valores[campo], vetorial[campo][i]))
+        segundos = time.monotonic() - inicio
+        self.stdout.write(f'Decimal: {len(posicoes)} orçamentos em {segundos:.2f}s')
+
+        for pk, mensagem in erros[:options['mostrar']]:
+            self.stdout.write(self.style.ERROR(f'  [ERRO] Orcamento #{pk}: {mensagem}'))
+        for pk, campo, esperado, obtido in divergencias[:options['mostrar']]:
+            self.stdout.write(self.style.ERROR(
+                f'  Orcamento #{pk} {campo}: Decimal {esperado} / vetorial {obtido:.{CASAS[campo]}f}'
+            ))
+
+        if divergencias_empate:
+            self.stdout.write(self.style.WARNING(
+                f'  {divergencias_empate} divergências em empates de arredondamento '
+                f'({int(vetorial["empates"].sum())} orçamentos com empate)'
+            ))
+        if divergencias or erros:
+            raise CommandError(f'{len(divergencias)} divergências e {len(erros)} erros')
+        self.stdout.write(self.style.SUCCESS(
+            f'OK: {len(posicoes)} orçamentos sem divergência nos {len(CASAS)} campos'
+        ))
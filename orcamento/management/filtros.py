@@ -0,0 +1,50 @@
+"""
+Filtros de orçamentos comuns aos comandos de recálculo e simulação
+(--since, --material, --status).
+"""
+from datetime import date
+
+from django.core.management.base import CommandError
+from django.db.models import Q
+
+from orcamento.models import Orcamento, TipoMaterial
+
+
+def adicionar_filtros(parser):
+    parser.add_argument('--since', metavar='AAAA-MM-DD',
+                        help='Apenas orçamentos emitidos a partir desta data')
+    parser.add_argument('--material', action='append', default=[],
+                        help='ID ou código do tipo de material (pode repetir)')
+    parser.add_argument('--status', action='append', default=[],
+                        choices=[s for s, _ in Orcamento.STATUS_CHOICES],
+                        help='Status do orçamento (pode repetir)')
+
+
+def ids_materiais(materiais):
+    """IDs dos tipos de material informados por ID ou código"""
+    ids = set()
+    for material in materiais:
+        filtro = Q(pk=int(material)) if material.isdigit() else Q(codigo__iexact=material)
+        encontrados = list(TipoMaterial.objects.filter(filtro).values_list('pk', flat=True))
+        if not encontrados:
+            raise CommandError(f'Tipo de material não encontrado: {material}')
+        ids.update(encontrados)
+    return ids
+
+
+def filtrar_orcamentos(queryset, options):
+    """Aplica ao queryset os filtros informados na linha de comando"""
+    if options['since']:
+        try:
+            desde = date.fromisoformat(options['since'])
+        except ValueError:
+            raise CommandError('--since deve estar no formato AAAA-MM-DD')
+        queryset = queryset.filter(data_emissao__gte=desde)
+
+    if options['material']:
+        queryset = queryset.filter(tipo_material_id__in=ids_materiais(options['material']))
+
+    if options['status']:
+        queryset = queryset.filter(status__in=options['status'])
+
+    return queryset
@@ -0,0 +1,162 @@
+"""
+Geração de massa de dados sintética para benchmarks e testes de carga.
+
+Os orçamentos são inseridos com bulk_create (sem passar pela calculadora) e
+marcados com o prefixo PREFIXO_MASSA em cliente e numero_pedido, para
+poderem ser removidos depois com remover_massa().
+"""
+import random
+from contextlib import contextmanager
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from .busca import normalizar_busca
+from .models import (
+    Orcamento, HistoricoStatusOrcamento, TipoMaterial, TipoCorte, Vendedor
+)
+
+PREFIXO_MASSA = 'MASSA'
+
+NOMES = [
+    'Confecções', 'Malharia', 'Têxtil', 'Moda', 'Indústria', 'Comércio', 'Ateliê',
+    'Jeans', 'Uniformes', 'Fitness', 'Praia', 'Infantil', 'Calçados', 'Bolsas',
+]
+SOBRENOMES = [
+    'São João', 'Araújo', 'Silva', 'Conceição', 'Ribeirão', 'Azevedo', 'Gonçalves',
+    'Brasília', 'Paraná', 'Pereira', 'Camargo', 'Estrela', 'Aurora', 'Ipê',
+]
+
+
+@contextmanager
+def _sem_auto_now(*campos):
+    """Permite gravar datas históricas em campos auto_now_add durante o bulk_create"""
+    originais = {}
+    for nome in campos:
+        campo = Orcamento._meta.get_field(nome)
+        originais[campo] = campo.auto_now_add
+        campo.auto_now_add = False
+    try:
+        yield
+    finally:
+        for campo, valor in originais.items():
+            campo.auto_now_add = valor
+
+
+def vendedores_massa(quantidade=10):
+    """Vendedores usados pela massa (cria usuários massa_vendedor_N se faltarem)"""
+    vendedores = []
+    for i in range(quantidade):
+        user, _ = User.objects.get_or_create(username=f'{PREFIXO_MASSA.lower()}_vendedor_{i}')
+        vendedor, _ = Vendedor.objects.get_or_create(
+            user=user,
+            defaults={'nome_completo': f'Vendedor Massa {i}', 'email': f'massa{i}@example.com'},
+        )
+        vendedores.append(vendedor)
+    return vendedores
+
+
+def usuarios_carga(senha, vendedores=10):
+    """
+    Usuários do teste de carga, todos com a senha informada: os vendedores da
+    massa (grupo Vendedor) e massa_gestor (grupo Gestor, com vendedor).
+    Retorna [(username, is_gestor)]
+    """
+    from django.contrib.auth.models import Group
+    from .papeis import GRUPO_GESTOR, GRUPO_VENDEDOR
+
+    grupo_vendedor, _ = Group.objects.get_or_create(name=GRUPO_VENDEDOR)
+    grupo_gestor, _ = Group.objects.get_or_create(name=GRUPO_GESTOR)
+    gestor_user, _ = User.objects.get_or_create(username=f'{PREFIXO_MASSA.lower()}_gestor')
+    Vendedor.objects.get_or_create(
+        user=gestor_user,
+        defaults={'nome_completo': 'Gestor Massa', 'email': 'massa_gestor@example.com'},
+    )
+
+    usuarios = [(v.user, grupo_vendedor) for v in vendedores_massa(vendedores)]
+    usuarios.append((gestor_user, grupo_gestor))
+    for user, grupo in usuarios:
+        if not user.check_password(senha):
+            user.set_password(senha)
+            user.save(update_fields=['password'])
+        user.groups.add(grupo)
+    return [(user.username, grupo is grupo_gestor) for user, grupo in usuarios]
+
+
+def gerar_orcamentos(quantidade, lote=5000, semente=0, dias=730, vendedores=10,
+                     fracao_historico=0.2, progresso=None):
+    """
+    Insere `quantidade` orçamentos sintéticos distribuídos nos últimos `dias`
+    dias, com status, vendedores e materiais variados. Uma fração recebe uma
+    linha de histórico de status. Retorna a quantidade inserida.
+    """
+    rnd = random.Random(semente)
+    materiais = list(TipoMaterial.objects.values_list('pk', flat=True))
+    cortes = list(TipoCorte.objects.values_list('pk', flat=True))
+    if not materiais or not cortes:
+        raise ValueError('Cadastre ao menos um tipo de material e um tipo de corte')
+    ids_vendedores = [v.pk for v in vendedores_massa(vendedores)] + [None]
+    status = [s for s, _ in Orcamento.STATUS_CHOICES]
+    tipos_cliente = [t for t, _ in Orcamento.TIPO_CLIENTE_CHOICES]
+    hoje = date.today()
+    fuso = timezone.get_current_timezone()
+
+    inseridos = 0
+    with _sem_auto_now('data_emissao', 'criado_em'):
+        while inseridos < quantidade:
+            orcamentos = []
+            for i in range(min(lote, quantidade - inseridos)):
+                numero = inseridos + i
+                emissao = hoje - timedelta(days=rnd.randrange(dias))
+                cliente = f'{rnd.choice(NOMES)} {rnd.choice(SOBRENOMES)} {numero}'
+                metros = rnd.choice([100, 300, 500, 1000, 2500, 5000, 12000])
+                comprimento = rnd.choice([10, 25, 40, 60, 100])
+                valor_unidade = Decimal(rnd.randint(5, 500)) / 1000
+                unidades = metros * 1000 // comprimento
+                orcamentos.append(Orcamento(
+                    cliente=f'{PREFIXO_MASSA} {cliente}',
+                    cliente_busca=normalizar_busca(f'{PREFIXO_MASSA} {cliente}'),
+                    numero_pedido=f'{PREFIXO_MASSA}-{semente}-{numero}',
+                    tipo_cliente=rnd.choice(tipos_cliente),
+                    vendedor_id=rnd.choice(ids_vendedores),
+                    status=rnd.choice(status),
+                    tipo_material_id=rnd.choice(materiais),
+                    tipo_corte_id=rnd.choice(cortes),
+                    largura_mm=rnd.choice([10, 12, 15, 20, 25, 30, 40, 50, 70, 100]),
+                    comprimento_mm=comprimento,
+                    quantidade_metros=metros,
+                    quantidade_unidades=unidades,
+                    milheiros=Decimal(unidades // 10) / 100,
+                    valor_unidade=valor_unidade,
+                    valor_total=(valor_unidade * unidades).quantize(Decimal('0.01')),
+                    data_emissao=emissao,
+                    criado_em=datetime.combine(emissao, time(rnd.randrange(8, 18)), fuso),
+                    ativo=rnd.random() > 0.05,
+                ))
+            with transaction.atomic():
+                criados = Orcamento.objects.bulk_create(orcamentos)
+                historico = [
+                    HistoricoStatusOrcamento(
+                        orcamento=orcamento, status_anterior='digitando', novo_status=orcamento.status,
+                    )
+                    for orcamento in criados if orcamento.pk and rnd.random() < fracao_historico
+                ]
+                HistoricoStatusOrcamento.objects.bulk_create(historico)
+            inseridos += len(orcamentos)
+            if progresso:
+                progresso(inseridos)
+
+    return inseridos
+
+
+def orcamentos_massa():
+    return Orcamento.objects.filter(numero_pedido__startswith=f'{PREFIXO_MASSA}-')
+
+
+def remover_massa():
+    """Remove os orçamentos sintéticos (e seu histórico/cores); retorna a quantidade"""
+    _, removidos = orcamentos_massa().delete()
+    return removidos.get(Orcamento._meta.label, 0)
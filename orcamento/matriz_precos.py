@@ -0,0 +1,214 @@
+"""
+Tabela de preços de venda: matriz largura × metragem (× comprimento) para um
+material, corte e acabamento.
+
+A matriz inteira é calculada de uma vez pela CalculadoraVetorial: as consultas
+de faixa de cada linha (coeficiente, acabamento, corte especial) e de cada
+coluna (preço base) são resolvidas em um único searchsorted sobre a grade, em
+vez de um ciclo de consultas por célula. As poucas células que caem em empate
+de arredondamento são recalculadas pela CalculadoraOrcamento, então cada
+valor é idêntico ao de um orçamento digitado com os mesmos dados.
+
+O resultado (e cada exportação) fica no cache do Django com a assinatura do
+snapshot na chave: qualquer mudança nas tabelas gera chaves novas.
+"""
+import csv
+import hashlib
+import io
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+
+from .calculadora import CalculadoraOrcamento
+from .calculadora_vetorial import CASAS, CalculadoraVetorial
+from .models import Orcamento
+from .snapshot_precos import obter_snapshot
+
+CAMPOS_MATRIZ = [
+    ('valor_milheiro', 'Valor do milheiro'),
+    ('valor_unidade', 'Valor unitário'),
+    ('valor_metro', 'Valor do metro'),
+    ('valor_total', 'Valor total'),
+]
+
+FORMATOS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+    'html': ('text/html; charset=utf-8', 'html'),
+}
+
+
+class MatrizPrecos:
+    """Valores de um campo do cálculo para cada (comprimento, largura, metragem)"""
+
+    def __init__(self, parametros, descricao, larguras, metragens, comprimentos, campo, valores):
+        self.parametros = parametros
+        # [(rótulo, nome)] do material, corte, acabamento... (cabeçalhos)
+        self.descricao = descricao
+        self.larguras = larguras
+        self.metragens = metragens
+        self.comprimentos = comprimentos
+        self.campo = campo
+        # valores[c][l][m]: Decimal na ordem de comprimentos, larguras, metragens
+        self.valores = valores
+
+    @property
+    def campo_nome(self):
+        return dict(CAMPOS_MATRIZ)[self.campo]
+
+    def tabelas(self):
+        """[(comprimento, [(largura, [valores por metragem]), ...]), ...] para os templates"""
+        return [
+            (comprimento, list(zip(self.larguras, linhas)))
+            for comprimento, linhas in zip(self.comprimentos, self.valores)
+        ]
+
+
+def larguras_padrao(snapshot, material_id, tipo_corte_id):
+    """Larguras da tabela de coeficientes do material/corte (ou das fitas)"""
+    indice = snapshot.coeficientes.get((material_id, len(snapshot.nome_corte(tipo_corte_id))))
+    return list(indice.chaves) if indice else list(snapshot.fitas.chaves)
+
+
+def metragens_padrao(snapshot, material_id):
+    """Metragens da tabela de preços do material"""
+    indice = snapshot.precos.get(material_id)
+    return list(indice.chaves) if indice else []
+
+
+def gerar_matriz(material_id, tipo_corte_id, larguras, metragens, comprimentos,
+                 acabamento_id=None, tipo_cliente='comercio_novo', tem_ultrassonico=False,
+                 campo='valor_milheiro', snapshot=None):
+    """Calcula a matriz completa com um único snapshot de preços"""
+    snapshot = snapshot or obter_snapshot()
+    parametros = {
+        'material_id': material_id, 'tipo_corte_id': tipo_corte_id,
+        'acabamento_id': acabamento_id, 'tipo_cliente': tipo_cliente,
+        'tem_ultrassonico': tem_ultrassonico,
+    }
+    descricao = [
+        ('Material', snapshot.material(material_id)[0]),
+        ('Corte', snapshot.nome_corte(tipo_corte_id)),
+        ('Acabamento', snapshot.acabamentos.get(acabamento_id, 'Nenhum')),
+        ('Tipo de cliente', dict(Orcamento.TIPO_CLIENTE_CHOICES).get(tipo_cliente, tipo_cliente)),
+        ('Ultrassônico', 'Sim' if tem_ultrassonico else 'Não'),
+    ]
+
+    comprimento, largura, metragem = (
+        grade.ravel() for grade in np.meshgrid(comprimentos, larguras, metragens, indexing='ij')
+    )
+    total = len(largura)
+    resultado = CalculadoraVetorial(snapshot).calcular({
+        'tipo_material_id': np.full(total, material_id),
+        'tipo_corte_id': np.full(total, tipo_corte_id),
+        'acabamento_id': np.full(total, acabamento_id or 0),
+        'largura_mm': largura,
+        'comprimento_mm': comprimento,
+        'quantidade_metros': metragem,
+        'quantidade_unidades': np.ones(total, dtype=np.int64),
+        'tabela_manual_metragem': np.zeros(total, dtype=np.int64),
+        'tem_ultrassonico': np.full(total, tem_ultrassonico),
+        'tipo_cliente': np.full(total, tipo_cliente),
+    })
+
+    casas = CASAS[campo]
+    valores = [Decimal(f'{valor:.{casas}f}') for valor in resultado[campo]]
+    for i in np.flatnonzero(resultado['empates']).tolist():
+        orcamento = Orcamento(
+            tipo_material_id=material_id, tipo_corte_id=tipo_corte_id, acabamento_id=acabamento_id,
+            largura_mm=int(largura[i]), comprimento_mm=int(comprimento[i]),
+            quantidade_metros=int(metragem[i]), tipo_cliente=tipo_cliente,
+            tem_ultrassonico=tem_ultrassonico,
+        )
+        valores[i] = CalculadoraOrcamento(orcamento, snapshot, total_unidades_cores=0).calcular()[campo]
+
+    por_linha = len(metragens)
+    por_tabela = len(larguras) * por_linha
+    matriz = [
+        [
+            valores[inicio + j * por_linha:inicio + (j + 1) * por_linha]
+            for j in range(len(larguras))
+        ]
+        for inicio in range(0, total, por_tabela)
+    ]
+    return MatrizPrecos(
+        parametros, descricao, list(larguras), list(metragens), list(comprimentos), campo, matriz
+    )
+
+
+def _chave_cache(snapshot, parametros, formato):
+    conteudo = repr(sorted(parametros.items())).encode()
+    return f'matriz_precos:{snapshot.assinatura}:{formato}:{hashlib.sha1(conteudo).hexdigest()}'
+
+
+def obter_matriz(snapshot=None, **parametros):
+    """gerar_matriz com cache pela assinatura das tabelas"""
+    snapshot = snapshot or obter_snapshot()
+    return cache.get_or_set(
+        _chave_cache(snapshot, parametros, 'matriz'),
+        lambda: gerar_matriz(snapshot=snapshot, **parametros),
+        getattr(settings, 'MATRIZ_PRECOS_CACHE_TTL', 3600),
+    )
+
+
+def exportar_csv(matriz):
+    """CSV para Excel em português: separador ';' e vírgula decimal"""
+    saida = io.StringIO()
+    escritor = csv.writer(saida, delimiter=';')
+    escritor.writerow([f'{rotulo}: {valor}' for rotulo, valor in matriz.descricao])
+    escritor.writerow([matriz.campo_nome])
+    escritor.writerow(['Comprimento (mm)', 'Largura (mm)'] + [f'{m} m' for m in matriz.metragens])
+    for comprimento, linhas in matriz.tabelas():
+        for largura, valores in linhas:
+            escritor.writerow(
+                [comprimento, largura] + [str(valor).replace('.', ',') for valor in valores]
+            )
+    # BOM para o Excel reconhecer UTF-8
+    return saida.getvalue().encode('utf-8-sig')
+
+
+def exportar_xlsx(matriz):
+    """Planilha com uma aba por comprimento"""
+    from openpyxl import Workbook
+    from openpyxl.styles import Font
+
+    formato_numero = '0.' + '0' * CASAS[matriz.campo]
+    planilha = Workbook()
+    planilha.remove(planilha.active)
+    for comprimento, linhas in matriz.tabelas():
+        aba = planilha.create_sheet(f'{comprimento} mm')
+        for rotulo, valor in matriz.descricao:
+            aba.append([rotulo, valor])
+        aba.append(['Comprimento', f'{comprimento} mm'])
+        aba.append([matriz.campo_nome])
+        aba.append([])
+        aba.append(['Largura \\ Metragem'] + [f'{m} m' for m in matriz.metragens])
+        for celula in aba[aba.max_row]:
+            celula.font = Font(bold=True)
+        for largura, valores in linhas:
+            aba.append([f'{largura} mm'] + [float(valor) for valor in valores])
+            for celula in aba[aba.max_row][1:]:
+                celula.number_format = formato_numero
+    arquivo = io.BytesIO()
+    planilha.save(arquivo)
+    return arquivo.getvalue()
+
+
+def exportar_html(matriz):
+    return render_to_string('orcamento/matriz_precos_arquivo.html', {'matriz': matriz}).encode('utf-8')
+
+
+EXPORTADORES = {'csv': exportar_csv, 'xlsx': exportar_xlsx, 'html': exportar_html}
+
+
+def exportar(formato, snapshot=None, **parametros):
+    """Conteúdo (bytes) da matriz no formato pedido, com cache"""
+    snapshot = snapshot or obter_snapshot()
+    return cache.get_or_set(
+        _chave_cache(snapshot, parametros, formato),
+        lambda: EXPORTADORES[formato](obter_matriz(snapshot=snapshot, **parametros)),
+        getattr(settings, 'MATRIZ_PRECOS_CACHE_TTL', 3600),
+    )
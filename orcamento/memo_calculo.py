@@ -0,0 +1,141 @@
+"""
+Memo (LRU com TTL) dos resultados da pré-visualização do cálculo.
+
+O formulário reenvia a mesma combinação de campos para api/calcular/ a cada
+troca de campo. O resultado depende só desses campos, do nível de rastro (a
+soma das cores só entra no rastro completo) e das tabelas de preço, então fica
+guardado em memória no processo com a chave (assinatura do snapshot, rastro,
+entradas): a repetição não refaz nem as consultas nem a aritmética Decimal, e
+qualquer mudança nas tabelas gera um snapshot com outra assinatura, deixando
+as entradas antigas inalcançáveis (saem pelo LRU ou pelo TTL).
+
+Configuração: MEMO_CALCULO_TAMANHO (entradas, 0 desliga) e MEMO_CALCULO_TTL
+(segundos).
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .calculadora import CalculadoraOrcamento, RASTRO_COMPLETO, RASTRO_NENHUM
+from .snapshot_precos import obter_snapshot
+
+# Campos do orçamento que entram no cálculo
+CAMPOS_ENTRADA = (
+    'tipo_material_id', 'tipo_corte_id', 'acabamento_id', 'batida_id', 'largura_mm',
+    'comprimento_mm', 'quantidade_metros', 'quantidade_unidades', 'tabela_manual_metragem',
+    'tem_ultrassonico', 'tipo_cliente',
+)
+
+
+class MemoCalculo:
+    """Dicionário LRU com expiração por entrada e contadores de acertos/falhas"""
+
+    def __init__(self, tamanho, ttl):
+        self.tamanho = tamanho
+        self.ttl = ttl
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+        self.expirados = 0
+        self.descartados = 0
+
+    def obter(self, chave, calcular):
+        """Valor guardado para a chave ou calcular(), que passa a ser guardado"""
+        agora = time.monotonic()
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is not None:
+                expira_em, valor = entrada
+                if expira_em > agora:
+                    self._entradas.move_to_end(chave)
+                    self.acertos += 1
+                    return valor
+                del self._entradas[chave]
+                self.expirados += 1
+            self.falhas += 1
+
+        # Fora do lock: dois pedidos iguais simultâneos calculam em dobro,
+        # mas nenhum espera pelo outro
+        valor = calcular()
+        with self._lock:
+            self._entradas[chave] = (agora + self.ttl, valor)
+            self._entradas.move_to_end(chave)
+            while len(self._entradas) > self.tamanho:
+                self._entradas.popitem(last=False)
+                self.descartados += 1
+        return valor
+
+    def limpar(self):
+        with self._lock:
+            self._entradas.clear()
+
+    def estatisticas(self):
+        consultas = self.acertos + self.falhas
+        return {
+            'entradas': len(self._entradas),
+            'tamanho': self.tamanho,
+            'ttl': self.ttl,
+            'acertos': self.acertos,
+            'falhas': self.falhas,
+            'expirados': self.expirados,
+            'descartados': self.descartados,
+            'taxa_acerto': round(self.acertos / consultas, 4) if consultas else 0.0,
+        }
+
+
+_memo = None
+_memo_lock = threading.Lock()
+
+
+def obter_memo():
+    """Memo do processo, criado na primeira chamada com as configurações atuais"""
+    global _memo
+    if _memo is None:
+        with _memo_lock:
+            if _memo is None:
+                _memo = MemoCalculo(
+                    getattr(settings, 'MEMO_CALCULO_TAMANHO', 2048),
+                    getattr(settings, 'MEMO_CALCULO_TTL', 300),
+                )
+    return _memo
+
+
+def reiniciar_memo():
+    """Descarta o memo (e os contadores); o próximo acesso relê as configurações"""
+    global _memo
+    with _memo_lock:
+        _memo = None
+
+
+def chave_calculo(orcamento, total_unidades_cores, snapshot, rastro=RASTRO_NENHUM):
+    """Chave canônica: assinatura das tabelas + campos de entrada normalizados"""
+    # A soma das cores só aparece no rastro completo; não entra no preço
+    cores = (total_unidades_cores or 0) if rastro == RASTRO_COMPLETO else 0
+    return (snapshot.assinatura, rastro, cores) + tuple(
+        getattr(orcamento, campo) for campo in CAMPOS_ENTRADA
+    )
+
+
+def calcular_com_memo(orcamento, total_unidades_cores=None, snapshot=None, rastro=RASTRO_NENHUM):
+    """
+    CalculadoraOrcamento(...).calcular() passando pelo memo. Só vale para
+    orçamentos não salvos (a soma das cores vem do formulário); os demais são
+    calculados direto.
+    """
+    snapshot = snapshot or obter_snapshot()
+    memo = obter_memo()
+
+    def calcular():
+        return CalculadoraOrcamento(
+            orcamento, snapshot, total_unidades_cores=total_unidades_cores, rastro=rastro
+        ).calcular()
+
+    if orcamento.pk or memo.tamanho <= 0:
+        return calcular()
+
+    valores = memo.obter(chave_calculo(orcamento, total_unidades_cores, snapshot, rastro), calcular)
+    # Cópia rasa: quem chama pode acrescentar chaves sem afetar o memo
+    return dict(valores)
@@ -0,0 +1,67 @@
+"""
+Middlewares do app orcamento
+"""
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from .papeis import papeis_do_usuario
+
+
+class PapeisMiddleware:
+    """
+    Resolve os papéis do usuário uma vez por requisição e os disponibiliza em
+    request.papeis (views, mixins, filtros e templates usam o mesmo resultado).
+    Deve vir depois de SessionMiddleware e AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.papeis = papeis_do_usuario(request.user, getattr(request, 'session', None))
+        return self.get_response(request)
+
+
+class _ContadorConsultas:
+    """execute_wrapper que conta as consultas e soma o tempo gasto nelas"""
+
+    def __init__(self):
+        self.quantidade = 0
+        self.tempo = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.quantidade += 1
+            self.tempo += time.perf_counter() - inicio
+
+
+class ContagemConsultasMiddleware:
+    """
+    Com CONTAR_CONSULTAS = True, cada resposta informa quantas consultas SQL a
+    requisição fez (X-Consultas) e quanto tempo elas levaram, em ms
+    (X-Tempo-Consultas). Usado pelo comando teste_carga; desligado, o Django
+    tira o middleware da pilha na inicialização. Deve vir no início do
+    MIDDLEWARE para contar também as consultas de sessão e autenticação.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'CONTAR_CONSULTAS', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        contador = _ContadorConsultas()
+        with ExitStack() as pilha:
+            for conexao in connections.all():
+                pilha.enter_context(conexao.execute_wrapper(contador))
+            response = self.get_response(request)
+        response['X-Consultas'] = str(contador.quantidade)
+        response['X-Tempo-Consultas'] = f'{contador.tempo * 1000:.1f}'
+        return response
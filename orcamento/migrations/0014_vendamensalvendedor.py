@@ -0,0 +1,52 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:05
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+import django.db.models.deletion
+
+
+def popular_vendas_mensais(apps, schema_editor):
+    Orcamento = apps.get_model('orcamento', 'Orcamento')
+    VendaMensalVendedor = apps.get_model('orcamento', 'VendaMensalVendedor')
+    agregados = Orcamento.objects.filter(
+        ativo=True, vendedor__isnull=False
+    ).annotate(mes=TruncMonth('data_emissao')).order_by().values(
+        'vendedor_id', 'mes', 'status'
+    ).annotate(quantidade=Count('pk'), total=Sum('valor_total'))
+    VendaMensalVendedor.objects.bulk_create([
+        VendaMensalVendedor(
+            vendedor_id=item['vendedor_id'], mes=item['mes'], status=item['status'],
+            quantidade=item['quantidade'], valor_total=item['total'] or Decimal('0.0'),
+        )
+        for item in agregados
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orcamento', '0013_tipomaterial_dupla_densidade'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VendaMensalVendedor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField(help_text='Primeiro dia do mês de emissão')),
+                ('status', models.CharField(choices=[('digitando', 'Digitando'), ('aguardando', 'Aguardando Aprovação'), ('aprovado', 'Aprovado'), ('reprovado', 'Reprovado'), ('em_producao', 'Em Produção'), ('finalizado', 'Finalizado'), ('entregue', 'Entregue'), ('cancelado', 'Cancelado')], max_length=20)),
+                ('quantidade', models.IntegerField(default=0)),
+                ('valor_total', models.DecimalField(decimal_places=2, default=Decimal('0.0'), max_digits=14)),
+                ('vendedor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vendas_mensais', to='orcamento.vendedor')),
+            ],
+            options={
+                'verbose_name': 'Venda Mensal do Vendedor',
+                'verbose_name_plural': 'Vendas Mensais dos Vendedores',
+                'ordering': ['-mes', 'vendedor', 'status'],
+                'unique_together': {('vendedor', 'mes', 'status')},
+            },
+        ),
+        migrations.RunPython(popular_vendas_mensais, migrations.RunPython.noop),
+    ]
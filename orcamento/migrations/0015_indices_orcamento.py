@@ -0,0 +1,72 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:09
+
+from django.db import migrations, models
+
+from orcamento.busca import normalizar_busca
+
+
+def preencher_cliente_busca(apps, schema_editor):
+    Orcamento = apps.get_model('orcamento', 'Orcamento')
+    lote = []
+    for orcamento in Orcamento.objects.only('pk', 'cliente').iterator(chunk_size=2000):
+        orcamento.cliente_busca = normalizar_busca(orcamento.cliente)
+        lote.append(orcamento)
+        if len(lote) >= 2000:
+            Orcamento.objects.bulk_update(lote, ['cliente_busca'])
+            lote = []
+    if lote:
+        Orcamento.objects.bulk_update(lote, ['cliente_busca'])
+
+
+def criar_indice_trigram(apps, schema_editor):
+    # Busca por "contains" indexada; só existe no PostgreSQL (extensão pg_trgm)
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS orc_cliente_busca_trgm_idx '
+        'ON orcamento_orcamento USING gin (cliente_busca gin_trgm_ops)'
+    )
+
+
+def remover_indice_trigram(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS orc_cliente_busca_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orcamento', '0014_vendamensalvendedor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orcamento',
+            name='cliente_busca',
+            field=models.CharField(blank=True, editable=False, help_text='Nome do cliente normalizado para busca (sem acentos, minúsculo)', max_length=200),
+        ),
+        migrations.AddIndex(
+            model_name='historicostatusorcamento',
+            index=models.Index(fields=['orcamento', 'data_mudanca'], name='hist_orc_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orcamento',
+            index=models.Index(condition=models.Q(('ativo', True)), fields=['status'], name='orc_ativos_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orcamento',
+            index=models.Index(condition=models.Q(('ativo', True)), fields=['vendedor', 'data_emissao'], name='orc_ativos_vend_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orcamento',
+            index=models.Index(condition=models.Q(('ativo', True)), fields=['-criado_em'], name='orc_ativos_criado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orcamento',
+            index=models.Index(condition=models.Q(('ativo', True)), fields=['-data_emissao', '-id'], name='orc_ativos_lista_idx'),
+        ),
+        migrations.RunPython(preencher_cliente_busca, migrations.RunPython.noop),
+        migrations.RunPython(criar_indice_trigram, remover_indice_trigram),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:33
+
+from django.db import migrations, models
+from django.db.models import Count, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def preencher_totais_cores(apps, schema_editor):
+    # Um único UPDATE com subconsultas correlacionadas (sem carregar as cores)
+    Orcamento = apps.get_model('orcamento', 'Orcamento')
+    CorOrcamento = apps.get_model('orcamento', 'CorOrcamento')
+
+    def agregado(expressao, **filtro):
+        cores = CorOrcamento.objects.filter(orcamento=OuterRef('pk'), **filtro).order_by()
+        return Coalesce(Subquery(
+            cores.values('orcamento').annotate(valor=expressao).values('valor')[:1],
+            output_field=models.IntegerField(),
+        ), Value(0))
+
+    Orcamento.objects.filter(pk__in=CorOrcamento.objects.values('orcamento')).update(
+        total_unidades_cores=agregado(Sum(F('quantidade_unidades') + F('quantidade_demais'))),
+        total_demais_cores=agregado(Sum('quantidade_demais')),
+        qtd_cores_densidade1=agregado(Count('pk'), densidade='1'),
+        qtd_cores_densidade2=agregado(Count('pk'), densidade='2'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orcamento', '0015_indices_orcamento'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orcamento',
+            name='qtd_cores_densidade1',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='orcamento',
+            name='qtd_cores_densidade2',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='orcamento',
+            name='total_demais_cores',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='orcamento',
+            name='total_unidades_cores',
+            field=models.IntegerField(default=0, editable=False, help_text='Soma de unidades + demais de todas as cores'),
+        ),
+        migrations.RunPython(preencher_totais_cores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:44
+
+from django.conf import settings
+import django.core.serializers.json
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def criar_versao(apps, schema_editor):
+    VersaoPrecos = apps.get_model('orcamento', 'VersaoPrecos')
+    VersaoPrecos.objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('orcamento', '0016_totais_cores_orcamento'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersaoPrecos',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('versao', models.BigIntegerField(default=0)),
+                ('alterado_em', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Versão dos Preços',
+                'verbose_name_plural': 'Versão dos Preços',
+            },
+        ),
+        migrations.CreateModel(
+            name='AlteracaoPreco',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('versao', models.BigIntegerField(db_index=True)),
+                ('modelo', models.CharField(max_length=50)),
+                ('objeto_id', models.BigIntegerField(blank=True, null=True)),
+                ('operacao', models.CharField(choices=[('insert', 'Inclusão'), ('update', 'Alteração'), ('delete', 'Exclusão'), ('bulk', 'Em massa')], max_length=10)),
+                ('dados', models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder, help_text="Valores antes/depois ({'antes': {...}, 'depois': {...}})")),
+                ('descricao', models.CharField(blank=True, max_length=200)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Alteração de Preço',
+                'verbose_name_plural': 'Alterações de Preços',
+                'ordering': ['-versao', '-pk'],
+                'indexes': [models.Index(fields=['modelo', 'objeto_id'], name='alteracao_preco_obj_idx')],
+            },
+        ),
+        migrations.RunPython(criar_versao, migrations.RunPython.noop),
+    ]
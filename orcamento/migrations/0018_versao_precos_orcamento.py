@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orcamento', '0017_versao_precos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orcamento',
+            name='versao_precos',
+            field=models.BigIntegerField(blank=True, editable=False, help_text='Versão dos dados de preço (VersaoPrecos) usada no último cálculo', null=True),
+        ),
+    ]
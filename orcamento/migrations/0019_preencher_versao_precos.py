@@ -0,0 +1,21 @@
+from django.db import migrations
+
+
+def preencher_versao(apps, schema_editor):
+    # Orçamentos existentes foram calculados com os preços atuais: sem isso
+    # todos os abertos seriam recalculados no próximo save
+    VersaoPrecos = apps.get_model('orcamento', 'VersaoPrecos')
+    Orcamento = apps.get_model('orcamento', 'Orcamento')
+    versao = VersaoPrecos.objects.filter(pk=1).values_list('versao', flat=True).first() or 0
+    Orcamento.objects.filter(versao_precos__isnull=True).update(versao_precos=versao)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orcamento', '0018_versao_precos_orcamento'),
+    ]
+
+    operations = [
+        migrations.RunPython(preencher_versao, migrations.RunPython.noop),
+    ]
@@ -2,9 +2,14 @@ from django.contrib.auth.mixins import UserPassesTestMixin
 from django.contrib import messages
 from django.shortcuts import redirect
 
+from .dependencias import reprecificacao_incremental
+from .papeis import papeis_do_usuario
+from .versao_precos import alteracao_precos
+
+
 def is_gestor_or_superuser(user):
     """Verifica se o usuário é gestor ou superusuário"""
-    return user.is_superuser or user.groups.filter(name='Gestor').exists()
+    return papeis_do_usuario(user).pode_gerenciar
 
 
 class GestorRequiredMixin(UserPassesTestMixin):
@@ -16,3 +21,16 @@ class GestorRequiredMixin(UserPassesTestMixin):
         messages.error(self.request, 'Você não tem permissão para acessar esta área.')
         return redirect('orcamento:index')
 
+
+class ReprecificacaoMixin:
+    """
+    Mixin para views que alteram tabelas de preço: a requisição vira uma
+    única versão dos preços (com o usuário no registro de alterações) e, após
+    o commit, recalcula apenas os orçamentos abertos cujas consultas mudaram
+    de resultado
+    """
+    def dispatch(self, request, *args, **kwargs):
+        if request.method != 'POST':
+            return super().dispatch(request, *args, **kwargs)
+        with reprecificacao_incremental(), alteracao_precos(usuario=request.user):
+            return super().dispatch(request, *args, **kwargs)
@@ -1,5 +1,8 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MinValueValidator
 from decimal import Decimal
 
@@ -224,21 +227,20 @@ class Vendedor(models.Model):
     
     @property
     def is_gestor(self):
-        """Verifica se o vendedor é gestor"""
-        return self.user.groups.filter(name='Gestor').exists()
+        """Verifica se o vendedor é gestor (grupos resolvidos uma vez por usuário)"""
+        from .papeis import papeis_do_usuario
+        return papeis_do_usuario(self.user).is_gestor
     
     def total_vendas_mes(self):
-        """Retorna o total de vendas do mês atual"""
+        """Retorna o total de vendas do mês atual (resumo VendaMensalVendedor)"""
         from django.db.models import Sum
         from datetime import datetime
         
         hoje = datetime.now().date()
         mes_atual = hoje.replace(day=1)
         
-        total = Orcamento.objects.filter(
-            vendedor=self,
-            data_emissao__gte=mes_atual,
-            ativo=True
+        total = self.vendas_mensais.filter(
+            mes__gte=mes_atual
         ).aggregate(total=Sum('valor_total'))['total']
         
         return total or Decimal('0.0')
@@ -325,6 +327,10 @@ class Orcamento(models.Model):
     
     # Informações do Cliente
     cliente = models.CharField(max_length=200)
+    cliente_busca = models.CharField(
+        max_length=200, blank=True, editable=False,
+        help_text="Nome do cliente normalizado para busca (sem acentos, minúsculo)"
+    )
     tipo_cliente = models.CharField(max_length=20, choices=TIPO_CLIENTE_CHOICES, default='comercio_novo')
     endereco = models.CharField(max_length=300, blank=True)
     cidade = models.CharField(max_length=100, blank=True)
@@ -403,6 +409,16 @@ class Orcamento(models.Model):
     valor_unidade = models.DecimalField(max_digits=10, decimal_places=5, default=Decimal('0.0'))
     valor_total = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.0'))
     valor_frete = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.0'))
+    versao_precos = models.BigIntegerField(
+        null=True, blank=True, editable=False,
+        help_text="Versão dos dados de preço (VersaoPrecos) usada no último cálculo")
+
+    # Totais das cores (mantidos por cores.sincronizar_cores e CorOrcamento.save/delete)
+    total_unidades_cores = models.IntegerField(
+        default=0, editable=False, help_text="Soma de unidades + demais de todas as cores")
+    total_demais_cores = models.IntegerField(default=0, editable=False)
+    qtd_cores_densidade1 = models.IntegerField(default=0, editable=False)
+    qtd_cores_densidade2 = models.IntegerField(default=0, editable=False)
     
     # Observações
     observacoes = models.TextField(blank=True)
@@ -413,10 +429,48 @@ class Orcamento(models.Model):
     atualizado_em = models.DateTimeField(auto_now=True)
     ativo = models.BooleanField(default=True)
     
+    # Status em que o orçamento ainda pode ser editado e é reprecificado
+    # quando as tabelas mudam
+    STATUS_ABERTOS = ['digitando', 'aguardando', 'reprovado']
+
+    # Campos lidos pela CalculadoraOrcamento (FKs pelo nome do campo)
+    CAMPOS_PRECIFICACAO = [
+        'tipo_material', 'tipo_corte', 'acabamento', 'batida', 'largura_mm',
+        'comprimento_mm', 'quantidade_metros', 'quantidade_unidades',
+        'tabela_manual_metragem', 'tem_ultrassonico', 'tipo_cliente',
+    ]
+    # Campos preenchidos a partir do resultado da calculadora
+    CAMPOS_CALCULADOS = [
+        'quantidade_unidades', 'milheiros', 'valor_unidade', 'valor_total',
+        'valor_metro', 'valor_milheiro', 'versao_precos',
+    ]
+    # Totais desnormalizados das cores
+    CAMPOS_TOTAIS_CORES = [
+        'total_unidades_cores', 'total_demais_cores', 'qtd_cores_densidade1', 'qtd_cores_densidade2',
+    ]
+    # Campos que definem a contribuição no resumo VendaMensalVendedor
+    CAMPOS_VENDAS = ['vendedor', 'data_emissao', 'status', 'valor_total', 'ativo']
+
     class Meta:
         verbose_name = 'Orçamento'
         verbose_name_plural = 'Orçamentos'
         ordering = ['-data_emissao', '-criado_em']
+        # Índices parciais só dos ativos: todas as telas filtram ativo=True, e
+        # assim o filtro casa com o índice também no SQLite (WHERE "ativo")
+        indexes = [
+            # Contagens por status (listagem e dashboards)
+            models.Index(fields=['status'], condition=models.Q(ativo=True),
+                         name='orc_ativos_status_idx'),
+            # Dashboard do vendedor e resumo mensal
+            models.Index(fields=['vendedor', 'data_emissao'], condition=models.Q(ativo=True),
+                         name='orc_ativos_vend_data_idx'),
+            # Orçamentos recentes dos dashboards
+            models.Index(fields=['-criado_em'], condition=models.Q(ativo=True),
+                         name='orc_ativos_criado_idx'),
+            # Listagem e paginação por cursor (data_emissao, id)
+            models.Index(fields=['-data_emissao', '-id'], condition=models.Q(ativo=True),
+                         name='orc_ativos_lista_idx'),
+        ]
     
     def __str__(self):
         return f'Orçamento {self.numero_pedido} - {self.cliente}'
@@ -425,21 +479,113 @@ class Orcamento(models.Model):
     def is_dupla_densidade(self):
         """Verifica se o material é Dupla Densidade"""
         return self.tipo_material.dupla_densidade if self.tipo_material else False
-    
-    def calcular_valores(self):
+
+    @property
+    def qtd_cores(self):
+        return self.qtd_cores_densidade1 + self.qtd_cores_densidade2
+
+    @property
+    def total_quantidade_cores(self):
+        """Soma só de quantidade_unidades das cores (sem os demais)"""
+        return self.total_unidades_cores - self.total_demais_cores
+
+    def atualizar_totais_cores(self):
+        """
+        Recalcula os totais das cores com uma agregação e grava só esses
+        campos (sem passar pelo save, que reprecificaria)
+        """
+        totais = CorOrcamento.objects.filter(orcamento_id=self.pk).aggregate(
+            total_unidades_cores=Coalesce(Sum(F('quantidade_unidades') + F('quantidade_demais')), 0),
+            total_demais_cores=Coalesce(Sum('quantidade_demais'), 0),
+            qtd_cores_densidade1=Count('pk', filter=Q(densidade='1')),
+            qtd_cores_densidade2=Count('pk', filter=Q(densidade='2')),
+        )
+        self.gravar_totais_cores(totais)
+
+    def gravar_totais_cores(self, totais):
+        """Grava os totais já calculados ({campo: valor} de CAMPOS_TOTAIS_CORES)"""
+        for campo, valor in totais.items():
+            setattr(self, campo, valor)
+        Orcamento.objects.filter(pk=self.pk).update(**totais)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Só confere os campos lidos quando há campos adiados (only/defer)
+        carregados = None if len(values) == len(cls._meta.concrete_fields) else set(field_names)
+        # Guarda os campos da contribuição lidos do banco para atualizar o
+        # resumo de vendas pela diferença ao salvar
+        if carregados is None or carregados.issuperset(cls._ATRIBUTOS_VENDAS):
+            instance._venda_carregada = tuple(getattr(instance, atributo) for atributo in cls._ATRIBUTOS_VENDAS)
+        # e os campos de precificação, para só recalcular quando mudarem
+        if carregados is None or carregados.issuperset(cls._ATRIBUTOS_PRECIFICACAO):
+            instance._precificacao_original = instance._entradas_precificacao()
+        return instance
+
+    def _entradas_precificacao(self):
+        return tuple(getattr(self, atributo) for atributo in self._ATRIBUTOS_PRECIFICACAO)
+
+    def marcar_para_recalculo(self):
+        """Força o recálculo no próximo save (ex: tabelas de preço mudaram)"""
+        self._recalcular = True
+
+    def precisa_recalcular(self):
+        """
+        True se o orçamento é novo, não foi lido do banco com os campos de
+        precificação, foi marcado para recálculo, teve algum deles alterado
+        ou, aberto, foi calculado com outra versão dos preços (alteração por
+        um caminho que não reprecificou)
+        """
+        original = getattr(self, '_precificacao_original', None)
+        return (
+            original is None
+            or getattr(self, '_recalcular', False)
+            or original != self._entradas_precificacao()
+            or self._precos_desatualizados()
+        )
+
+    def _precos_desatualizados(self):
+        if self.status not in self.STATUS_ABERTOS or 'versao_precos' in self.get_deferred_fields():
+            return False
+        from .snapshot_precos import obter_snapshot
+        return self.versao_precos != obter_snapshot().versao_precos
+
+    def contribuicao_venda(self):
+        """Chave e valor deste orçamento no resumo VendaMensalVendedor (ou None)"""
+        from .vendas_mensais import contribuicao
+        return contribuicao(self.vendedor_id, self.data_emissao, self.status, self.valor_total, self.ativo)
+
+    def _contribuicao_venda_no_banco(self):
+        """Contribuição atualmente gravada (lida do banco se não foi guardada)"""
+        if hasattr(self, '_venda_original'):
+            return self._venda_original
+        from .vendas_mensais import contribuicao
+        if hasattr(self, '_venda_carregada'):
+            return contribuicao(*self._venda_carregada)
+        valores = Orcamento.objects.filter(pk=self.pk).values_list(*self._ATRIBUTOS_VENDAS).first()
+        return contribuicao(*valores) if valores else None
+    
+    def aplicar_valores(self, valores, snapshot):
+        """Copia o resultado da CalculadoraOrcamento (com o snapshot usado) para os campos calculados"""
+        self.versao_precos = snapshot.versao_precos
+        self.quantidade_unidades = int(valores['unidades'])
+        self.milheiros = valores['milheiros']
+        self.valor_unidade = valores['valor_unidade']
+        self.valor_total = valores['valor_total']
+        self.valor_metro = valores['valor_metro']
+        self.valor_milheiro = valores['valor_milheiro']
+
+    def calcular_valores(self, snapshot=None):
         """Calcula todos os valores do orçamento baseado nas regras da planilha"""
         try:
             from .calculadora import CalculadoraOrcamento
-            calculadora = CalculadoraOrcamento(self)
+            from .snapshot_precos import obter_snapshot
+            snapshot = snapshot or obter_snapshot()
+            calculadora = CalculadoraOrcamento(self, snapshot=snapshot)
             valores = calculadora.calcular()
             
             # Atualiza TODOS os valores calculados
-            self.quantidade_unidades = int(valores['unidades'])
-            self.milheiros = valores['milheiros']
-            self.valor_unidade = valores['valor_unidade']
-            self.valor_total = valores['valor_total']
-            self.valor_metro = valores['valor_metro']
-            self.valor_milheiro = valores['valor_milheiro']
+            self.aplicar_valores(valores, snapshot)
             
             print(f"[OK] Valores calculados - Total: R$ {self.valor_total}, Unidades: {self.quantidade_unidades}")
         except Exception as e:
@@ -447,18 +593,61 @@ class Orcamento(models.Model):
             import traceback
             traceback.print_exc()
     
-    def save(self, *args, **kwargs):
+    def save(self, *args, recalcular=None, **kwargs):
+        """
+        Precifica apenas quando necessário: recalcular=None decide por
+        precisa_recalcular() (e nunca recalcula com update_fields sem campos
+        de precificação, ex: save(update_fields=['status'])); True força e
+        False nunca recalcula
+        """
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields)
+
+        if recalcular is None:
+            recalcular = self.precisa_recalcular() and (
+                update_fields is None
+                or not {self._meta.get_field(campo).name for campo in update_fields}.isdisjoint(
+                    self.CAMPOS_PRECIFICACAO)
+            )
+
         # Calcula valores antes de salvar se já tem ID ou se é novo com dados
-        # Verifica se tem os atributos necessários (evita erro com outros modelos)
-        if hasattr(self, 'tipo_material_id') and hasattr(self, 'largura_mm') and hasattr(self, 'quantidade_metros'):
-            if self.pk or (self.tipo_material_id and self.largura_mm and self.quantidade_metros):
-                try:
-                    self.calcular_valores()
-                except Exception as e:
-                    print(f"[ERRO] ao calcular valores: {e}")
-                    pass  # Se falhar o cálculo, salva mesmo assim
-        
-        super().save(*args, **kwargs)
+        if recalcular and (self.pk or (self.tipo_material_id and self.largura_mm and self.quantidade_metros)):
+            try:
+                self.calcular_valores()
+            except Exception as e:
+                print(f"[ERRO] ao calcular valores: {e}")
+                pass  # Se falhar o cálculo, salva mesmo assim
+            if update_fields is not None:
+                update_fields.update(self.CAMPOS_CALCULADOS)
+
+        if update_fields is None or 'cliente' in update_fields:
+            from .busca import normalizar_busca
+            self.cliente_busca = normalizar_busca(self.cliente)
+            if update_fields is not None:
+                update_fields.add('cliente_busca')
+
+        if update_fields is not None:
+            kwargs['update_fields'] = update_fields
+
+        from .vendas_mensais import registrar_alteracao
+        with transaction.atomic():
+            antes = self._contribuicao_venda_no_banco() if self.pk else None
+            super().save(*args, **kwargs)
+            depois = self.contribuicao_venda()
+            registrar_alteracao(antes, depois)
+        self._venda_original = depois
+        if update_fields is None or recalcular:
+            self._precificacao_original = self._entradas_precificacao()
+            self._recalcular = False
+
+    def delete(self, *args, **kwargs):
+        from .vendas_mensais import registrar_alteracao
+        with transaction.atomic():
+            antes = self._contribuicao_venda_no_banco()
+            resultado = super().delete(*args, **kwargs)
+            registrar_alteracao(antes, None)
+        return resultado
 
     def pode_editar(self, user):
         """
@@ -474,6 +663,12 @@ class Orcamento(models.Model):
         return self.status in ['digitando', 'reprovado']
 
 
+# attnames resolvidos uma vez: from_db roda para cada linha lida
+Orcamento._ATRIBUTOS_PRECIFICACAO = tuple(
+    Orcamento._meta.get_field(campo).attname for campo in Orcamento.CAMPOS_PRECIFICACAO)
+Orcamento._ATRIBUTOS_VENDAS = tuple(Orcamento._meta.get_field(campo).attname for campo in Orcamento.CAMPOS_VENDAS)
+
+
 class HistoricoStatusOrcamento(models.Model):
     """Registra o histórico de mudanças de status do orçamento"""
     orcamento = models.ForeignKey(Orcamento, on_delete=models.CASCADE, related_name='historico_status')
@@ -487,11 +682,36 @@ class HistoricoStatusOrcamento(models.Model):
         verbose_name = 'Histórico de Status'
         verbose_name_plural = 'Históricos de Status'
         ordering = ['-data_mudanca']
+        indexes = [
+            models.Index(fields=['orcamento', 'data_mudanca'], name='hist_orc_data_idx'),
+        ]
 
     def __str__(self):
         return f"{self.orcamento.numero_pedido}: {self.status_anterior} -> {self.novo_status}"
 
 
+class VendaMensalVendedor(models.Model):
+    """
+    Resumo de orçamentos ativos por vendedor, mês de emissão e status.
+    Mantido pelo Orcamento.save/delete e pelo recálculo em massa; pode ser
+    refeito com o comando reconstruir_vendas_mensais.
+    """
+    vendedor = models.ForeignKey(Vendedor, on_delete=models.CASCADE, related_name='vendas_mensais')
+    mes = models.DateField(help_text="Primeiro dia do mês de emissão")
+    status = models.CharField(max_length=20, choices=Orcamento.STATUS_CHOICES)
+    quantidade = models.IntegerField(default=0)
+    valor_total = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.0'))
+
+    class Meta:
+        verbose_name = 'Venda Mensal do Vendedor'
+        verbose_name_plural = 'Vendas Mensais dos Vendedores'
+        ordering = ['-mes', 'vendedor', 'status']
+        unique_together = ['vendedor', 'mes', 'status']
+
+    def __str__(self):
+        return f'{self.vendedor} - {self.mes:%m/%Y} - {self.get_status_display()}: {self.quantidade}'
+
+
 class CorOrcamento(models.Model):
     """
     Cores/Variantes de um orçamento
@@ -573,6 +793,19 @@ class CorOrcamento(models.Model):
         """Total de unidades (quantidade + demais)"""
         return self.quantidade_unidades + self.quantidade_demais
 
+    # Alterações uma a uma (admin, shell) atualizam os totais do orçamento;
+    # cores.sincronizar_cores opera em lote e grava os totais por conta própria
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self.orcamento.atualizar_totais_cores()
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            resultado = super().delete(*args, **kwargs)
+            self.orcamento.atualizar_totais_cores()
+        return resultado
+
 
 class Textura(models.Model):
     """Texturas disponíveis para as etiquetas"""
@@ -614,3 +847,57 @@ class Fita(models.Model):
 
     def __str__(self):
         return f"{self.largura_mm}mm - Fator: {self.fator}"
+
+
+class VersaoPrecos(models.Model):
+    """
+    Versão dos dados de precificação (linha única, pk=1). Incrementada na
+    mesma transação de qualquer alteração nas tabelas de preço; ver
+    versao_precos.py.
+    """
+    versao = models.BigIntegerField(default=0)
+    alterado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Versão dos Preços'
+        verbose_name_plural = 'Versão dos Preços'
+
+    def __str__(self):
+        return f'v{self.versao}'
+
+
+class AlteracaoPreco(models.Model):
+    """
+    Registro (somente inclusão) de cada alteração nas tabelas de preço.
+    Alterações em massa (QuerySet.update, bulk_create) geram um registro por
+    operação, com as linhas afetadas em dados.
+    """
+    OPERACAO_CHOICES = [
+        ('insert', 'Inclusão'),
+        ('update', 'Alteração'),
+        ('delete', 'Exclusão'),
+        ('bulk', 'Em massa'),
+    ]
+
+    versao = models.BigIntegerField(db_index=True)
+    modelo = models.CharField(max_length=50)
+    objeto_id = models.BigIntegerField(null=True, blank=True)
+    operacao = models.CharField(max_length=10, choices=OPERACAO_CHOICES)
+    dados = models.JSONField(
+        default=dict, encoder=DjangoJSONEncoder,
+        help_text="Valores antes/depois ({'antes': {...}, 'depois': {...}})"
+    )
+    descricao = models.CharField(max_length=200, blank=True)
+    usuario = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    criado_em = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Alteração de Preço'
+        verbose_name_plural = 'Alterações de Preços'
+        ordering = ['-versao', '-pk']
+        indexes = [
+            models.Index(fields=['modelo', 'objeto_id'], name='alteracao_preco_obj_idx'),
+        ]
+
+    def __str__(self):
+        return f'v{self.versao} {self.get_operacao_display()} {self.modelo} {self.objeto_id or ""}'.strip()
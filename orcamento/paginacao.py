@@ -0,0 +1,100 @@
+"""
+Paginação por cursor (keyset) para listas ordenadas por data decrescente.
+
+Com OFFSET o banco precisa percorrer e descartar todas as linhas das páginas
+anteriores, e o Paginator ainda faz um COUNT(*) obrigatório. Aqui a página
+seguinte é "linhas depois da última (data, id) vista", o que usa o índice e
+custa o mesmo em qualquer profundidade. O cursor é assinado (opaco para o
+usuário e à prova de adulteração).
+"""
+from datetime import date
+
+from django.core import signing
+from django.db.models import Q
+
+SALT_CURSOR = 'orcamento.paginacao.cursor'
+
+PROXIMA = 'p'
+ANTERIOR = 'a'
+
+
+def codificar_cursor(data, pk, direcao):
+    return signing.dumps([data.isoformat(), pk, direcao], salt=SALT_CURSOR, compress=True)
+
+
+def decodificar_cursor(token):
+    """Retorna (data, pk, direcao) ou None se o cursor for inválido"""
+    try:
+        data, pk, direcao = signing.loads(token, salt=SALT_CURSOR)
+        return date.fromisoformat(data), int(pk), direcao
+    except (signing.BadSignature, ValueError, TypeError):
+        return None
+
+
+class PaginaCursor:
+    """Uma página de resultados com os cursores vizinhos"""
+
+    def __init__(self, itens, cursor_anterior=None, cursor_proximo=None):
+        self.itens = itens
+        self.cursor_anterior = cursor_anterior
+        self.cursor_proximo = cursor_proximo
+
+    def __iter__(self):
+        return iter(self.itens)
+
+    def __len__(self):
+        return len(self.itens)
+
+    @property
+    def tem_anterior(self):
+        return self.cursor_anterior is not None
+
+    @property
+    def tem_proxima(self):
+        return self.cursor_proximo is not None
+
+
+def paginar_por_cursor(queryset, token, tamanho, campo_data='data_emissao'):
+    """
+    Página de `tamanho` itens de queryset em ordem (campo_data, pk) decrescente,
+    a partir do cursor `token` (None ou inválido = primeira página)
+    """
+    cursor = decodificar_cursor(token) if token else None
+
+    if cursor is None:
+        direcao = PROXIMA
+        consulta = queryset.order_by(f'-{campo_data}', '-pk')
+    else:
+        data, pk, direcao = cursor
+        if direcao == ANTERIOR:
+            # Linhas mais novas que o cursor, em ordem crescente, e depois invertidas
+            consulta = queryset.filter(
+                Q(**{f'{campo_data}__gt': data}) | Q(**{campo_data: data, 'pk__gt': pk})
+            ).order_by(campo_data, 'pk')
+        else:
+            consulta = queryset.filter(
+                Q(**{f'{campo_data}__lt': data}) | Q(**{campo_data: data, 'pk__lt': pk})
+            ).order_by(f'-{campo_data}', '-pk')
+
+    # Um item a mais indica se existe página além desta
+    itens = list(consulta[:tamanho + 1])
+    tem_mais = len(itens) > tamanho
+    itens = itens[:tamanho]
+
+    if cursor is not None and direcao == ANTERIOR:
+        itens.reverse()
+        tem_anterior, tem_proxima = tem_mais, True
+    else:
+        tem_anterior, tem_proxima = cursor is not None, tem_mais
+
+    if not itens:
+        return PaginaCursor(itens)
+
+    primeiro, ultimo = itens[0], itens[-1]
+    return PaginaCursor(
+        itens,
+        cursor_anterior=codificar_cursor(
+            getattr(primeiro, campo_data), primeiro.pk, ANTERIOR) if tem_anterior else None,
+        cursor_proximo=codificar_cursor(
+            getattr(ultimo, campo_data), ultimo.pk, PROXIMA) if tem_proxima else None,
+    )
@@ -0,0 +1,102 @@
+"""
+Papéis do usuário (superusuário, grupos) resolvidos uma vez por requisição.
+
+A checagem "é gestor?" era feita com uma query em auth_user_groups a cada
+acesso (Vendedor.is_gestor, is_gestor_or_superuser, filtro pode_editar).
+Agora os grupos são lidos uma vez, guardados no próprio objeto User e na
+sessão, e a entrada da sessão é invalidada por uma versão no cache do Django
+que os signals incrementam quando os grupos mudam.
+
+Em produção com vários processos o cache precisa ser compartilhado (Redis,
+Memcached ou banco) para a invalidação valer entre processos; a entrada da
+sessão também expira após PAPEIS_SESSAO_TTL segundos.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+GRUPO_GESTOR = 'Gestor'
+GRUPO_VENDEDOR = 'Vendedor'
+
+CHAVE_SESSAO = 'orcamento_papeis'
+CHAVE_VERSAO_GLOBAL = 'orcamento:papeis:versao'
+
+
+class Papeis:
+    """Papéis resolvidos de um usuário"""
+    __slots__ = ('is_superuser', 'grupos')
+
+    def __init__(self, is_superuser=False, grupos=()):
+        self.is_superuser = is_superuser
+        self.grupos = frozenset(grupos)
+
+    def __repr__(self):
+        return f'<Papeis superuser={self.is_superuser} grupos={sorted(self.grupos)}>'
+
+    @property
+    def is_gestor(self):
+        return GRUPO_GESTOR in self.grupos
+
+    @property
+    def pode_gerenciar(self):
+        """Gestor ou superusuário (acesso às tabelas e ações de aprovação)"""
+        return self.is_superuser or self.is_gestor
+
+
+def _chave_versao_usuario(user_id):
+    return f'{CHAVE_VERSAO_GLOBAL}:{user_id}'
+
+
+def _versao(user_id):
+    versoes = cache.get_many([CHAVE_VERSAO_GLOBAL, _chave_versao_usuario(user_id)])
+    return [versoes.get(CHAVE_VERSAO_GLOBAL, 0), versoes.get(_chave_versao_usuario(user_id), 0)]
+
+
+def _incrementar(chave):
+    try:
+        cache.incr(chave)
+    except ValueError:
+        cache.set(chave, 1, None)
+
+
+def invalidar_papeis(user_ids=None):
+    """Invalida os papéis em cache dos usuários informados (None = todos)"""
+    if user_ids is None:
+        _incrementar(CHAVE_VERSAO_GLOBAL)
+        return
+    for user_id in user_ids:
+        _incrementar(_chave_versao_usuario(user_id))
+
+
+def papeis_do_usuario(user, session=None):
+    """
+    Papéis do usuário, memorizados no objeto user. Com a sessão, reaproveita
+    os grupos lidos em requisições anteriores enquanto a versão não mudar.
+    """
+    if user is None or not user.is_authenticated:
+        return Papeis()
+
+    papeis = getattr(user, '_papeis', None)
+    if papeis is not None:
+        return papeis
+
+    grupos = None
+    versao = _versao(user.pk)
+    if session is not None:
+        entrada = session.get(CHAVE_SESSAO)
+        ttl = getattr(settings, 'PAPEIS_SESSAO_TTL', 300)
+        if (entrada and entrada.get('usuario') == user.pk and entrada.get('versao') == versao
+                and time.time() - entrada.get('em', 0) < ttl):
+            grupos = entrada['grupos']
+
+    if grupos is None:
+        grupos = list(user.groups.values_list('name', flat=True))
+        if session is not None:
+            session[CHAVE_SESSAO] = {
+                'usuario': user.pk, 'versao': versao, 'grupos': grupos, 'em': time.time(),
+            }
+
+    papeis = Papeis(user.is_superuser, grupos)
+    user._papeis = papeis
+    return papeis
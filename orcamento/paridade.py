@@ -0,0 +1,279 @@
+"""
+Paridade da calculadora com as planilhas originais (futuraDesprotegidaModelo*.xlsx).
+
+Cada pasta de trabalho salva guarda um caso: as entradas digitadas na aba
+Tabela e os valores já calculados pelo Excel (o openpyxl lê o cache das
+fórmulas, não recalcula). extrair_caso() lê essas células; os casos podem ser
+gravados em JSON (salvar_casos) para rodar de novo sem abrir as planilhas.
+
+avaliar() passa todos os casos pela calculadora com um único snapshot das
+tabelas (nenhuma consulta por caso) e rastro completo; comparar() confronta
+os resultados e os passos do debug_info (pelo label) com as células
+correspondentes da planilha, e também serve para comparar duas calculadoras
+entre si (ex: uma reescrita contra a atual).
+"""
+import json
+import re
+import time
+from decimal import Decimal
+from pathlib import Path
+
+from .busca import normalizar_busca
+from .calculadora import CalculadoraOrcamento, RASTRO_COMPLETO
+from .models import Acabamento, Batida, Orcamento, TipoCorte, TipoMaterial
+from .snapshot_precos import obter_snapshot
+
+# Entrada do caso -> célula da planilha
+CELULAS_ENTRADA = {
+    'quantidade_metros': ('Tabela', 'M19'),
+    'tabela_manual_metragem': ('Tabela', 'T11'),
+    'largura_mm': ('Tabela', 'C24'),
+    'comprimento_mm': ('Tabela', 'C25'),
+    'material': ('Tabela', 'E23'),
+    'batidas': ('Tabela', 'J23'),
+    'corte': ('Tabela', 'S23'),
+    'acabamento': ('Tabela', 'O25'),
+    'ultrassonico': ('Tabela', 'S25'),
+    'cliente_antigo': ('Tabela', 'AN25'),
+    'cores_densidade1': ('Tabela', 'T39'),
+    'cores_densidade2': ('Tabela', 'W39'),
+}
+
+# Campo do resultado da calculadora -> célula
+CELULAS_RESULTADO = {
+    'unidades': ('Tabela', 'M20'),
+    'milheiros': ('Tabela', 'M21'),
+    'valor_unidade': ('Tabela', 'O15'),
+    'valor_total': ('Tabela', 'S15'),
+    'valor_metro': ('Tabela', 'K15'),
+    'valor_milheiro': ('Tabela', 'E15'),
+}
+
+# Label do passo no debug_info -> célula com o mesmo valor na planilha.
+# Só entram passos com equivalente direto; "Coef. Corte (CC)" da calculadora
+# não é o CC da planilha (CÁLCULO!D26, que é o coeficiente da tabela_fator)
+CELULAS_PASSO = {
+    'Metragem': ('Tabela', 'M19'),
+    'Largura': ('Tabela', 'C24'),
+    'Largura Real': ('Tabela', 'C23'),
+    'Comprimento': ('Tabela', 'C25'),
+    'Soma Unidades (Cores)': ('Plan2', 'L33'),
+    'Preço Base (Tabela)': ('Plan2', 'M33'),
+    'Coeficiente Fator': ('CÁLCULO', 'D26'),
+    'Fator Fita': ('Plan2', 'N33'),
+    'Densidade Cores Fita': ('CÁLCULO', 'D25'),
+    'Valor Goma': ('CÁLCULO', 'B16'),
+    'Fator Batida (Tabela)': ('Tabela', 'AJ102'),
+    'Perc. Aumento Geral': ('Plan2', 'A46'),
+}
+
+# Tabela!AN25 ("Tipo 2 de cliente") -> Orcamento.tipo_cliente
+TIPO_CLIENTE_PLANILHA = {'Novo': 'comercio_novo', 'Antigo': 'comercio_antigo'}
+
+_NUMERO = re.compile(r'-?\d+(?:\.\d+)?')
+
+
+def _numero(valor):
+    """Número de uma célula ou de um passo formatado ("R$ 15.69000", "45 un"), ou None"""
+    if valor is None or isinstance(valor, bool):
+        return None
+    if isinstance(valor, (int, float, Decimal)):
+        return float(valor)
+    encontrado = _NUMERO.search(str(valor))
+    return float(encontrado.group()) if encontrado else None
+
+
+class CasoPlanilha:
+    """Entradas e valores esperados (resultado e passos) de uma planilha salva"""
+
+    def __init__(self, origem, entradas, resultado, passos):
+        self.origem = origem
+        self.entradas = entradas
+        self.resultado = resultado
+        self.passos = passos
+
+    def esperados(self):
+        """{nome: valor} com o resultado e os passos, na ordem do relatório"""
+        return {**self.resultado, **self.passos}
+
+    def como_dict(self):
+        return {'origem': self.origem, 'entradas': self.entradas,
+                'resultado': self.resultado, 'passos': self.passos}
+
+    def __repr__(self):
+        return f'<CasoPlanilha {self.origem}>'
+
+
+def extrair_caso(caminho):
+    """Lê as entradas e o cache das fórmulas de uma planilha no formato do modelo"""
+    from openpyxl import load_workbook
+
+    pasta = load_workbook(caminho, read_only=True, data_only=True)
+    try:
+        def celula(aba, endereco):
+            return pasta[aba][endereco].value
+
+        brutas = {campo: celula(*posicao) for campo, posicao in CELULAS_ENTRADA.items()}
+        acabamento = (brutas['acabamento'] or '').strip()
+        entradas = {
+            'quantidade_metros': int(brutas['quantidade_metros']),
+            'tabela_manual_metragem': int(brutas['tabela_manual_metragem'] or 0) or None,
+            'largura_mm': int(brutas['largura_mm']),
+            'comprimento_mm': int(brutas['comprimento_mm']),
+            'material': str(brutas['material']).strip(),
+            'batidas': int(_numero(brutas['batidas']) or 0) or None,
+            'corte': str(brutas['corte']).strip(),
+            'acabamento': None if normalizar_busca(acabamento) in ('', 'nenhum') else acabamento,
+            'tem_ultrassonico': normalizar_busca(str(brutas['ultrassonico'] or '')) == 'sim',
+            'tipo_cliente': TIPO_CLIENTE_PLANILHA.get(
+                str(brutas['cliente_antigo'] or '').strip(), 'comercio_novo'),
+            'total_unidades_cores': int(
+                (_numero(brutas['cores_densidade1']) or 0) + (_numero(brutas['cores_densidade2']) or 0)),
+        }
+        resultado = {campo: _numero(celula(*posicao)) for campo, posicao in CELULAS_RESULTADO.items()}
+        passos = {label: _numero(celula(*posicao)) for label, posicao in CELULAS_PASSO.items()}
+    finally:
+        pasta.close()
+    return CasoPlanilha(Path(caminho).name, entradas, resultado, passos)
+
+
+def carregar_casos(caminhos):
+    """Casos de planilhas .xlsx, de pastas (todas as .xlsx) e de arquivos .json de salvar_casos"""
+    casos = []
+    for caminho in map(Path, caminhos):
+        if caminho.is_dir():
+            casos.extend(extrair_caso(arquivo) for arquivo in sorted(caminho.glob('*.xlsx'))
+                         if not arquivo.name.startswith('~$'))
+        elif caminho.suffix.lower() == '.json':
+            with open(caminho, encoding='utf-8') as arquivo:
+                casos.extend(CasoPlanilha(**dados) for dados in json.load(arquivo))
+        else:
+            casos.append(extrair_caso(caminho))
+    return casos
+
+
+def salvar_casos(casos, caminho):
+    with open(caminho, 'w', encoding='utf-8') as arquivo:
+        json.dump([caso.como_dict() for caso in casos], arquivo, ensure_ascii=False, indent=2)
+
+
+class _Cadastros:
+    """Resolve os nomes da planilha para os IDs cadastrados (uma consulta por tabela)"""
+
+    def __init__(self):
+        self.materiais = self._por_nome(TipoMaterial)
+        self.cortes = self._por_nome(TipoCorte)
+        self.acabamentos = self._por_nome(Acabamento)
+        self.batidas = {
+            (material_id, numero): pk
+            for pk, material_id, numero in Batida.objects.values_list('pk', 'tipo_material_id', 'numero_batidas')
+        }
+
+    @staticmethod
+    def _por_nome(modelo):
+        nomes = {}
+        for pk, nome, codigo in modelo.objects.values_list('pk', 'nome', 'codigo'):
+            nomes.setdefault(normalizar_busca(codigo.replace('_', ' ')), pk)
+            nomes[normalizar_busca(nome)] = pk
+        return nomes
+
+    def _buscar(self, nomes, valor, descricao):
+        pk = nomes.get(normalizar_busca(valor))
+        if pk is None:
+            raise ValueError(f'{descricao} não cadastrado: {valor!r}')
+        return pk
+
+    def orcamento(self, entradas):
+        """Orçamento não salvo com as entradas do caso"""
+        material_id = self._buscar(self.materiais, entradas['material'], 'Material')
+        return Orcamento(
+            tipo_material_id=material_id,
+            tipo_corte_id=self._buscar(self.cortes, entradas['corte'], 'Corte'),
+            acabamento_id=(self._buscar(self.acabamentos, entradas['acabamento'], 'Acabamento')
+                           if entradas['acabamento'] else None),
+            batida_id=self.batidas.get((material_id, entradas['batidas'])),
+            largura_mm=entradas['largura_mm'],
+            comprimento_mm=entradas['comprimento_mm'],
+            quantidade_metros=entradas['quantidade_metros'],
+            tabela_manual_metragem=entradas['tabela_manual_metragem'],
+            tem_ultrassonico=entradas['tem_ultrassonico'],
+            tipo_cliente=entradas['tipo_cliente'],
+        )
+
+
+def valores_calculados(valores):
+    """{nome: número} do resultado da calculadora no mesmo formato de CasoPlanilha.esperados()"""
+    numeros = {campo: _numero(valores.get(campo)) for campo in CELULAS_RESULTADO}
+    for passo in valores.get('debug_info', {}).get('passos', []):
+        numeros.setdefault(passo['label'], _numero(passo['valor']))
+    return numeros
+
+
+def avaliar(casos, calculadora=CalculadoraOrcamento, snapshot=None):
+    """
+    Calcula todos os casos. Retorna ({origem: valores_calculados ou mensagem
+    de erro}, segundos só do cálculo)
+    """
+    snapshot = snapshot or obter_snapshot()
+    cadastros = _Cadastros()
+    preparados = {}
+    calculados = {}
+    for caso in casos:
+        try:
+            preparados[caso.origem] = (cadastros.orcamento(caso.entradas),
+                                       caso.entradas['total_unidades_cores'])
+        except ValueError as e:
+            calculados[caso.origem] = str(e)
+
+    inicio = time.perf_counter()
+    for origem, (orcamento, total_cores) in preparados.items():
+        try:
+            valores = calculadora(orcamento, snapshot, total_unidades_cores=total_cores,
+                                  rastro=RASTRO_COMPLETO).calcular()
+        except Exception as e:
+            calculados[origem] = f'{type(e).__name__}: {e}'
+            continue
+        calculados[origem] = valores_calculados(valores)
+    return calculados, time.perf_counter() - inicio
+
+
+class Divergencia:
+    def __init__(self, origem, etapa, esperado, obtido):
+        self.origem = origem
+        self.etapa = etapa
+        self.esperado = esperado
+        self.obtido = obtido
+
+    @property
+    def diferenca_relativa(self):
+        if self.esperado is None or self.obtido is None:
+            return float('inf')
+        return abs(self.obtido - self.esperado) / max(abs(self.esperado), 1e-12)
+
+    def __repr__(self):
+        return f'<Divergencia {self.origem} {self.etapa}: {self.esperado} != {self.obtido}>'
+
+
+def comparar(esperados, obtidos, tolerancia=1e-6):
+    """
+    Divergências entre {origem: {etapa: valor}} esperados e obtidos; valores
+    iguais até tolerancia * max(1, |esperado|) contam como iguais. Etapas
+    ausentes nos esperados (None) não são comparadas. Origens com erro (texto)
+    em qualquer dos lados ficam de fora; ver erros_avaliacao()
+    """
+    divergencias = []
+    for origem, etapas in esperados.items():
+        calculado = obtidos.get(origem)
+        if not isinstance(etapas, dict) or not isinstance(calculado, dict):
+            continue
+        for etapa, esperado in etapas.items():
+            if esperado is None:
+                continue
+            obtido = calculado.get(etapa)
+            if obtido is None or abs(obtido - esperado) > tolerancia * max(1.0, abs(esperado)):
+                divergencias.append(Divergencia(origem, etapa, esperado, obtido))
+    return divergencias
+
+
+def erros_avaliacao(obtidos):
+    return {origem: mensagem for origem, mensagem in obtidos.items() if isinstance(mensagem, str)}
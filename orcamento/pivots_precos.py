@@ -0,0 +1,124 @@
+"""
+Grades pivot das tabelas de preço: material x metragem (TabelaPreco),
+acabamento x largura (PrecoAcabamento) e largura x corte por material
+(CoeficienteFator).
+
+Cada grade sai de uma única consulta ordenada com values_list, dobrada em
+Python. As de preço partem do cadastro com LEFT JOIN, para materiais e
+acabamentos ativos sem preço aparecerem como linhas vazias. O resultado fica
+no cache do Django pela versão dos dados de preço (versao_precos.py), então
+qualquer alteração gera chaves novas.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Acabamento, CoeficienteFator, TipoMaterial
+from .versao_precos import versao_atual
+
+
+def _celulas(valores, colunas, nome_coluna):
+    """Lista de células na ordem das colunas; valores: {coluna: (pk, valor)}"""
+    celulas = []
+    for coluna in colunas:
+        pk, valor = valores.get(coluna, (None, None))
+        celulas.append({nome_coluna: coluna, 'id': pk, 'valor': valor, 'existe': pk is not None})
+    return celulas
+
+
+def _dobrar(registros):
+    """
+    (linha_id, linha_nome, coluna, pk, valor) ordenados pela linha ->
+    ([(linha, {coluna: (pk, valor)})], colunas ordenadas). Colunas None vêm
+    do LEFT JOIN de uma linha sem valores.
+    """
+    linhas = []
+    colunas = set()
+    atual = None
+    for linha_id, linha_nome, coluna, pk, valor in registros:
+        if atual is None or atual[0]['id'] != linha_id:
+            atual = ({'id': linha_id, 'nome': linha_nome}, {})
+            linhas.append(atual)
+        if coluna is not None:
+            atual[1][coluna] = (pk, valor)
+            colunas.add(coluna)
+    return linhas, sorted(colunas)
+
+
+def montar_pivot_tabela_precos():
+    """{'metragens': [...], 'linhas': [{'material', 'precos'}]} dos materiais ativos"""
+    registros = TipoMaterial.objects.filter(ativo=True).order_by(
+        'ordem', 'nome', 'pk', 'precos__metragem'
+    ).values_list('pk', 'nome', 'precos__metragem', 'precos__pk', 'precos__preco_metro')
+    linhas, metragens = _dobrar(registros)
+    return {
+        'metragens': metragens,
+        'linhas': [{'material': material, 'precos': _celulas(valores, metragens, 'metragem')}
+                   for material, valores in linhas],
+    }
+
+
+def montar_pivot_acabamentos():
+    """{'larguras': [...], 'linhas': [{'acabamento', 'precos'}]} dos acabamentos ativos"""
+    registros = Acabamento.objects.filter(ativo=True).order_by(
+        'ordem', 'nome', 'pk', 'precos__largura_mm'
+    ).values_list('pk', 'nome', 'precos__largura_mm', 'precos__pk', 'precos__preco')
+    linhas, larguras = _dobrar(registros)
+    return {
+        'larguras': larguras,
+        'linhas': [{'acabamento': acabamento, 'precos': _celulas(valores, larguras, 'largura_mm')}
+                   for acabamento, valores in linhas],
+    }
+
+
+def montar_pivot_coeficientes():
+    """
+    {material_id: {'material', 'cortes', 'linhas': [{'largura', 'coeficientes'}]}}
+    de todos os materiais com coeficientes; as colunas são os cortes do material
+    """
+    registros = CoeficienteFator.objects.order_by(
+        'tipo_material__ordem', 'tipo_material__nome', 'tipo_material_id', 'largura',
+        'codigo_corte__nome',
+    ).values_list(
+        'tipo_material_id', 'tipo_material__nome', 'largura',
+        'codigo_corte_id', 'codigo_corte__nome', 'pk', 'coeficiente',
+    )
+    materiais = {}
+    for material_id, material_nome, largura, corte_id, corte_nome, pk, coeficiente in registros:
+        material = materiais.get(material_id)
+        if material is None:
+            material = materiais[material_id] = {
+                'material': {'id': material_id, 'nome': material_nome}, 'cortes': {}, 'larguras': {},
+            }
+        material['cortes'][corte_id] = corte_nome
+        material['larguras'].setdefault(largura, {})[corte_id] = (pk, coeficiente)
+
+    pivots = {}
+    for material_id, material in materiais.items():
+        cortes = sorted(material['cortes'].items(), key=lambda corte: corte[1])
+        ids_cortes = [corte_id for corte_id, _ in cortes]
+        pivots[material_id] = {
+            'material': material['material'],
+            'cortes': [{'id': corte_id, 'nome': nome} for corte_id, nome in cortes],
+            'linhas': [
+                {'largura': largura, 'coeficientes': _celulas(valores, ids_cortes, 'corte_id')}
+                for largura, valores in material['larguras'].items()
+            ],
+        }
+    return pivots
+
+
+PIVOTS = {
+    'tabela_precos': montar_pivot_tabela_precos,
+    'acabamentos': montar_pivot_acabamentos,
+    'coeficientes': montar_pivot_coeficientes,
+}
+
+
+def obter_pivot(nome, versao=None):
+    """Grade do cache pela versão dos preços (montada na primeira consulta)"""
+    versao = versao_atual() if versao is None else versao
+    return cache.get_or_set(
+        f'pivot_precos:{nome}:{versao}',
+        PIVOTS[nome],
+        getattr(settings, 'PIVOT_PRECOS_CACHE_TTL', 3600),
+    )
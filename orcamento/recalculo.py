@@ -0,0 +1,176 @@
+"""
+Recálculo em massa de orçamentos.
+
+Percorre os orçamentos em lotes paginados por chave (pk), com os totais
+desnormalizados das cores, precifica cada lote com o mesmo snapshot de preços e grava
+só as linhas cujos valores mudaram com bulk_update. Os lotes podem ser distribuídos
+entre processos (ProcessPoolExecutor).
+
+Os processos filhos são criados com "spawn" (nunca herdam a conexão de banco
+do pai) e por isso os modelos são importados dentro das funções: o filho
+importa este módulo antes de o Django estar configurado.
+"""
+import pickle
+import time
+
+TAMANHO_LOTE_PADRAO = 500
+
+# Snapshot recebido pelos processos filhos no initializer
+_snapshot_worker = None
+
+
+def _queryset_lote(pks):
+    """Orçamentos de um lote com apenas os campos usados no cálculo"""
+    from .models import Orcamento
+    return Orcamento.objects.filter(pk__in=pks).only(
+        *Orcamento.CAMPOS_PRECIFICACAO, *Orcamento.CAMPOS_CALCULADOS, *Orcamento.CAMPOS_VENDAS,
+        *Orcamento.CAMPOS_TOTAIS_CORES,
+    ).order_by('pk')
+
+
+def iterar_lotes_pks(queryset, tamanho=TAMANHO_LOTE_PADRAO):
+    """
+    Gera listas de pks em ordem crescente usando paginação por chave
+    (pk > último visto), sem OFFSET e sem carregar a tabela inteira
+    """
+    ultimo = None
+    base = queryset.order_by('pk').values_list('pk', flat=True)
+    while True:
+        consulta = base if ultimo is None else base.filter(pk__gt=ultimo)
+        pks = list(consulta[:tamanho])
+        if not pks:
+            return
+        yield pks
+        ultimo = pks[-1]
+
+
+def recalcular_lote(orcamentos, snapshot, dry_run=False):
+    """
+    Recalcula uma lista de orçamentos e grava os que mudaram, ajustando o
+    resumo de vendas mensais pela diferença de valor_total. Os que não
+    mudaram só têm a versão dos preços atualizada, sem mexer em atualizado_em.
+    Retorna {'processados', 'alterados', 'erros': [(pk, mensagem), ...]}
+    """
+    from django.db import transaction
+    from django.utils import timezone
+    from .calculadora import CalculadoraOrcamento
+    from .models import Orcamento
+    from .vendas_mensais import acumular_delta, aplicar_deltas
+
+    # A versão muda a cada alteração nas tabelas: não conta como mudança
+    campos = [campo for campo in Orcamento.CAMPOS_CALCULADOS if campo != 'versao_precos']
+    alterados = []
+    outra_versao = []
+    erros = []
+    deltas_vendas = {}
+
+    for orcamento in orcamentos:
+        antes = [getattr(orcamento, campo) for campo in campos]
+        versao_antes = orcamento.versao_precos
+        venda_antes = orcamento.contribuicao_venda()
+        try:
+            valores = CalculadoraOrcamento(orcamento, snapshot=snapshot).calcular()
+            orcamento.aplicar_valores(valores, snapshot)
+        except Exception as e:
+            erros.append((orcamento.pk, str(e)))
+            continue
+
+        if [getattr(orcamento, campo) for campo in campos] != antes:
+            alterados.append(orcamento)
+            acumular_delta(deltas_vendas, venda_antes, orcamento.contribuicao_venda())
+        elif orcamento.versao_precos != versao_antes:
+            outra_versao.append(orcamento.pk)
+
+    if (alterados or outra_versao) and not dry_run:
+        # bulk_update não aplica o auto_now de atualizado_em
+        agora = timezone.now()
+        for orcamento in alterados:
+            orcamento.atualizado_em = agora
+        with transaction.atomic():
+            if alterados:
+                Orcamento.objects.bulk_update(alterados, [*Orcamento.CAMPOS_CALCULADOS, 'atualizado_em'])
+                aplicar_deltas(deltas_vendas)
+            if outra_versao:
+                Orcamento.objects.filter(pk__in=outra_versao).update(versao_precos=snapshot.versao_precos)
+
+    return {
+        'processados': len(orcamentos),
+        'alterados': len(alterados),
+        'erros': erros,
+    }
+
+
+def recalcular_pks(pks, snapshot=None, dry_run=False):
+    """Recalcula os orçamentos informados (um lote)"""
+    from .snapshot_precos import obter_snapshot
+    return recalcular_lote(
+        list(_queryset_lote(pks)), snapshot or obter_snapshot(), dry_run=dry_run
+    )
+
+
+def _inicializar_worker(snapshot_serializado):
+    """
+    Initializer dos processos filhos. O snapshot chega serializado porque
+    desserializá-lo importa os modelos, o que só pode ocorrer após o setup.
+    """
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+
+    global _snapshot_worker
+    _snapshot_worker = pickle.loads(snapshot_serializado)
+
+
+def _recalcular_pks_worker(pks, dry_run):
+    return recalcular_pks(pks, snapshot=_snapshot_worker, dry_run=dry_run)
+
+
+def recalcular_orcamentos(queryset, tamanho_lote=TAMANHO_LOTE_PADRAO, workers=1,
+                          dry_run=False, snapshot=None, progresso=None):
+    """
+    Recalcula todos os orçamentos do queryset.
+
+    progresso(resumo) é chamado após cada lote com o resumo acumulado.
+    Retorna o resumo final: processados, alterados, erros e segundos.
+    """
+    from .snapshot_precos import obter_snapshot
+
+    snapshot = snapshot or obter_snapshot()
+    resumo = {'processados': 0, 'alterados': 0, 'erros': [], 'segundos': 0.0}
+    inicio = time.monotonic()
+
+    def acumular(resultado):
+        resumo['processados'] += resultado['processados']
+        resumo['alterados'] += resultado['alterados']
+        resumo['erros'].extend(resultado['erros'])
+        resumo['segundos'] = time.monotonic() - inicio
+        if progresso:
+            progresso(resumo)
+
+    if workers <= 1:
+        for pks in iterar_lotes_pks(queryset, tamanho_lote):
+            acumular(recalcular_pks(pks, snapshot=snapshot, dry_run=dry_run))
+        return resumo
+
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_inicializar_worker,
+        initargs=(pickle.dumps(snapshot),),
+    ) as executor:
+        pendentes = set()
+        for pks in iterar_lotes_pks(queryset, tamanho_lote):
+            pendentes.add(executor.submit(_recalcular_pks_worker, pks, dry_run))
+            # Limita lotes em voo para não acumular todos os pks em memória
+            if len(pendentes) >= workers * 2:
+                prontos, pendentes = wait(pendentes, return_when=FIRST_COMPLETED)
+                for futuro in prontos:
+                    acumular(futuro.result())
+        for futuro in pendentes:
+            acumular(futuro.result())
+
+    return resumo
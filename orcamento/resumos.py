@@ -0,0 +1,74 @@
+"""
+Resumos de orçamentos para a listagem e os dashboards.
+
+Todas as contagens por status, o total geral e os números do mês saem de
+uma única consulta com agregação condicional (COUNT/SUM com FILTER), em vez
+de uma query COUNT por status. Para um único vendedor os mesmos números vêm
+do resumo mensal já agregado (VendaMensalVendedor).
+"""
+from datetime import date
+from decimal import Decimal
+
+from django.db.models import Count, Q, Sum
+
+from .models import Orcamento
+
+
+def inicio_do_mes(hoje=None):
+    """Primeiro dia do mês de hoje"""
+    return (hoje or date.today()).replace(day=1)
+
+
+def resumo_status(queryset, mes_atual=None):
+    """
+    Retorna um dict com:
+        status_counts: {status: quantidade} para todos os status
+        total_orcamentos: quantidade total do queryset
+        orcamentos_mes: quantidade emitida a partir de mes_atual
+        valor_total_mes: soma de valor_total emitida a partir de mes_atual
+    """
+    mes_atual = mes_atual or inicio_do_mes()
+    do_mes = Q(data_emissao__gte=mes_atual)
+
+    agregados = {
+        f'status_{status}': Count('pk', filter=Q(status=status))
+        for status, _ in Orcamento.STATUS_CHOICES
+    }
+    resultado = queryset.order_by().aggregate(
+        total_orcamentos=Count('pk'),
+        orcamentos_mes=Count('pk', filter=do_mes),
+        valor_total_mes=Sum('valor_total', filter=do_mes),
+        **agregados
+    )
+
+    return {
+        'status_counts': {
+            status: resultado[f'status_{status}'] for status, _ in Orcamento.STATUS_CHOICES
+        },
+        'total_orcamentos': resultado['total_orcamentos'],
+        'orcamentos_mes': resultado['orcamentos_mes'],
+        'valor_total_mes': resultado['valor_total_mes'] or Decimal('0.0'),
+    }
+
+
+def resumo_vendas_vendedor(vendedor, mes_atual=None):
+    """
+    Mesmo formato de resumo_status para os orçamentos ativos de um vendedor,
+    lido do resumo mensal (VendaMensalVendedor) em vez da tabela de orçamentos
+    """
+    mes_atual = mes_atual or inicio_do_mes()
+    resumo = {
+        'status_counts': {status: 0 for status, _ in Orcamento.STATUS_CHOICES},
+        'total_orcamentos': 0,
+        'orcamentos_mes': 0,
+        'valor_total_mes': Decimal('0.0'),
+    }
+    for mes, status, quantidade, valor_total in vendedor.vendas_mensais.values_list(
+        'mes', 'status', 'quantidade', 'valor_total'
+    ):
+        resumo['status_counts'][status] = resumo['status_counts'].get(status, 0) + quantidade
+        resumo['total_orcamentos'] += quantidade
+        if mes >= mes_atual:
+            resumo['orcamentos_mes'] += quantidade
+            resumo['valor_total_mes'] += valor_total
+    return resumo
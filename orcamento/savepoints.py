@@ -0,0 +1,30 @@
+"""
+Caminho de savepoints da transação em curso.
+
+Quem guarda estado ligado a alterações não confirmadas (snapshot_precos.py,
+versao_precos.py) anota o caminho em que a alteração aconteceu. Enquanto esse
+caminho continuar aberto a alteração existe; quando um savepoint dele é
+fechado, ela pode ter sido confirmada no nível de cima (release) ou desfeita
+(rollback), e quem anotou decide como tratar a dúvida.
+"""
+from django.db import connection
+
+
+def caminho_atual():
+    """Ids dos savepoints abertos, do mais externo ao mais interno"""
+    # Blocos atomic sem savepoint (None) não podem ser desfeitos sozinhos
+    return tuple(sid for sid in connection.savepoint_ids if sid is not None)
+
+
+def ainda_aberto(caminho):
+    """Todos os savepoints do caminho continuam abertos?"""
+    return caminho_atual()[:len(caminho)] == caminho
+
+
+def caminho_comum(caminho):
+    """Parte do caminho que continua aberta"""
+    atual = caminho_atual()
+    tamanho = 0
+    while tamanho < min(len(caminho), len(atual)) and caminho[tamanho] == atual[tamanho]:
+        tamanho += 1
+    return caminho[:tamanho]
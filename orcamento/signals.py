@@ -0,0 +1,99 @@
+"""
+Signals do app orcamento
+"""
+from django.contrib.auth.models import Group, User
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
+
+from .models import (
+    TipoMaterial, TipoCorte, Batida, TabelaPreco, CoeficienteFator,
+    Acabamento, PrecoAcabamento, ValorCorte, Fita, Configuracao
+)
+from .dependencias import incluir_dependentes
+from .papeis import invalidar_papeis
+from .snapshot_precos import invalidar_snapshot
+from .versao_precos import dados_banco, dados_objeto, registrar_alteracao
+
+# Tabelas lidas pelo SnapshotPrecos: qualquer alteração invalida o snapshot,
+# incrementa a versão dos preços e entra no registro (ver versao_precos.py)
+MODELOS_PRECIFICACAO = [
+    TipoMaterial, TipoCorte, Batida, TabelaPreco, CoeficienteFator,
+    Acabamento, PrecoAcabamento, ValorCorte, Fita, Configuracao,
+]
+
+
+def tabela_precos_alterada(sender, **kwargs):
+    """
+    Invalida imediatamente (para a própria transação enxergar a mudança) e
+    de novo após o commit, pois outra thread pode ter recarregado o snapshot
+    antes do commit, ainda com os dados antigos.
+    """
+    invalidar_snapshot()
+    transaction.on_commit(invalidar_snapshot)
+
+
+def guardar_dados_antes(sender, instance, raw=False, **kwargs):
+    """Valores gravados antes do save, para o registro de alterações"""
+    if raw or instance._state.adding or instance.pk is None:
+        instance._dados_antes = None
+    else:
+        instance._dados_antes = dados_banco(sender, instance.pk)
+
+
+def tabela_precos_salva(sender, instance, created, raw=False, **kwargs):
+    tabela_precos_alterada(sender)
+    if raw:
+        # loaddata: fixtures não entram no registro
+        return
+    antes = getattr(instance, '_dados_antes', None)
+    depois = dados_objeto(instance)
+    if antes == depois:
+        # save sem mudança (ex: update_or_create com os mesmos valores)
+        return
+    registrar_alteracao(sender, 'insert' if created or antes is None else 'update',
+                        instance.pk, antes=antes, depois=depois)
+
+
+def tabela_precos_excluindo(sender, instance, **kwargs):
+    """Orçamentos que referenciam o objeto, coletados antes do SET_NULL"""
+    incluir_dependentes(instance)
+
+
+def tabela_precos_excluida(sender, instance, **kwargs):
+    tabela_precos_alterada(sender)
+    registrar_alteracao(sender, 'delete', instance.pk, antes=dados_objeto(instance))
+
+
+for modelo in MODELOS_PRECIFICACAO:
+    pre_save.connect(guardar_dados_antes, sender=modelo,
+                     dispatch_uid=f'versao_precos_pre_save_{modelo.__name__}')
+    post_save.connect(tabela_precos_salva, sender=modelo,
+                      dispatch_uid=f'snapshot_precos_save_{modelo.__name__}')
+    pre_delete.connect(tabela_precos_excluindo, sender=modelo,
+                       dispatch_uid=f'reprecificacao_pre_delete_{modelo.__name__}')
+    post_delete.connect(tabela_precos_excluida, sender=modelo,
+                        dispatch_uid=f'snapshot_precos_delete_{modelo.__name__}')
+
+
+def grupos_usuario_alterados(sender, instance, action, reverse, pk_set, **kwargs):
+    """user.groups.add/remove/clear ou group.user_set.add/remove/clear"""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        invalidar_papeis([instance.pk])
+    elif pk_set:
+        invalidar_papeis(pk_set)
+    else:
+        # group.user_set.clear() não informa os usuários
+        invalidar_papeis()
+
+
+def grupo_alterado(sender, **kwargs):
+    """Grupo renomeado ou excluído: invalida os papéis de todos"""
+    invalidar_papeis()
+
+
+m2m_changed.connect(grupos_usuario_alterados, sender=User.groups.through,
+                    dispatch_uid='papeis_grupos_usuario')
+post_save.connect(grupo_alterado, sender=Group, dispatch_uid='papeis_grupo_save')
+post_delete.connect(grupo_alterado, sender=Group, dispatch_uid='papeis_grupo_delete')
@@ -0,0 +1,345 @@
+"""
+Snapshot em memória das tabelas de consulta usadas na precificação.
+
+A CalculadoraOrcamento consultava o banco a cada cálculo (TabelaPreco,
+CoeficienteFator, PrecoAcabamento, ValorCorte, Fita, Configuracao e as FKs
+do orçamento). O snapshot carrega tudo de uma vez, fica em memória no processo
+e é trocado por inteiro quando alguma tabela muda (ver signals.py).
+"""
+import hashlib
+import threading
+from decimal import Decimal
+from types import MappingProxyType
+
+from django.db import connection, transaction
+
+from .indice_faixas import IndiceFaixas, PISO, TETO, PRIMEIRO, ULTIMO
+from .models import (
+    TipoMaterial, TipoCorte, Batida, TabelaPreco, CoeficienteFator,
+    Acabamento, PrecoAcabamento, ValorCorte, Fita, Configuracao
+)
+from .invalidacao_precos import obter_verificador
+from .savepoints import ainda_aberto, caminho_atual, caminho_comum
+
+
+class SnapshotPrecos:
+    """
+    Cópia imutável das tabelas de preço em um determinado momento.
+    Nunca é alterada depois de criada: uma mudança nas tabelas gera um
+    snapshot novo com versão maior.
+    """
+
+    def __init__(self, versao, configs, materiais, cortes, batidas, acabamentos,
+                 precos, coeficientes, precos_acabamento, valores_corte, fitas,
+                 versao_global=None, versao_precos=None):
+        self.versao = versao
+        # Versão no backend de invalidação ao carregar (ver invalidacao_precos.py)
+        self.versao_global = versao_global
+        # VersaoPrecos lida antes das tabelas; gravada nos orçamentos calculados
+        self.versao_precos = versao_precos
+        self.configs = MappingProxyType(configs)
+        # {id: (nome, dupla_densidade)}
+        self.materiais = MappingProxyType(materiais)
+        # {id: nome}
+        self.cortes = MappingProxyType(cortes)
+        # {id: fator}
+        self.batidas = MappingProxyType(batidas)
+        # {id: nome}
+        self.acabamentos = MappingProxyType(acabamentos)
+        # {material_id: IndiceFaixas metragem -> preco_metro}
+        self.precos = MappingProxyType(precos)
+        # {(material_id, codigo_calc): IndiceFaixas largura -> coeficiente}
+        self.coeficientes = MappingProxyType(coeficientes)
+        # {acabamento_id: IndiceFaixas largura_mm -> preco}
+        self.precos_acabamento = MappingProxyType(precos_acabamento)
+        # IndiceFaixas largura -> (canvas, cetim)
+        self.valores_corte = valores_corte
+        # IndiceFaixas largura_mm -> fator
+        self.fitas = fitas
+        self._assinatura = None
+
+    def __repr__(self):
+        return f'<SnapshotPrecos v{self.versao}>'
+
+    def __reduce__(self):
+        # MappingProxyType não é serializável; isto permite enviar o snapshot
+        # para processos filhos (recálculo em paralelo)
+        return (self.__class__, (
+            self.versao, dict(self.configs), dict(self.materiais), dict(self.cortes),
+            dict(self.batidas), dict(self.acabamentos), dict(self.precos),
+            dict(self.coeficientes), dict(self.precos_acabamento),
+            self.valores_corte, self.fitas, self.versao_global, self.versao_precos,
+        ))
+
+    @classmethod
+    def carregar(cls, versao=0, versao_global=None):
+        """Lê todas as tabelas de consulta do banco (uma query por tabela)"""
+        from .versao_precos import versao_atual
+        # Lida antes: uma alteração durante a carga deixa a versão menor que os dados
+        versao_precos = versao_atual()
+        configs = {c.chave: c.get_valor() for c in Configuracao.objects.all()}
+
+        materiais = {
+            pk: (nome, dupla_densidade)
+            for pk, nome, dupla_densidade in TipoMaterial.objects.values_list(
+                'pk', 'nome', 'dupla_densidade'
+            )
+        }
+        cortes = dict(TipoCorte.objects.values_list('pk', 'nome'))
+        batidas = dict(Batida.objects.values_list('pk', 'fator'))
+        acabamentos = dict(Acabamento.objects.values_list('pk', 'nome'))
+
+        precos = {}
+        for material_id, metragem, preco in TabelaPreco.objects.order_by(
+            'tipo_material_id', 'metragem'
+        ).values_list('tipo_material_id', 'metragem', 'preco_metro'):
+            precos.setdefault(material_id, []).append((metragem, preco))
+
+        # A calculadora procura o coeficiente pelo código de corte calculado
+        # (tamanho do nome do corte), por isso o agrupamento usa codigo_calc.
+        # Empates na mesma largura ficam com o registro mais antigo (pk).
+        coeficientes = {}
+        for material_id, codigo_calc, largura, coeficiente in CoeficienteFator.objects.order_by(
+            'tipo_material_id', 'codigo_corte__codigo_calc', 'largura', 'pk'
+        ).values_list('tipo_material_id', 'codigo_corte__codigo_calc', 'largura', 'coeficiente'):
+            coeficientes.setdefault((material_id, codigo_calc), []).append((largura, coeficiente))
+
+        precos_acabamento = {}
+        for acabamento_id, largura_mm, preco in PrecoAcabamento.objects.order_by(
+            'acabamento_id', 'largura_mm'
+        ).values_list('acabamento_id', 'largura_mm', 'preco'):
+            precos_acabamento.setdefault(acabamento_id, []).append((largura_mm, preco))
+
+        valores_corte = [
+            (largura, (canvas, cetim))
+            for largura, canvas, cetim in ValorCorte.objects.values_list('largura', 'canvas', 'cetim')
+        ]
+        fitas = Fita.objects.values_list('largura_mm', 'fator')
+
+        return cls(
+            versao=versao,
+            configs=configs,
+            materiais=materiais,
+            cortes=cortes,
+            batidas=batidas,
+            acabamentos=acabamentos,
+            precos={
+                k: IndiceFaixas(v, PISO, fallback=PRIMEIRO) for k, v in precos.items()
+            },
+            coeficientes={
+                k: IndiceFaixas(v, PISO) for k, v in coeficientes.items()
+            },
+            precos_acabamento={
+                k: IndiceFaixas(v, TETO, fallback=ULTIMO) for k, v in precos_acabamento.items()
+            },
+            valores_corte=IndiceFaixas(valores_corte, PISO),
+            fitas=IndiceFaixas(fitas, PISO),
+            versao_global=versao_global,
+            versao_precos=versao_precos,
+        )
+
+    @property
+    def assinatura(self):
+        """
+        Hash do conteúdo das tabelas. Ao contrário da versão (um contador do
+        processo), é igual em todos os processos que leram os mesmos preços,
+        por isso serve de chave em caches compartilhados.
+        """
+        if self._assinatura is None:
+            def indices(mapa):
+                return sorted((chave, indice.chaves, indice.valores) for chave, indice in mapa.items())
+
+            conteudo = repr((
+                sorted(self.configs.items()), sorted(self.materiais.items()),
+                sorted(self.cortes.items()), sorted(self.batidas.items()),
+                sorted(self.acabamentos.items()), indices(self.precos),
+                indices(self.coeficientes), indices(self.precos_acabamento),
+                self.valores_corte.chaves, self.valores_corte.valores,
+                self.fitas.chaves, self.fitas.valores,
+            ))
+            self._assinatura = hashlib.sha1(conteudo.encode()).hexdigest()
+        return self._assinatura
+
+    def reajustado(self, fator, materiais=None, configs=None):
+        """
+        Cópia para simulação com os preços por metro multiplicados por fator
+        (de todos os materiais ou só dos ids informados) e configurações
+        sobrescritas. Não tem versão: nunca substitui o snapshot vigente.
+        """
+        fator = Decimal(str(fator))
+        precos = {
+            material_id: IndiceFaixas(
+                [(chave, valor * fator) for chave, valor in zip(indice.chaves, indice.valores)],
+                indice.modo, fallback=indice.fallback,
+            ) if materiais is None or material_id in materiais else indice
+            for material_id, indice in self.precos.items()
+        }
+        return self.__class__(
+            None, {**self.configs, **(configs or {})}, dict(self.materiais), dict(self.cortes),
+            dict(self.batidas), dict(self.acabamentos), precos, dict(self.coeficientes),
+            dict(self.precos_acabamento), self.valores_corte, self.fitas,
+        )
+
+    # ---------- Entidades ----------
+
+    def material(self, material_id):
+        """Retorna (nome, dupla_densidade) do material"""
+        try:
+            return self.materiais[material_id]
+        except KeyError:
+            raise TipoMaterial.DoesNotExist(f'Material {material_id} não encontrado')
+
+    def nome_corte(self, corte_id):
+        try:
+            return self.cortes[corte_id]
+        except KeyError:
+            raise TipoCorte.DoesNotExist(f'Tipo de corte {corte_id} não encontrado')
+
+    def fator_batida(self, batida_id):
+        try:
+            return self.batidas[batida_id]
+        except KeyError:
+            raise Batida.DoesNotExist(f'Batida {batida_id} não encontrada')
+
+    # ---------- Consultas de faixa ----------
+
+    def preco_base(self, material_id, metragem):
+        """Maior metragem <= metragem; senão a menor metragem do material"""
+        indice = self.precos.get(material_id)
+        if indice is None:
+            return Decimal('0.0')
+        return indice.valor(metragem, Decimal('0.0'))
+
+    def coeficiente_fator(self, material_id, codigo_calc, largura):
+        """Largura exata ou a maior largura <= largura; default 0.75 da planilha"""
+        indice = self.coeficientes.get((material_id, codigo_calc))
+        if indice is None:
+            return Decimal('0.75')
+        return indice.valor(largura, Decimal('0.75'))
+
+    def valor_acabamento(self, acabamento_id, largura):
+        """Menor largura >= largura; senão a maior. Retorna (valor, largura_tabela)"""
+        indice = self.precos_acabamento.get(acabamento_id)
+        encontrado = indice.buscar(largura) if indice is not None else None
+        if encontrado is None:
+            return Decimal('0.0'), 0
+        chave, preco = encontrado
+        return preco, chave
+
+    def valor_corte(self, largura):
+        """(canvas, cetim) da maior largura <= largura, ou None"""
+        return self.valores_corte.valor(largura)
+
+    def fator_fita(self, largura):
+        """Fator da maior largura de fita <= largura; 0.0 se não houver"""
+        return self.fitas.valor(largura, Decimal('0.0'))
+
+
+_lock = threading.Lock()
+_versao = 0
+_snapshot = None
+_local = threading.local()
+
+
+class _Marca:
+    """Alteração nas tabelas de preço ainda não confirmada na transação em curso"""
+
+    def __init__(self, caminho):
+        # Savepoints abertos na alteração mais externa
+        self.caminho = caminho
+        self.snapshot = None
+        self.caminho_snapshot = ()
+
+
+def _limpar_marca():
+    _local.marca = None
+
+
+def _marcar_transacao_alterada():
+    """
+    Marca a transação em curso como tendo alterado tabelas de preço, no
+    nível de savepoint da alteração. O commit limpa a marca.
+    """
+    if not connection.in_atomic_block:
+        return
+    if _marca_transacao() is None:
+        _local.marca = _Marca(caminho_atual())
+        transaction.on_commit(_limpar_marca)
+
+
+def _marca_transacao():
+    """
+    Marca da transação em curso, se ela alterou tabelas de preço. Fora de um
+    bloco atomic a transação acabou e a marca é descartada. Se o savepoint
+    da alteração foi fechado, não há como saber se ela foi confirmada no
+    nível de cima ou desfeita: a marca continua, no nível que ficou aberto.
+    """
+    marca = getattr(_local, 'marca', None)
+    if not connection.in_atomic_block:
+        _local.marca = None
+        return None
+    if marca is not None and not ainda_aberto(marca.caminho):
+        marca.caminho = caminho_comum(marca.caminho)
+        transaction.on_commit(_limpar_marca)
+    return marca
+
+
+def _alterado_em_outro_processo(snapshot):
+    """
+    A versão global mudou desde a carga? O backend é consultado no máximo uma
+    vez por intervalo; dentro de uma transação não consulta, para a
+    transação inteira calcular com os mesmos preços.
+    """
+    if connection.in_atomic_block:
+        return False
+    return obter_verificador().versao() != snapshot.versao_global
+
+
+def obter_snapshot():
+    """
+    Retorna o snapshot vigente, carregando um novo se as tabelas mudaram
+    neste processo (signals) ou em outro (invalidacao_precos.py).
+    A troca é feita por atribuição de referência: quem já pegou o snapshot
+    anterior continua calculando com ele até o fim.
+
+    Em uma transação que alterou tabelas de preço o snapshot inclui dados
+    não confirmados: fica guardado só na marca da transação, nunca no
+    processo, e é recarregado se um savepoint aberto na carga for fechado.
+    """
+    global _snapshot, _versao
+    marca = _marca_transacao()
+    if marca is not None:
+        # Vale enquanto os savepoints abertos na carga continuarem abertos;
+        # sem savepoint não há como reconhecer a transação, então recarrega
+        if (marca.snapshot is None or marca.snapshot.versao != _versao
+                or not marca.caminho_snapshot or not ainda_aberto(marca.caminho_snapshot)):
+            marca.snapshot = SnapshotPrecos.carregar(
+                versao=_versao, versao_global=obter_verificador().versao(forcar=True))
+            marca.caminho_snapshot = caminho_atual()
+        return marca.snapshot
+
+    snapshot = _snapshot
+    if (snapshot is not None and snapshot.versao == _versao
+            and not _alterado_em_outro_processo(snapshot)):
+        return snapshot
+
+    with _lock:
+        if _snapshot is not None and _snapshot.versao == _versao and _alterado_em_outro_processo(_snapshot):
+            _versao += 1
+        if _snapshot is None or _snapshot.versao != _versao:
+            # Versão global lida antes das tabelas: uma alteração durante a
+            # carga provoca outra carga na próxima verificação
+            versao_global = obter_verificador().versao(forcar=True)
+            _snapshot = SnapshotPrecos.carregar(versao=_versao, versao_global=versao_global)
+        return _snapshot
+
+
+def invalidar_snapshot():
+    """
+    Marca o snapshot atual como obsoleto; o próximo acesso recarrega. Dentro
+    de uma transação, marca também a transação (ver obter_snapshot).
+    """
+    global _versao
+    with _lock:
+        _versao += 1
+    _marcar_transacao_alterada()
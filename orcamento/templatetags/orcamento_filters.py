@@ -4,9 +4,12 @@ register = template.Library()
 
 
 @register.filter
-def densidade(queryset, valor):
-    """Filtra cores por densidade"""
-    return queryset.filter(densidade=valor)
+def densidade(cores, valor):
+    """
+    Filtra cores por densidade em memória: sobre orcamento.cores.all (ou um
+    prefetch) lê as cores uma vez só, em vez de uma consulta por densidade
+    """
+    return [cor for cor in cores if cor.densidade == valor]
 
 
 @register.filter
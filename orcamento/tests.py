@@ -1,3 +1,1440 @@
-from django.test import TestCase
+import json
+from datetime import date
+from decimal import Decimal
 
-# Create your tests here.
+from django.core.exceptions import ValidationError
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from .dependencias import orcamentos_afetados, reprecificar_afetados
+from .indice_faixas import IndiceFaixas, PISO, TETO, PRIMEIRO, ULTIMO, faixas_alteradas
+from .models import (
+    TipoMaterial, TipoCorte, TabelaPreco, CoeficienteFator,
+    Acabamento, PrecoAcabamento, ValorCorte, Fita, Orcamento, Configuracao,
+    AlteracaoPreco, VersaoPrecos
+)
+from .resumos import resumo_status
+from .snapshot_precos import SnapshotPrecos, obter_snapshot
+from .versao_precos import alteracao_precos, registrar_em_massa, versao_atual
+
+
+class IndiceFaixasTest(SimpleTestCase):
+    """Busca piso/teto e regras de fallback do índice"""
+
+    def test_piso_com_fallback_primeiro(self):
+        indice = IndiceFaixas([(500, 'b'), (300, 'a'), (1000, 'c')], PISO, fallback=PRIMEIRO)
+        self.assertEqual(indice.buscar(300), (300, 'a'))
+        self.assertEqual(indice.buscar(999), (500, 'b'))
+        self.assertEqual(indice.buscar(50000), (1000, 'c'))
+        self.assertEqual(indice.buscar(10), (300, 'a'))
+
+    def test_teto_com_fallback_ultimo(self):
+        indice = IndiceFaixas([(10, 'a'), (20, 'b')], TETO, fallback=ULTIMO)
+        self.assertEqual(indice.buscar(1), (10, 'a'))
+        self.assertEqual(indice.buscar(11), (20, 'b'))
+        self.assertEqual(indice.buscar(21), (20, 'b'))
+
+    def test_sem_fallback_e_vazio(self):
+        self.assertIsNone(IndiceFaixas([(10, 'a')], PISO).buscar(9))
+        self.assertIsNone(IndiceFaixas([], TETO, fallback=ULTIMO).buscar(9))
+        self.assertEqual(IndiceFaixas([], PISO).valor(9, 'padrao'), 'padrao')
+
+    def test_chave_repetida_mantem_primeiro_valor(self):
+        indice = IndiceFaixas([(10, 'a'), (10, 'b')], PISO)
+        self.assertEqual(indice.buscar(10), (10, 'a'))
+
+
+class FaixasAlteradasTest(SimpleTestCase):
+    """Intervalos em que dois índices resolvem valores diferentes"""
+
+    def test_piso_altera_apenas_a_faixa_da_chave(self):
+        antigo = IndiceFaixas([(10, 'a'), (20, 'b'), (30, 'c')], PISO)
+        novo = IndiceFaixas([(10, 'a'), (20, 'x'), (30, 'c')], PISO)
+        self.assertEqual(faixas_alteradas(antigo, novo), [(20, 30)])
+
+    def test_piso_fallback_primeiro_inclui_abaixo_da_menor_chave(self):
+        antigo = IndiceFaixas([(300, 'a'), (500, 'b')], PISO, fallback=PRIMEIRO)
+        novo = IndiceFaixas([(300, 'x'), (500, 'b')], PISO, fallback=PRIMEIRO)
+        self.assertEqual(faixas_alteradas(antigo, novo), [(None, 500)])
+
+    def test_teto_nova_chave(self):
+        antigo = IndiceFaixas([(10, 'a'), (20, 'b')], TETO, fallback=ULTIMO)
+        novo = IndiceFaixas([(10, 'a'), (15, 'x'), (20, 'b')], TETO, fallback=ULTIMO)
+        self.assertEqual(faixas_alteradas(antigo, novo), [(10, 15)])
+
+    def test_teto_ultima_chave_cobre_acima(self):
+        antigo = IndiceFaixas([(10, 'a'), (20, 'b')], TETO, fallback=ULTIMO)
+        novo = IndiceFaixas([(10, 'a'), (20, 'x')], TETO, fallback=ULTIMO)
+        self.assertEqual(faixas_alteradas(antigo, novo), [(10, None)])
+
+    def test_sem_alteracao(self):
+        indice = IndiceFaixas([(10, 'a')], PISO)
+        self.assertEqual(faixas_alteradas(indice, IndiceFaixas([(10, 'a')], PISO)), [])
+
+
+class TabelasPrecosMixin:
+    """Tabelas de preço com faixas, lacunas e um material/corte/acabamento sem tabela"""
+
+    LARGURAS = list(range(0, 130, 1)) + [200, 250, 1000]
+    METRAGENS = [1, 100, 299, 300, 301, 499, 500, 999, 1000, 2500, 4999, 5000, 14999, 15000, 99999]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.materiais = [
+            TipoMaterial.objects.create(nome='Tafetá', codigo='TAFETA'),
+            TipoMaterial.objects.create(nome='Canvas', codigo='CANVAS'),
+            TipoMaterial.objects.create(nome='Sem Tabela', codigo='VAZIO'),
+        ]
+        # codigo_calc distintos: o ORM não define desempate entre cortes iguais
+        cls.cortes = [
+            TipoCorte.objects.create(nome='MITRA', codigo='MITRA', codigo_calc=5),
+            TipoCorte.objects.create(nome='ENVELOPE', codigo='ENVELOPE', codigo_calc=8),
+            TipoCorte.objects.create(nome='SEM COEF', codigo='SEM_COEF', codigo_calc=99),
+        ]
+        for m, material in enumerate(cls.materiais[:2]):
+            for i, metragem in enumerate([300, 500, 1000, 5000, 15000]):
+                TabelaPreco.objects.create(
+                    tipo_material=material, metragem=metragem,
+                    preco_metro=Decimal('20.00') - i - m
+                )
+            for c, corte in enumerate(cls.cortes[:2]):
+                for i, largura in enumerate([10, 12, 20, 30, 50, 100]):
+                    CoeficienteFator.objects.create(
+                        tipo_material=material, codigo_corte=corte, largura=largura,
+                        coeficiente=Decimal('0.5') + Decimal(i + c + m) / 10
+                    )
+
+        cls.acabamentos = [
+            Acabamento.objects.create(nome='Goma F', codigo='GOMA_F'),
+            Acabamento.objects.create(nome='Sem Preço', codigo='SEM_PRECO'),
+        ]
+        for i, largura in enumerate([10, 15, 20, 40, 67, 100]):
+            PrecoAcabamento.objects.create(
+                acabamento=cls.acabamentos[0], largura_mm=largura, preco=Decimal(i + 1) / 100
+            )
+        for i, largura in enumerate([10, 20, 50]):
+            ValorCorte.objects.create(largura=largura, canvas=Decimal(i) / 10, cetim=Decimal(i) / 20)
+        for i, largura in enumerate([10, 12, 15, 24, 33, 100]):
+            Fita.objects.create(largura_mm=largura, fator=Decimal(80 - i * 10))
+
+
+class SnapshotPrecosGoldenTest(TabelasPrecosMixin, TestCase):
+    """
+    Compara as consultas do snapshot com as queries ORM que a calculadora
+    fazia antes do índice em memória (mesmas regras de faixa e fallback).
+    """
+
+    def setUp(self):
+        self.snapshot = SnapshotPrecos.carregar()
+
+    # Queries originais da CalculadoraOrcamento
+
+    def _orm_preco_base(self, material, metragem):
+        preco = TabelaPreco.objects.filter(
+            metragem__lte=metragem, tipo_material=material
+        ).order_by('-metragem').first()
+        if not preco:
+            preco = TabelaPreco.objects.filter(tipo_material=material).order_by('metragem').first()
+        return preco.preco_metro if preco else Decimal('0.0')
+
+    def _orm_coeficiente_fator(self, material, codigo_calc, largura):
+        coef = CoeficienteFator.objects.filter(
+            largura=largura, tipo_material=material, codigo_corte__codigo_calc=codigo_calc
+        ).first()
+        if not coef:
+            coef = CoeficienteFator.objects.filter(
+                largura__lte=largura, tipo_material=material, codigo_corte__codigo_calc=codigo_calc
+            ).order_by('-largura').first()
+        return coef.coeficiente if coef else Decimal('0.75')
+
+    def _orm_valor_acabamento(self, acabamento, largura):
+        preco_obj = PrecoAcabamento.objects.filter(
+            largura_mm__gte=largura, acabamento=acabamento
+        ).order_by('largura_mm').first()
+        if not preco_obj:
+            preco_obj = PrecoAcabamento.objects.filter(acabamento=acabamento).order_by('-largura_mm').first()
+        if not preco_obj:
+            return Decimal('0.0'), 0
+        return preco_obj.preco, preco_obj.largura_mm
+
+    def _orm_valor_corte(self, largura):
+        valor_corte = ValorCorte.objects.filter(largura__lte=largura).order_by('-largura').first()
+        return (valor_corte.canvas, valor_corte.cetim) if valor_corte else None
+
+    def _orm_fator_fita(self, largura):
+        fita = Fita.objects.filter(largura_mm=largura).first()
+        if not fita:
+            fita = Fita.objects.filter(largura_mm__lte=largura).order_by('-largura_mm').first()
+        return fita.fator if fita else Decimal('0.0')
+
+    def test_preco_base(self):
+        for material in self.materiais:
+            for metragem in self.METRAGENS:
+                self.assertEqual(
+                    self.snapshot.preco_base(material.pk, metragem),
+                    self._orm_preco_base(material, metragem),
+                    (material.codigo, metragem)
+                )
+
+    def test_coeficiente_fator(self):
+        for material in self.materiais:
+            for corte in self.cortes:
+                for largura in self.LARGURAS:
+                    self.assertEqual(
+                        self.snapshot.coeficiente_fator(material.pk, corte.codigo_calc, largura),
+                        self._orm_coeficiente_fator(material, corte.codigo_calc, largura),
+                        (material.codigo, corte.codigo, largura)
+                    )
+
+    def test_valor_acabamento(self):
+        for acabamento in self.acabamentos:
+            for largura in self.LARGURAS:
+                self.assertEqual(
+                    self.snapshot.valor_acabamento(acabamento.pk, largura),
+                    self._orm_valor_acabamento(acabamento, largura),
+                    (acabamento.codigo, largura)
+                )
+
+    def test_valor_corte_e_fita(self):
+        for largura in self.LARGURAS:
+            self.assertEqual(self.snapshot.valor_corte(largura), self._orm_valor_corte(largura), largura)
+            self.assertEqual(self.snapshot.fator_fita(largura), self._orm_fator_fita(largura), largura)
+
+
+class CalculadoraVetorialTest(TabelasPrecosMixin, TestCase):
+    """A calculadora vetorizada reproduz a CalculadoraOrcamento após os arredondamentos"""
+
+    def test_igual_a_calculadora_decimal(self):
+        import numpy as np
+        from .calculadora import CalculadoraOrcamento
+        from .calculadora_vetorial import CASAS, COLUNAS, CalculadoraVetorial
+
+        Configuracao.objects.create(chave='perc_aumento_geral', valor='1.03', tipo_dado='decimal')
+        snapshot = SnapshotPrecos.carregar()
+        tipos_cliente = [t for t, _ in Orcamento.TIPO_CLIENTE_CHOICES]
+        orcamentos = []
+        for i, largura in enumerate(self.LARGURAS):
+            for j, metros in enumerate(self.METRAGENS):
+                orcamentos.append(Orcamento(
+                    tipo_material=self.materiais[(i + j) % 3],
+                    tipo_corte=self.cortes[i % 3],
+                    acabamento=[None, *self.acabamentos][j % 3],
+                    largura_mm=largura,
+                    comprimento_mm=[0, 7, 25, 33, 60][(i + 2 * j) % 5],
+                    quantidade_metros=metros,
+                    quantidade_unidades=i * 37,
+                    tabela_manual_metragem=[None, None, 777][i % 3],
+                    tem_ultrassonico=bool(j % 2),
+                    tipo_cliente=tipos_cliente[(i + j) % len(tipos_cliente)],
+                ))
+
+        colunas = {
+            coluna: np.array([getattr(o, coluna) or 0 for o in orcamentos])
+            for coluna in COLUNAS if coluna != 'tipo_cliente'
+        }
+        colunas['tipo_cliente'] = np.array([o.tipo_cliente for o in orcamentos])
+        vetorial = CalculadoraVetorial(snapshot).calcular(colunas)
+
+        for i, orcamento in enumerate(orcamentos):
+            if vetorial['empates'][i]:
+                continue
+            valores = CalculadoraOrcamento(orcamento, snapshot, total_unidades_cores=0).calcular()
+            for campo in CASAS:
+                self.assertEqual(
+                    round(float(valores[campo]), CASAS[campo]), round(vetorial[campo][i], CASAS[campo]),
+                    (i, campo)
+                )
+
+    def test_reajuste_da_tabela(self):
+        snapshot = SnapshotPrecos.carregar()
+        material = self.materiais[0]
+        reajustado = snapshot.reajustado(Decimal('1.03'), materiais={material.pk})
+        self.assertIsNone(reajustado.versao)
+        self.assertEqual(reajustado.preco_base(material.pk, 500), Decimal('19.00') * Decimal('1.03'))
+        self.assertEqual(
+            reajustado.preco_base(self.materiais[1].pk, 500), snapshot.preco_base(self.materiais[1].pk, 500))
+
+
+class MatrizPrecosTest(TabelasPrecosMixin, TestCase):
+    """Tabela de venda: cada célula igual ao orçamento digitado, exportações em cache"""
+
+    def _parametros(self, **extras):
+        return {
+            'material_id': self.materiais[1].pk, 'tipo_corte_id': self.cortes[0].pk,
+            'acabamento_id': self.acabamentos[0].pk, 'tipo_cliente': 'industria_novo',
+            'tem_ultrassonico': True, 'larguras': list(range(5, 130, 3)),
+            'metragens': self.METRAGENS, 'comprimentos': [0, 25, 40], **extras,
+        }
+
+    def test_celulas_iguais_a_calculadora(self):
+        from .calculadora import CalculadoraOrcamento
+        from .matriz_precos import gerar_matriz
+
+        snapshot = SnapshotPrecos.carregar()
+        for campo in ['valor_milheiro', 'valor_unidade']:
+            matriz = gerar_matriz(snapshot=snapshot, **self._parametros(campo=campo))
+            for comprimento, linhas in matriz.tabelas():
+                for largura, valores in linhas:
+                    for metragem, valor in zip(matriz.metragens, valores):
+                        orcamento = Orcamento(
+                            tipo_material=self.materiais[1], tipo_corte=self.cortes[0],
+                            acabamento=self.acabamentos[0], largura_mm=largura,
+                            comprimento_mm=comprimento, quantidade_metros=metragem,
+                            tipo_cliente='industria_novo', tem_ultrassonico=True,
+                        )
+                        esperado = CalculadoraOrcamento(
+                            orcamento, snapshot, total_unidades_cores=0).calcular()[campo]
+                        self.assertEqual(valor, esperado, (campo, comprimento, largura, metragem))
+
+    def test_exportacoes_e_cache(self):
+        from io import BytesIO
+        from openpyxl import load_workbook
+        from .matriz_precos import exportar
+
+        parametros = self._parametros(larguras=[10, 20], metragens=[500, 1000], comprimentos=[40, 60])
+        conteudo = exportar('csv', **parametros).decode('utf-8-sig')
+        self.assertIn('Largura (mm)', conteudo)
+        self.assertEqual(len(conteudo.strip().splitlines()), 3 + 2 * 2)
+        with self.assertNumQueries(0):
+            self.assertEqual(exportar('csv', **parametros).decode('utf-8-sig'), conteudo)
+
+        planilha = load_workbook(BytesIO(exportar('xlsx', **parametros)))
+        self.assertEqual(planilha.sheetnames, ['40 mm', '60 mm'])
+
+    def test_view(self):
+        from django.contrib.auth.models import User
+
+        self.client.force_login(User.objects.create_user('vendas'))
+        dados = {
+            'tipo_material': self.materiais[0].pk, 'tipo_corte': self.cortes[0].pk,
+            'tipo_cliente': 'comercio_novo', 'comprimentos': '40', 'campo': 'valor_milheiro',
+        }
+        resposta = self.client.get('/tabela-vendas/', dados)
+        self.assertEqual(resposta.status_code, 200)
+        # Sem larguras/metragens: usa as das tabelas de coeficiente e de preço
+        self.assertEqual(resposta.context['matriz'].metragens, [300, 500, 1000, 5000, 15000])
+
+        resposta = self.client.get('/tabela-vendas/', {**dados, 'formato': 'csv'})
+        self.assertIn('attachment', resposta['Content-Disposition'])
+
+        resposta = self.client.get('/tabela-vendas/', {**dados, 'larguras': '1,x'})
+        self.assertIsNone(resposta.context['matriz'])
+        self.assertIn('larguras', resposta.context['form'].errors)
+
+
+class ParidadePlanilhaTest(TabelasPrecosMixin, TestCase):
+    """Caso lido de uma planilha no formato do modelo e comparado passo a passo"""
+
+    def test_extrai_avalia_e_compara(self):
+        import tempfile
+        from pathlib import Path
+        from openpyxl import Workbook
+        from .calculadora import CalculadoraOrcamento, RASTRO_COMPLETO
+        from .paridade import (
+            CELULAS_PASSO, CELULAS_RESULTADO, avaliar, carregar_casos, comparar, salvar_casos,
+            valores_calculados,
+        )
+
+        entradas = {
+            'M19': 500, 'T11': 500, 'C23': 20, 'C24': 20, 'C25': 40, 'E23': 'Tafetá',
+            'J23': '20 batidas', 'S23': 'MITRA ', 'O25': 'Nenhum', 'S25': 'NÃO', 'AN25': 'Novo',
+            'T39': 30, 'W39': None,
+        }
+        orcamento = Orcamento(
+            tipo_material=self.materiais[0], tipo_corte=self.cortes[0], largura_mm=20,
+            comprimento_mm=40, quantidade_metros=500, tabela_manual_metragem=500,
+            tipo_cliente='comercio_novo')
+        calculados = valores_calculados(CalculadoraOrcamento(
+            orcamento, total_unidades_cores=30, rastro=RASTRO_COMPLETO).calcular())
+
+        pasta = Workbook()
+        abas = {'Tabela': pasta.active}
+        abas['Tabela'].title = 'Tabela'
+        abas['Plan2'] = pasta.create_sheet('Plan2')
+        abas['CÁLCULO'] = pasta.create_sheet('CÁLCULO')
+        for endereco, valor in entradas.items():
+            abas['Tabela'][endereco] = valor
+        for nome, (aba, endereco) in {**CELULAS_RESULTADO, **CELULAS_PASSO}.items():
+            if calculados.get(nome) is not None:
+                abas[aba][endereco] = calculados[nome]
+        # Divergência proposital em um passo
+        abas['Plan2']['M33'] = calculados['Preço Base (Tabela)'] + 1
+
+        with tempfile.TemporaryDirectory() as pasta_temp:
+            pasta.save(Path(pasta_temp) / 'caso.xlsx')
+            casos = carregar_casos([pasta_temp])
+            salvar_casos(casos, Path(pasta_temp) / 'casos.json')
+            (caso,) = carregar_casos([Path(pasta_temp) / 'casos.json'])
+
+        self.assertEqual(caso.entradas['total_unidades_cores'], 30)
+        self.assertEqual(caso.entradas['tipo_cliente'], 'comercio_novo')
+        self.assertIsNone(caso.entradas['acabamento'])
+
+        obtidos, segundos = avaliar([caso])
+        self.assertGreaterEqual(segundos, 0)
+        divergencias = comparar({caso.origem: caso.esperados()}, obtidos)
+        self.assertEqual([(d.origem, d.etapa) for d in divergencias],
+                         [('caso.xlsx', 'Preço Base (Tabela)')])
+        self.assertEqual(comparar(obtidos, obtidos, tolerancia=0), [])
+
+
+class PivotsPrecosTest(TabelasPrecosMixin, TestCase):
+    """Grades pivot de uma consulta, em cache pela versão dos preços, com ETag"""
+
+    def setUp(self):
+        from django.core.cache import cache
+        # Versões se repetem entre testes (rollback): descarta grades de outros testes
+        cache.clear()
+
+    def test_grades_em_uma_consulta(self):
+        from .pivots_precos import montar_pivot_coeficientes, montar_pivot_tabela_precos
+
+        with self.assertNumQueries(1):
+            pivot = montar_pivot_tabela_precos()
+        self.assertEqual(pivot['metragens'], [300, 500, 1000, 5000, 15000])
+        linhas = {linha['material']['nome']: linha['precos'] for linha in pivot['linhas']}
+        self.assertEqual(linhas['Tafetá'][0]['valor'], Decimal('20.00'))
+        self.assertFalse(any(celula['existe'] for celula in linhas['Sem Tabela']))
+
+        with self.assertNumQueries(1):
+            coeficientes = montar_pivot_coeficientes()
+        canvas = coeficientes[self.materiais[1].pk]
+        self.assertEqual([corte['nome'] for corte in canvas['cortes']], ['ENVELOPE', 'MITRA'])
+        self.assertEqual([linha['largura'] for linha in canvas['linhas']], [10, 12, 20, 30, 50, 100])
+        self.assertEqual(canvas['linhas'][0]['coeficientes'][1]['valor'], Decimal('0.6'))
+
+    def test_cache_e_etag(self):
+        from django.contrib.auth.models import User
+
+        self.client.force_login(User.objects.create_superuser('gestor'))
+        url = '/tabelas/coeficientes/pivot/'
+        resposta = self.client.get(url, {'material': self.materiais[1].pk})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.context['material']['nome'], 'Canvas')
+        etag = resposta['ETag']
+
+        resposta = self.client.get(url, {'material': self.materiais[1].pk}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 304)
+        self.assertEqual(resposta['ETag'], etag)
+        self.assertIn('no-cache', resposta['Cache-Control'])
+
+        # Alteração nos preços gera versão nova: grade e ETag novos
+        preco = TabelaPreco.objects.filter(tipo_material=self.materiais[0]).first()
+        preco.preco_metro += 1
+        preco.save()
+        resposta = self.client.get(url, {'material': self.materiais[1].pk}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertNotEqual(resposta['ETag'], etag)
+
+        resposta = self.client.get('/tabelas/precos/pivot/')
+        linhas = {linha['material']['nome']: linha['precos'] for linha in resposta.context['pivot_data']}
+        self.assertIn(preco.preco_metro, [celula['valor'] for celula in linhas['Tafetá']])
+
+    def test_edicao_em_lote(self):
+        from django.contrib.auth.models import User
+
+        self.client.force_login(User.objects.create_superuser('gestor'))
+        tafeta, _, sem_tabela = self.materiais
+        url = '/tabelas/precos/pivot/'
+        versao = versao_atual()
+        lote = [
+            {'linha': tafeta.pk, 'coluna': 300, 'original': '20,00', 'valor': '21,50'},
+            {'linha': sem_tabela.pk, 'coluna': 500, 'original': '', 'valor': '9.9'},
+        ]
+        resposta = self.client.post(url, {'alteracoes': json.dumps(lote)})
+        self.assertEqual(resposta.status_code, 302)
+        self.assertEqual(TabelaPreco.objects.get(tipo_material=tafeta, metragem=300).preco_metro,
+                         Decimal('21.50'))
+        self.assertEqual(TabelaPreco.objects.get(tipo_material=sem_tabela, metragem=500).preco_metro,
+                         Decimal('9.90'))
+        # Uma versão e um registro com o conjunto de mudanças
+        self.assertEqual(versao_atual(), versao + 1)
+        alteracao = AlteracaoPreco.objects.get(versao=versao + 1)
+        self.assertEqual((alteracao.operacao, alteracao.usuario.username), ('bulk', 'gestor'))
+        self.assertEqual((len(alteracao.dados['antes']), len(alteracao.dados['depois'])), (1, 2))
+
+        # Original desatualizado (outra pessoa alterou) e valor inválido: nada é gravado
+        lote = [
+            {'linha': tafeta.pk, 'coluna': 300, 'original': '20.00', 'valor': '22'},
+            {'linha': tafeta.pk, 'coluna': 500, 'original': '19.00', 'valor': '1.234'},
+        ]
+        resposta = self.client.post(url, {'alteracoes': json.dumps(lote)})
+        self.assertEqual(resposta.status_code, 400)
+        self.assertEqual(len(resposta.context['erros_edicao']), 2)
+        self.assertEqual(resposta.context['alteracoes_pendentes'], lote)
+        self.assertEqual(versao_atual(), versao + 1)
+        self.assertEqual(TabelaPreco.objects.get(tipo_material=tafeta, metragem=500).preco_metro,
+                         Decimal('19.00'))
+
+
+class AjustesPrecosTest(TabelasPrecosMixin, TestCase):
+    """Ajustes em massa com UPDATE/INSERT ... SELECT, pré-visualização e desfazer"""
+
+    def test_percentual_e_arredondamento(self):
+        from .ajustes_precos import Ajuste, aplicar, previsao
+
+        tafeta = self.materiais[0]
+        ajuste = Ajuste('tabela_precos', grupos=[tafeta.pk], faixa_min=500, faixa_max=5000,
+                        percentual=Decimal('4.5'), passo=Decimal('0.05'))
+        previa = previsao(ajuste)
+        self.assertEqual((previa['total'], previa['alteradas'], previa['criadas']), (3, 3, 0))
+        self.assertEqual([linha['novo'] for linha in previa['linhas']],
+                         [Decimal('19.85'), Decimal('18.80'), Decimal('17.75')])
+
+        versao = versao_atual()
+        resumo = aplicar(ajuste)
+        self.assertEqual((resumo['alteradas'], resumo['criadas']), (3, 0))
+        precos = dict(TabelaPreco.objects.filter(tipo_material=tafeta).values_list('metragem', 'preco_metro'))
+        self.assertEqual([precos[m] for m in (300, 500, 1000, 5000, 15000)],
+                         [Decimal('20.00')] + [linha['novo'] for linha in previa['linhas']] + [Decimal('16.00')])
+        self.assertEqual(versao_atual(), versao + 1)
+        self.assertEqual(resumo['alteracao'].operacao, 'bulk')
+        self.assertEqual(len(resumo['alteracao'].dados['depois']), 3)
+
+        # Abaixo do mínimo do campo: recusado sem gravar
+        with self.assertRaises(ValidationError):
+            aplicar(Ajuste('tabela_precos', grupos=[tafeta.pk], percentual=-100))
+        self.assertEqual(versao_atual(), versao + 1)
+
+    def test_copia_com_ajuste_e_desfazer(self):
+        from .ajustes_precos import Ajuste, aplicar, desfazer
+
+        tafeta, canvas, sem_tabela = self.materiais
+        mitra = self.cortes[0]
+        CoeficienteFator.objects.create(tipo_material=sem_tabela, codigo_corte=mitra, largura=10,
+                                        coeficiente=Decimal('9'))
+        ajuste = Ajuste('coeficientes', grupos=[tafeta.pk], cortes=[mitra.pk], percentual=10, destino=sem_tabela.pk)
+        resumo = aplicar(ajuste)
+        self.assertEqual((resumo['alteradas'], resumo['criadas']), (1, 5))
+        copiados = dict(CoeficienteFator.objects.filter(tipo_material=sem_tabela).values_list('largura', 'coeficiente'))
+        origem = dict(CoeficienteFator.objects.filter(tipo_material=tafeta, codigo_corte=mitra)
+                      .values_list('largura', 'coeficiente'))
+        self.assertEqual(copiados, {largura: (valor * Decimal('1.1')).quantize(Decimal('0.00001'))
+                                    for largura, valor in origem.items()})
+
+        # Desfazer restaura o valor alterado e exclui as linhas criadas
+        resultado = desfazer(resumo['alteracao'])
+        self.assertEqual(resultado, {'restauradas': 1, 'recriadas': 0, 'excluidas': 5})
+        self.assertEqual(list(CoeficienteFator.objects.filter(tipo_material=sem_tabela)
+                              .values_list('largura', 'coeficiente')), [(10, Decimal('9'))])
+
+        # Registro cujas linhas mudaram depois não é desfeito
+        resumo = aplicar(Ajuste('coeficientes', grupos=[canvas.pk], acrescimo=Decimal('0.1')))
+        coeficiente = CoeficienteFator.objects.filter(tipo_material=canvas).first()
+        coeficiente.coeficiente += 1
+        coeficiente.save()
+        with self.assertRaises(ValidationError):
+            desfazer(resumo['alteracao'])
+
+    def test_views(self):
+        from django.contrib.auth.models import User
+
+        self.client.force_login(User.objects.create_superuser('gestor'))
+        tafeta, canvas, sem_tabela = self.materiais
+        dados = {'tabela': 'tabela_precos', 'materiais': [canvas.pk], 'percentual': '10'}
+        resposta = self.client.post('/tabelas/precos/ajuste/', {**dados, 'previsualizar': ''})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.context['previsao']['alteradas'], 5)
+        self.assertFalse(AlteracaoPreco.objects.filter(operacao='bulk').exists())
+
+        resposta = self.client.post('/tabelas/precos/ajuste/', {**dados, 'aplicar': ''})
+        self.assertRedirects(resposta, '/tabelas/precos/alteracoes/')
+        alteracao = AlteracaoPreco.objects.get(operacao='bulk')
+        self.assertEqual(alteracao.usuario.username, 'gestor')
+        self.assertEqual(TabelaPreco.objects.get(tipo_material=canvas, metragem=300).preco_metro, Decimal('20.90'))
+
+        resposta = self.client.post(f'/tabelas/precos/alteracoes/{alteracao.pk}/desfazer/')
+        self.assertRedirects(resposta, '/tabelas/precos/alteracoes/')
+        self.assertEqual(TabelaPreco.objects.get(tipo_material=canvas, metragem=300).preco_metro, Decimal('19.00'))
+
+        # Cópia da visão lista: set-based, com a mesma mensagem de contagem
+        resposta = self.client.post('/tabelas/precos/copiar/', {
+            'source_material': tafeta.pk, 'dest_material': sem_tabela.pk}, follow=True)
+        self.assertIn('5 criados, 0 atualizados', str(list(resposta.context['messages'])[0]))
+        self.assertEqual(TabelaPreco.objects.filter(tipo_material=sem_tabela).count(), 5)
+
+
+class RastroCalculoTest(TestCase):
+    """debug_info só é montado (e as cores só são lidas) quando pedido"""
+
+    def test_niveis(self):
+        from .calculadora import CalculadoraOrcamento, RASTRO_COMPLETO, RASTRO_RESUMO
+        from .models import CorOrcamento
+
+        material = TipoMaterial.objects.create(nome='Tafetá', codigo='TAFETA')
+        corte = TipoCorte.objects.create(nome='MITRA', codigo='MITRA', codigo_calc=5)
+        TabelaPreco.objects.create(tipo_material=material, metragem=500, preco_metro=Decimal('10.00'))
+        orcamento = Orcamento.objects.create(
+            cliente='X', tipo_material=material, tipo_corte=corte, largura_mm=20,
+            comprimento_mm=50, quantidade_metros=600)
+        CorOrcamento.objects.create(orcamento=orcamento, codigo_cor='F01', quantidade_unidades=7)
+        snapshot = SnapshotPrecos.carregar()
+
+        with self.assertNumQueries(0):
+            sem_rastro = CalculadoraOrcamento(orcamento, snapshot).calcular()
+        self.assertEqual(sem_rastro['debug_info'], {})
+
+        resumo = CalculadoraOrcamento(orcamento, snapshot, rastro=RASTRO_RESUMO).calcular()
+        completo = CalculadoraOrcamento(orcamento, snapshot, rastro=RASTRO_COMPLETO).calcular()
+        self.assertEqual(resumo['valor_total'], sem_rastro['valor_total'])
+        self.assertEqual(completo['valor_total'], sem_rastro['valor_total'])
+        self.assertEqual(len(resumo['debug_info']['passos']), 11)
+        self.assertIn(
+            {'label': 'Soma Unidades (Cores)', 'valor': '7 un'}, completo['debug_info']['passos'])
+
+        with self.assertRaises(ValueError):
+            CalculadoraOrcamento(orcamento, snapshot, rastro='tudo')
+
+
+class MemoCalculoTest(TestCase):
+    """Memo da pré-visualização: LRU, TTL e invalidação pelas tabelas"""
+
+    def test_lru_e_ttl(self):
+        from .memo_calculo import MemoCalculo
+
+        memo = MemoCalculo(tamanho=2, ttl=60)
+        for chave in ['a', 'b', 'a', 'c']:
+            memo.obter(chave, lambda: chave.upper())
+        # 'b' era o menos usado quando 'c' entrou
+        self.assertEqual(memo.obter('b', lambda: 'novo'), 'novo')
+        self.assertEqual((memo.acertos, memo.falhas, memo.descartados), (1, 4, 2))
+
+        expirado = MemoCalculo(tamanho=2, ttl=0)
+        expirado.obter('a', lambda: 1)
+        self.assertEqual(expirado.obter('a', lambda: 2), 2)
+        self.assertEqual(expirado.expirados, 1)
+
+    def test_calcular_com_memo(self):
+        from .memo_calculo import calcular_com_memo, obter_memo, reiniciar_memo
+
+        material = TipoMaterial.objects.create(nome='Tafetá', codigo='TAFETA')
+        corte = TipoCorte.objects.create(nome='MITRA', codigo='MITRA', codigo_calc=5)
+        preco = TabelaPreco.objects.create(tipo_material=material, metragem=500, preco_metro=Decimal('10.00'))
+        reiniciar_memo()
+
+        def previa():
+            return calcular_com_memo(Orcamento(
+                tipo_material=material, tipo_corte=corte, largura_mm=20, comprimento_mm=50,
+                quantidade_metros=600), total_unidades_cores=10)
+
+        primeiro = previa()
+        self.assertEqual(previa()['valor_total'], primeiro['valor_total'])
+        self.assertEqual(obter_memo().estatisticas()['acertos'], 1)
+
+        preco.preco_metro = Decimal('12.00')
+        preco.save()
+        self.assertGreater(previa()['valor_total'], primeiro['valor_total'])
+        self.assertEqual(obter_memo().estatisticas()['falhas'], 2)
+
+
+class CoalescenciaCalculoTest(TestCase):
+    """Pedidos de pré-visualização superados por um mais novo recebem 204"""
+
+    def test_descarta_pedidos_superados(self):
+        from django.contrib.auth.models import User
+        from .coalescencia import PedidoCalculo, estatisticas, zerar_estatisticas
+
+        material = TipoMaterial.objects.create(nome='Tafetá', codigo='TAFETA')
+        corte = TipoCorte.objects.create(nome='MITRA', codigo='MITRA', codigo_calc=5)
+        self.client.force_login(User.objects.create_user('vendas'))
+        zerar_estatisticas()
+
+        def calcular(seq, sessao='form-1'):
+            return self.client.post('/api/calcular/', {
+                'tipo_material': material.pk, 'tipo_corte': corte.pk, 'largura_mm': 20,
+                'comprimento_mm': 50, 'quantidade_metros': 600,
+                'calculo_sessao': sessao, 'calculo_seq': seq,
+            })
+
+        self.assertEqual(calcular(2).status_code, 200)
+        self.assertEqual(calcular(1).status_code, 204)
+        self.assertEqual(calcular(1, sessao='form-2').status_code, 200)
+        self.assertEqual(calcular(3).status_code, 200)
+
+        # Um pedido mais novo chega enquanto o anterior calcula
+        pedido = PedidoCalculo(self.client.session['_auth_user_id'], 'form-1', 4)
+        self.assertTrue(pedido.registrar())
+        PedidoCalculo(self.client.session['_auth_user_id'], 'form-1', 5).registrar()
+        self.assertTrue(pedido.superado())
+
+        metricas = estatisticas()
+        self.assertEqual((metricas['recebidos'], metricas['calculos_evitados']), (4, 1))
+        self.assertEqual(metricas['descartados_depois'], 1)
+
+
+class RecalculoEmMassaTest(TestCase):
+    """Recálculo em lotes por pk: grava só o que mudou"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tafeta = TipoMaterial.objects.create(nome='Tafetá', codigo='TAFETA')
+        cls.cetim = TipoMaterial.objects.create(nome='Cetim', codigo='CETIM')
+        corte = TipoCorte.objects.create(nome='MITRA', codigo='MITRA', codigo_calc=5)
+        cls.preco_tafeta = TabelaPreco.objects.create(
+            tipo_material=cls.tafeta, metragem=500, preco_metro=Decimal('10.00'))
+        TabelaPreco.objects.create(tipo_material=cls.cetim, metragem=500, preco_metro=Decimal('20.00'))
+        for indice in range(5):
+            Orcamento.objects.create(
+                cliente=f'C{indice}', tipo_material=cls.tafeta if indice < 3 else cls.cetim,
+                tipo_corte=corte, largura_mm=20, comprimento_mm=50, quantidade_metros=600,
+                status='aprovado' if indice == 0 else 'digitando')
+        # data_emissao é auto_now_add
+        Orcamento.objects.filter(cliente='C1').update(data_emissao=date(2024, 1, 1))
+        Orcamento.objects.exclude(cliente='C1').update(data_emissao=date(2024, 6, 1))
+
+    def gravados(self):
+        return {o.pk: (o.valor_total, o.atualizado_em, o.versao_precos) for o in Orcamento.objects.all()}
+
+    def recalcular(self, *argumentos):
+        from io import StringIO
+        from django.core.management import call_command
+
+        saida = StringIO()
+        call_command('recalcular_orcamentos', *argumentos, stdout=saida)
+        return saida.getvalue()
+
+    def test_iterar_lotes_pks(self):
+        from .recalculo import iterar_lotes_pks
+
+        pks = sorted(Orcamento.objects.values_list('pk', flat=True))
+        lotes = list(iterar_lotes_pks(Orcamento.objects.all(), tamanho=2))
+        self.assertEqual([len(lote) for lote in lotes], [2, 2, 1])
+        self.assertEqual([pk for lote in lotes for pk in lote], pks)
+        self.assertEqual(list(iterar_lotes_pks(Orcamento.objects.none())), [])
+
+    def test_precos_iguais_nao_gravam(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .recalculo import recalcular_orcamentos
+
+        antes = self.gravados()
+        with CaptureQueriesContext(connection) as consultas:
+            resumo = recalcular_orcamentos(Orcamento.objects.all(), tamanho_lote=2)
+        self.assertEqual((resumo['processados'], resumo['alterados'], resumo['erros']), (5, 0, []))
+        self.assertFalse([c['sql'] for c in consultas if c['sql'].startswith('UPDATE')])
+        self.assertEqual(self.gravados(), antes)
+
+    def test_dry_run_e_filtros(self):
+        self.preco_tafeta.preco_metro = Decimal('12.00')
+        self.preco_tafeta.save()
+        antes = self.gravados()
+
+        saida = self.recalcular('--dry-run', '--chunk-size', '2')
+        self.assertIn('Processados: 5', saida)
+        self.assertIn('Alterados: 3 (não gravados)', saida)
+        self.assertEqual(self.gravados(), antes)
+
+        self.assertIn('Processados: 3', self.recalcular('--dry-run', '--material', 'tafeta'))
+        self.assertIn('Processados: 4', self.recalcular('--dry-run', '--status', 'digitando'))
+        self.assertIn('Processados: 4', self.recalcular('--dry-run', '--since', '2024-03-01'))
+
+        saida = self.recalcular('--material', str(self.tafeta.pk), '--status', 'digitando')
+        self.assertIn('Alterados: 2', saida)
+        depois = self.gravados()
+        alterados = {pk for pk in antes if depois[pk][0] != antes[pk][0]}
+        self.assertEqual(alterados, set(Orcamento.objects.filter(
+            tipo_material=self.tafeta, status='digitando').values_list('pk', flat=True)))
+
+    def test_argumentos_invalidos(self):
+        from django.core.management.base import CommandError
+
+        for argumentos in (['--workers', '0'], ['--chunk-size', '0'], ['--since', '01/2024'],
+                           ['--material', 'inexistente']):
+            with self.assertRaises(CommandError):
+                self.recalcular(*argumentos)
+
+    def test_worker_com_snapshot_serializado(self):
+        import pickle
+        from . import recalculo
+
+        # O que cada processo de --workers executa, sem criar processos (o
+        # banco de teste só existe nesta conexão)
+        self.preco_tafeta.preco_metro = Decimal('12.00')
+        self.preco_tafeta.save()
+        snapshot = obter_snapshot()
+        pks = sorted(Orcamento.objects.values_list('pk', flat=True))
+        try:
+            recalculo._inicializar_worker(pickle.dumps(snapshot))
+            self.assertEqual(recalculo._snapshot_worker.assinatura, snapshot.assinatura)
+            resultado = recalculo._recalcular_pks_worker(pks, False)
+        finally:
+            recalculo._snapshot_worker = None
+        self.assertEqual((resultado['processados'], resultado['alterados']), (5, 3))
+
+
+@override_settings(REPRECIFICACAO_EM_SEGUNDO_PLANO=False)
+class ReprecificacaoIncrementalTest(TestCase):
+    """Só os orçamentos abertos cuja consulta mudou são recalculados"""
+
+    @classmethod
+    def setUpTestData(cls):
+        material = TipoMaterial.objects.create(nome='Tafetá', codigo='TAFETA')
+        corte = TipoCorte.objects.create(nome='MITRA', codigo='MITRA', codigo_calc=5)
+        cls.preco_500 = TabelaPreco.objects.create(
+            tipo_material=material, metragem=500, preco_metro=Decimal('10.00'))
+        TabelaPreco.objects.create(
+            tipo_material=material, metragem=1000, preco_metro=Decimal('8.00'))
+        cls.orcamentos = {}
+        for nome, metros, status in [
+            ('faixa_500', 600, 'digitando'),
+            ('faixa_1000', 1200, 'digitando'),
+            ('faixa_500_aprovado', 700, 'aprovado'),
+        ]:
+            cls.orcamentos[nome] = Orcamento.objects.create(
+                cliente=nome, tipo_material=material, tipo_corte=corte, largura_mm=20,
+                comprimento_mm=50, quantidade_metros=metros, status=status)
+
+    def test_reprecifica_apenas_afetados(self):
+        antigo = obter_snapshot()
+        self.preco_500.preco_metro = Decimal('12.00')
+        self.preco_500.save()
+        novo = obter_snapshot()
+
+        afetados = set(orcamentos_afetados(antigo, novo).values_list('cliente', flat=True))
+        self.assertEqual(afetados, {'faixa_500'})
+
+        valores = {nome: (o.valor_total, o.atualizado_em) for nome, o in self.orcamentos.items()}
+        resumo = reprecificar_afetados(antigo, novo)
+        self.assertEqual((resumo['processados'], resumo['alterados']), (1, 1))
+        for nome, orcamento in self.orcamentos.items():
+            orcamento.refresh_from_db()
+            if nome == 'faixa_500':
+                self.assertGreater(orcamento.valor_total, valores[nome][0])
+                self.assertGreater(orcamento.atualizado_em, valores[nome][1])
+            else:
+                self.assertEqual((orcamento.valor_total, orcamento.atualizado_em), valores[nome])
+        # Os abertos não afetados passam para a versão nova sem recálculo
+        self.assertEqual(self.orcamentos['faixa_1000'].versao_precos, novo.versao_precos)
+        self.assertEqual(self.orcamentos['faixa_500_aprovado'].versao_precos, antigo.versao_precos)
+
+    def test_versao_nova_sem_mudanca_de_preco(self):
+        from .recalculo import recalcular_orcamentos
+
+        # Preço de outro material: nenhum orçamento muda de valor
+        cetim = TipoMaterial.objects.create(nome='Cetim', codigo='CETIM')
+        TabelaPreco.objects.create(tipo_material=cetim, metragem=500, preco_metro=Decimal('30.00'))
+        antes = {o.pk: (o.valor_total, o.atualizado_em, o.versao_precos) for o in Orcamento.objects.all()}
+
+        self.assertEqual(recalcular_orcamentos(Orcamento.objects.all(), dry_run=True)['alterados'], 0)
+        self.assertEqual(
+            {o.pk: (o.valor_total, o.atualizado_em, o.versao_precos) for o in Orcamento.objects.all()}, antes)
+
+        self.assertEqual(recalcular_orcamentos(Orcamento.objects.all())['alterados'], 0)
+        for orcamento in Orcamento.objects.all():
+            self.assertEqual((orcamento.valor_total, orcamento.atualizado_em), antes[orcamento.pk][:2])
+            self.assertEqual(orcamento.versao_precos, versao_atual())
+
+    def test_exclusao_com_set_null_reprecifica(self):
+        from django.contrib.auth.models import User
+
+        acabamento = Acabamento.objects.create(nome='Goma F', codigo='GOMA_F')
+        PrecoAcabamento.objects.create(acabamento=acabamento, largura_mm=50, preco=Decimal('0.5'))
+        orcamento = self.orcamentos['faixa_1000']
+        sem_acabamento = orcamento.valor_total
+        orcamento.acabamento = acabamento
+        orcamento.save()
+        self.assertGreater(orcamento.valor_total, sem_acabamento)
+
+        # O SET_NULL apaga a referência: o orçamento é coletado antes da exclusão
+        self.client.force_login(User.objects.create_superuser('gestor'))
+        with self.captureOnCommitCallbacks(execute=True):
+            resposta = self.client.post(f'/tabelas/acabamentos/{acabamento.pk}/deletar/')
+        self.assertEqual(resposta.status_code, 302)
+        orcamento.refresh_from_db()
+        self.assertIsNone(orcamento.acabamento_id)
+        self.assertEqual(orcamento.valor_total, sem_acabamento)
+
+    def test_falha_na_reprecificacao_nao_desfaz_a_alteracao(self):
+        from unittest import mock
+        from django.contrib.auth.models import User
+
+        acabamento = Acabamento.objects.create(nome='Goma F', codigo='GOMA_F')
+        self.client.force_login(User.objects.create_superuser('gestor'))
+        with mock.patch('orcamento.dependencias.reprecificar_afetados', side_effect=RuntimeError('falhou')), \
+                self.assertLogs('orcamento.dependencias', 'ERROR'), \
+                self.captureOnCommitCallbacks(execute=True):
+            resposta = self.client.post(f'/tabelas/acabamentos/{acabamento.pk}/deletar/')
+        self.assertEqual(resposta.status_code, 302)
+        self.assertFalse(Acabamento.objects.filter(pk=acabamento.pk).exists())
+
+    def test_recalcular_pendentes(self):
+        from io import StringIO
+        from django.core.management import call_command
+
+        # Alteração sem reprecificação: os abertos ficam na versão antiga
+        self.preco_500.preco_metro = Decimal('12.00')
+        self.preco_500.save()
+        saida = StringIO()
+        call_command('recalcular_orcamentos', '--pendentes', stdout=saida)
+        self.assertIn('Processados: 2', saida.getvalue())
+        self.assertIn('Alterados: 1', saida.getvalue())
+        self.assertEqual(
+            set(Orcamento.objects.exclude(versao_precos=versao_atual()).values_list('cliente', flat=True)),
+            {'faixa_500_aprovado'})
+
+
+class VersaoPrecosTest(TestCase):
+    """Versão dos preços incrementada na transação e registro de alterações"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.material = TipoMaterial.objects.create(nome='Tafetá', codigo='TAFETA')
+        cls.preco = TabelaPreco.objects.create(
+            tipo_material=cls.material, metragem=500, preco_metro=Decimal('10.00'))
+        from django.contrib.auth.models import User
+        cls.usuario = User.objects.create_user('gestor_precos')
+
+    def test_save_e_delete(self):
+        versao = versao_atual()
+        self.preco.preco_metro = Decimal('12.00')
+        self.preco.save()
+        self.assertEqual(versao_atual(), versao + 1)
+        alteracao = AlteracaoPreco.objects.get(versao=versao + 1)
+        self.assertEqual((alteracao.modelo, alteracao.operacao, alteracao.objeto_id),
+                         ('TabelaPreco', 'update', self.preco.pk))
+        self.assertEqual(Decimal(alteracao.dados['antes']['preco_metro']), Decimal('10.00'))
+        self.assertEqual(Decimal(alteracao.dados['depois']['preco_metro']), Decimal('12.00'))
+
+        # save sem mudança não gera versão
+        self.preco.save()
+        self.assertEqual(versao_atual(), versao + 1)
+
+        self.preco.delete()
+        self.assertEqual(versao_atual(), versao + 2)
+        self.assertEqual(AlteracaoPreco.objects.get(versao=versao + 2).operacao, 'delete')
+
+    def test_alteracao_agrupada(self):
+        versao = versao_atual()
+        with alteracao_precos(usuario=self.usuario, descricao='Reajuste'):
+            TabelaPreco.objects.create(
+                tipo_material=self.material, metragem=1000, preco_metro=Decimal('8.00'))
+            Fita.objects.create(largura_mm=20, fator=Decimal('1.50'))
+            antes = list(TabelaPreco.objects.values('pk', 'preco_metro'))
+            TabelaPreco.objects.update(preco_metro=Decimal('9.00'))
+            registrar_em_massa(TabelaPreco, antes=antes,
+                               depois=list(TabelaPreco.objects.values('pk', 'preco_metro')))
+        self.assertEqual(versao_atual(), versao + 1)
+        alteracoes = AlteracaoPreco.objects.filter(versao=versao + 1)
+        self.assertEqual(sorted(alteracoes.values_list('operacao', flat=True)),
+                         ['bulk', 'insert', 'insert'])
+        self.assertEqual({(a.usuario, a.descricao) for a in alteracoes}, {(self.usuario, 'Reajuste')})
+
+    def test_rollback_desfaz_versao(self):
+        versao = versao_atual()
+        with self.assertRaises(ValueError):
+            with alteracao_precos():
+                Fita.objects.create(largura_mm=30, fator=Decimal('2.00'))
+                raise ValueError
+        self.assertEqual(versao_atual(), versao)
+        self.assertFalse(AlteracaoPreco.objects.filter(versao__gt=versao).exists())
+
+    def test_rollback_de_savepoint_desfaz_versao_do_contexto(self):
+        from django.db import transaction
+
+        versao = versao_atual()
+        with alteracao_precos():
+            with self.assertRaises(ValueError), transaction.atomic():
+                Fita.objects.create(largura_mm=30, fator=Decimal('2.00'))
+                raise ValueError
+            fita = Fita.objects.create(largura_mm=40, fator=Decimal('2.50'))
+        self.assertEqual(versao_atual(), versao + 1)
+        self.assertEqual(AlteracaoPreco.objects.get(versao=versao + 1).objeto_id, fita.pk)
+
+    def test_savepoint_liberado_mantem_versao_do_contexto(self):
+        from django.db import transaction
+
+        versao = versao_atual()
+        with alteracao_precos():
+            with transaction.atomic():
+                Fita.objects.create(largura_mm=30, fator=Decimal('2.00'))
+            Fita.objects.create(largura_mm=40, fator=Decimal('2.50'))
+        self.assertEqual(versao_atual(), versao + 1)
+        self.assertEqual(AlteracaoPreco.objects.filter(versao=versao + 1).count(), 2)
+
+
+class InvalidacaoPrecosTest(TestCase):
+    """Verificação da versão global entre processos"""
+
+    def test_verificador_respeita_intervalo(self):
+        from .invalidacao_precos import BackendBanco, VerificadorVersao
+
+        verificador = VerificadorVersao(BackendBanco(), intervalo=60)
+        with self.assertNumQueries(1):
+            versao = verificador.versao()
+            self.assertEqual(verificador.versao(), versao)
+        # Outro processo grava uma versão nova: só aparece após o intervalo ou forçando
+        VersaoPrecos.objects.filter(pk=1).update(versao=versao + 10)
+        self.assertEqual(verificador.versao(), versao)
+        self.assertEqual(verificador.versao(forcar=True), versao + 10)
+
+    def test_snapshot_guarda_versao_global(self):
+        from .invalidacao_precos import reiniciar_verificador
+
+        reiniciar_verificador()
+        Fita.objects.create(largura_mm=20, fator=Decimal('1.50'))
+        self.assertEqual(obter_snapshot().versao_global, versao_atual())
+
+    def test_rollback_nao_deixa_snapshot_fantasma(self):
+        from django.db import transaction
+
+        Fita.objects.create(largura_mm=20, fator=Decimal('1.50'))
+        self.assertEqual(obter_snapshot().fator_fita(20), Decimal('1.50'))
+        try:
+            with transaction.atomic():
+                Fita.objects.filter(largura_mm=20).update(fator=Decimal('9.99'))
+                registrar_em_massa(Fita)
+                self.assertEqual(obter_snapshot().fator_fita(20), Decimal('9.99'))
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertEqual(obter_snapshot().fator_fita(20), Decimal('1.50'))
+
+    def test_savepoint_liberado_mantem_alteracao(self):
+        from django.db import transaction
+
+        Fita.objects.create(largura_mm=20, fator=Decimal('1.50'))
+        self.assertEqual(obter_snapshot().fator_fita(20), Decimal('1.50'))
+        with transaction.atomic():
+            Fita.objects.filter(largura_mm=20).update(fator=Decimal('2.50'))
+            registrar_em_massa(Fita)
+            self.assertEqual(obter_snapshot().fator_fita(20), Decimal('2.50'))
+        self.assertEqual(obter_snapshot().fator_fita(20), Decimal('2.50'))
+
+    def test_backend_arquivo(self):
+        import os
+        import tempfile
+        from django.test import override_settings
+        from .invalidacao_precos import BackendArquivo
+
+        with tempfile.TemporaryDirectory() as pasta:
+            with override_settings(PRECOS_INVALIDACAO_ARQUIVO=os.path.join(pasta, 'precos.versao')):
+                backend = BackendArquivo()
+            self.assertIsNone(backend.versao())
+            backend.publicar()
+            primeira = backend.versao()
+            backend.publicar()
+            self.assertNotEqual(backend.versao(), primeira)
+
+
+class ResumoStatusTest(TestCase):
+    """Contagens por status e números do mês em uma única consulta"""
+
+    def test_resumo(self):
+        material = TipoMaterial.objects.create(nome='Tafetá', codigo='TAFETA')
+        corte = TipoCorte.objects.create(nome='MITRA', codigo='MITRA', codigo_calc=5)
+        for status in ['digitando', 'digitando', 'aprovado']:
+            Orcamento.objects.create(
+                cliente='Cliente', tipo_material=material, tipo_corte=corte,
+                largura_mm=20, comprimento_mm=50, quantidade_metros=500, status=status)
+        Orcamento.objects.filter(status='aprovado').update(valor_total=Decimal('100.00'))
+        Orcamento.objects.filter(status='digitando').update(valor_total=Decimal('10.00'))
+
+        with self.assertNumQueries(1):
+            resumo = resumo_status(Orcamento.objects.all(), date.today().replace(day=1))
+
+        self.assertEqual(resumo['status_counts']['digitando'], 2)
+        self.assertEqual(resumo['status_counts']['aprovado'], 1)
+        self.assertEqual(resumo['status_counts']['cancelado'], 0)
+        self.assertEqual(resumo['total_orcamentos'], 3)
+        self.assertEqual(resumo['orcamentos_mes'], 3)
+        self.assertEqual(resumo['valor_total_mes'], Decimal('120.00'))
+
+        futuro = resumo_status(Orcamento.objects.all(), date(2999, 1, 1))
+        self.assertEqual((futuro['orcamentos_mes'], futuro['valor_total_mes']), (0, Decimal('0.0')))
+
+
+class VendaMensalVendedorTest(TestCase):
+    """Resumo mensal mantido pelo save/delete confere com a reconstrução"""
+
+    def test_manutencao_incremental(self):
+        from django.contrib.auth.models import User
+        from .models import Vendedor, VendaMensalVendedor
+        from .vendas_mensais import reconstruir_vendas_mensais
+
+        material = TipoMaterial.objects.create(nome='Tafetá', codigo='TAFETA')
+        corte = TipoCorte.objects.create(nome='MITRA', codigo='MITRA', codigo_calc=5)
+        TabelaPreco.objects.create(tipo_material=material, metragem=300, preco_metro=Decimal('10.00'))
+        vendedores = [
+            Vendedor.objects.create(user=User.objects.create_user(nome), nome_completo=nome, email='v@v.com')
+            for nome in ('ana', 'bruno')
+        ]
+        orcamentos = [
+            Orcamento.objects.create(
+                cliente=f'Cliente {i}', tipo_material=material, tipo_corte=corte, largura_mm=20,
+                comprimento_mm=50, quantidade_metros=300 + i * 100, vendedor=vendedores[i % 2])
+            for i in range(4)
+        ]
+
+        orcamentos[0].status = 'aprovado'
+        orcamentos[0].save()
+        orcamentos[1].vendedor = vendedores[0]
+        orcamentos[1].save()
+        orcamento = Orcamento.objects.get(pk=orcamentos[2].pk)
+        orcamento.ativo = False
+        orcamento.save()
+        orcamentos[3].delete()
+
+        def estado():
+            return sorted(VendaMensalVendedor.objects.filter(quantidade__gt=0).values_list(
+                'vendedor_id', 'mes', 'status', 'quantidade', 'valor_total'))
+
+        incremental = estado()
+        reconstruir_vendas_mensais()
+        self.assertEqual(incremental, estado())
+        self.assertEqual(
+            vendedores[0].total_vendas_mes(),
+            orcamentos[0].valor_total + orcamentos[1].valor_total)
+        self.assertEqual(vendedores[1].total_vendas_mes(), Decimal('0.0'))
+
+
+class PrecificacaoSaveTest(TestCase):
+    """O save só precifica quando um campo de preço muda"""
+
+    def test_recalcula_apenas_quando_necessario(self):
+        from unittest import mock
+        from .calculadora import CalculadoraOrcamento
+
+        material = TipoMaterial.objects.create(nome='Tafetá', codigo='TAFETA')
+        corte = TipoCorte.objects.create(nome='MITRA', codigo='MITRA', codigo_calc=5)
+        TabelaPreco.objects.create(tipo_material=material, metragem=300, preco_metro=Decimal('10.00'))
+
+        with mock.patch.object(
+            CalculadoraOrcamento, 'calcular', autospec=True, side_effect=CalculadoraOrcamento.calcular
+        ) as calcular:
+            orcamento = Orcamento.objects.create(
+                cliente='Cliente', tipo_material=material, tipo_corte=corte, largura_mm=20,
+                comprimento_mm=50, quantidade_metros=300)
+            self.assertEqual(calcular.call_count, 1)
+            valor_inicial = orcamento.valor_total
+
+            orcamento = Orcamento.objects.get(pk=orcamento.pk)
+            orcamento.observacoes = 'Sem mudança de preço'
+            orcamento.save()
+            orcamento.status = 'aprovado'
+            with self.assertNumQueries(3):
+                # SAVEPOINT, UPDATE só do status e RELEASE: sem recálculo
+                orcamento.save(update_fields=['status'])
+            self.assertEqual(calcular.call_count, 1)
+
+            orcamento.quantidade_metros = 600
+            orcamento.save()
+            self.assertEqual(calcular.call_count, 2)
+            orcamento.save(recalcular=True)
+            self.assertEqual(calcular.call_count, 3)
+
+        orcamento.refresh_from_db()
+        self.assertEqual(orcamento.status, 'aprovado')
+        self.assertEqual(orcamento.valor_total, valor_inicial * 2)
+
+    def test_recalcula_com_versao_dos_precos_diferente(self):
+        from unittest import mock
+        from .calculadora import CalculadoraOrcamento
+
+        material = TipoMaterial.objects.create(nome='Tafetá', codigo='TAFETA')
+        corte = TipoCorte.objects.create(nome='MITRA', codigo='MITRA', codigo_calc=5)
+        preco = TabelaPreco.objects.create(tipo_material=material, metragem=300, preco_metro=Decimal('10.00'))
+        orcamento = Orcamento.objects.create(
+            cliente='Cliente', tipo_material=material, tipo_corte=corte, largura_mm=20,
+            comprimento_mm=50, quantidade_metros=300)
+        self.assertEqual(orcamento.versao_precos, versao_atual())
+        valor_inicial = orcamento.valor_total
+
+        # Preço alterado sem reprecificação: o próximo save comum recalcula
+        preco.preco_metro = Decimal('20.00')
+        preco.save()
+        with mock.patch.object(
+            CalculadoraOrcamento, 'calcular', autospec=True, side_effect=CalculadoraOrcamento.calcular
+        ) as calcular:
+            orcamento = Orcamento.objects.get(pk=orcamento.pk)
+            orcamento.save()
+            self.assertEqual(calcular.call_count, 1)
+            self.assertEqual((orcamento.valor_total, orcamento.versao_precos), (valor_inicial * 2, versao_atual()))
+            Orcamento.objects.get(pk=orcamento.pk).save()
+            self.assertEqual(calcular.call_count, 1)
+
+
+class SincronizarCoresTest(TestCase):
+    """Cores gravadas por diferença, nas duas densidades"""
+
+    def test_sincronizar(self):
+        from .cores import sincronizar_cores
+        from .models import CorOrcamento
+
+        material = TipoMaterial.objects.create(nome='Tafetá', codigo='TAFETA')
+        corte = TipoCorte.objects.create(nome='MITRA', codigo='MITRA', codigo_calc=5)
+        orcamento = Orcamento.objects.create(
+            cliente='X', tipo_material=material, tipo_corte=corte, largura_mm=20,
+            comprimento_mm=50, quantidade_metros=600)
+
+        def cores(*itens):
+            return json.dumps({
+                'cores1': [{'posicao': p, 'codigo': c, 'unidades': u, 'demais': 0} for p, c, u in itens],
+                'cores2': [{'posicao': 'Fd', 'codigo': 'D01', 'unidades': 2, 'demais': 1}],
+            })
+
+        resultado = sincronizar_cores(orcamento, cores(('Fd', 'F01', 10), ('1', 'T30', 5), ('2', 'T31', 5)))
+        self.assertEqual((resultado.inseridas, resultado.total_unidades), (4, 23))
+
+        # SAVEPOINT, SELECT, DELETE, UPDATE, INSERT, UPDATE dos totais, RELEASE
+        with self.assertNumQueries(7):
+            resultado = sincronizar_cores(orcamento, cores(('Fd', 'F01', 12), ('1', 'T30', 5), ('3', 'T40', 1)))
+        self.assertEqual(
+            (resultado.inseridas, resultado.atualizadas, resultado.removidas), (1, 1, 1))
+        self.assertEqual(
+            sorted(orcamento.cores.values_list('densidade', 'posicao', 'codigo_cor', 'quantidade_unidades')),
+            [('1', '1', 'T30', 5), ('1', '3', 'T40', 1), ('1', 'Fd', 'F01', 12), ('2', 'Fd', 'D01', 2)])
+        gravado = Orcamento.objects.get(pk=orcamento.pk)
+        self.assertEqual(
+            [getattr(gravado, campo) for campo in Orcamento.CAMPOS_TOTAIS_CORES], [21, 1, 3, 1])
+
+        with self.assertRaises(ValueError):
+            sincronizar_cores(orcamento, cores(('1', 'T30', 5), ('1', 'T31', 5)))
+        self.assertEqual(CorOrcamento.objects.filter(orcamento=orcamento).count(), 4)
+
+    def test_totais_nas_alteracoes_avulsas(self):
+        from .calculadora import CalculadoraOrcamento, RASTRO_COMPLETO
+        from .models import CorOrcamento
+
+        material = TipoMaterial.objects.create(nome='Tafetá', codigo='TAFETA')
+        corte = TipoCorte.objects.create(nome='MITRA', codigo='MITRA', codigo_calc=5)
+        orcamento = Orcamento.objects.create(
+            cliente='X', tipo_material=material, tipo_corte=corte, largura_mm=20,
+            comprimento_mm=50, quantidade_metros=600)
+        CorOrcamento.objects.create(orcamento=orcamento, posicao='Fd', codigo_cor='F01',
+                                    quantidade_unidades=10, quantidade_demais=2)
+        segunda = CorOrcamento.objects.create(orcamento=orcamento, posicao='Fd', densidade='2',
+                                              codigo_cor='D01', quantidade_unidades=3)
+
+        gravado = Orcamento.objects.get(pk=orcamento.pk)
+        self.assertEqual((gravado.total_unidades_cores, gravado.total_quantidade_cores, gravado.qtd_cores),
+                         (15, 13, 2))
+        # A calculadora usa o total gravado, sem consultar as cores
+        calculadora = CalculadoraOrcamento(gravado, rastro=RASTRO_COMPLETO)
+        with self.assertNumQueries(0):
+            self.assertEqual(calculadora._somar_unidades_cores(), 15)
+
+        segunda.delete()
+        gravado.refresh_from_db()
+        self.assertEqual((gravado.total_unidades_cores, gravado.qtd_cores_densidade2), (12, 0))
+
+    def test_formulario_com_cores_invalidas(self):
+        from django.contrib.auth.models import User
+        from django.forms.models import model_to_dict
+        from .forms import OrcamentoForm
+
+        material = TipoMaterial.objects.create(nome='Tafetá', codigo='TAFETA')
+        corte = TipoCorte.objects.create(nome='MITRA', codigo='MITRA', codigo_calc=5)
+        orcamento = Orcamento.objects.create(
+            cliente='X', tipo_material=material, tipo_corte=corte, largura_mm=20,
+            comprimento_mm=50, quantidade_metros=600)
+        self.client.force_login(User.objects.create_superuser('gestor'))
+
+        dados = {campo: valor for campo, valor in model_to_dict(
+            orcamento, fields=OrcamentoForm._meta.fields).items() if valor is not None}
+        dados.update(cliente='Y', cores_data='{"cores1": [')
+        resposta = self.client.post(f'/orcamentos/{orcamento.pk}/editar/', dados)
+
+        # O formulário volta com o erro e nada é gravado
+        self.assertEqual(resposta.status_code, 200)
+        self.assertContains(resposta, 'Cores inválidas')
+        self.assertEqual(Orcamento.objects.get(pk=orcamento.pk).cliente, 'X')
+
+
+class PapeisTest(TestCase):
+    """Grupos lidos uma vez e reaproveitados da sessão até uma alteração"""
+
+    def test_sessao_e_invalidacao(self):
+        from django.contrib.auth.models import Group, User
+        from .papeis import papeis_do_usuario
+
+        gestor = Group.objects.create(name='Gestor')
+        usuario = User.objects.create_user('ana')
+        sessao = {}
+
+        self.assertFalse(papeis_do_usuario(usuario, sessao).is_gestor)
+        outra_requisicao = User.objects.get(pk=usuario.pk)
+        with self.assertNumQueries(0):
+            self.assertFalse(papeis_do_usuario(outra_requisicao, sessao).pode_gerenciar)
+
+        usuario.groups.add(gestor)
+        recarregado = User.objects.get(pk=usuario.pk)
+        with self.assertNumQueries(1):
+            self.assertTrue(papeis_do_usuario(recarregado, sessao).is_gestor)
+            self.assertTrue(papeis_do_usuario(recarregado, sessao).pode_gerenciar)
+
+    def test_sem_middleware(self):
+        from django.conf import settings
+        from django.contrib.auth.models import User
+        from django.test import override_settings
+
+        self.client.force_login(User.objects.create_superuser('gestor'))
+        middleware = [m for m in settings.MIDDLEWARE if m != 'orcamento.middleware.PapeisMiddleware']
+        with override_settings(MIDDLEWARE=middleware):
+            resposta = self.client.get('/tabelas/')
+            self.assertContains(resposta, '📋 Tabelas')
+            self.assertEqual(self.client.get('/api/calcular/metricas/').status_code, 200)
+
+
+class PaginacaoCursorTest(TestCase):
+    """Percorre a lista por cursor nos dois sentidos, com datas repetidas"""
+
+    def test_percorre_todas_as_paginas(self):
+        from .paginacao import paginar_por_cursor
+
+        material = TipoMaterial.objects.create(nome='Tafetá', codigo='TAFETA')
+        corte = TipoCorte.objects.create(nome='MITRA', codigo='MITRA', codigo_calc=5)
+        for i in range(7):
+            orcamento = Orcamento.objects.create(
+                cliente=f'Cliente {i}', tipo_material=material, tipo_corte=corte,
+                largura_mm=20, comprimento_mm=50, quantidade_metros=500)
+            Orcamento.objects.filter(pk=orcamento.pk).update(data_emissao=date(2025, 1, 1 + i % 3))
+        queryset = Orcamento.objects.all()
+        esperado = list(queryset.order_by('-data_emissao', '-id'))
+
+        paginas = []
+        pagina = paginar_por_cursor(queryset, None, 3)
+        while True:
+            paginas.append(pagina)
+            if not pagina.tem_proxima:
+                break
+            pagina = paginar_por_cursor(queryset, pagina.cursor_proximo, 3)
+
+        self.assertEqual([o for p in paginas for o in p], esperado)
+        self.assertEqual([len(p) for p in paginas], [3, 3, 1])
+        self.assertFalse(paginas[0].tem_anterior)
+
+        anterior = paginar_por_cursor(queryset, paginas[2].cursor_anterior, 3)
+        self.assertEqual(anterior.itens, paginas[1].itens)
+        self.assertEqual(paginar_por_cursor(queryset, 'invalido', 3).itens, paginas[0].itens)
+
+    def test_total_em_pagina_unica(self):
+        from django.contrib.auth.models import User
+
+        self.client.force_login(User.objects.create_superuser('gestor'))
+        resposta = self.client.get('/orcamentos/')
+        self.assertFalse(resposta.context['pagina_cursor'].tem_proxima)
+        self.assertContains(resposta, 'Mostrando 0 resultados de 0')
+
+
+class CalculoLoteAjaxTest(TestCase):
+    """Vários cálculos em uma requisição, com o mesmo snapshot"""
+
+    @classmethod
+    def setUpTestData(cls):
+        from django.contrib.auth.models import User
+
+        cls.material = TipoMaterial.objects.create(nome='Tafetá', codigo='TAFETA')
+        cls.corte = TipoCorte.objects.create(nome='MITRA', codigo='MITRA', codigo_calc=5)
+        TabelaPreco.objects.create(tipo_material=cls.material, metragem=500, preco_metro=Decimal('10.00'))
+        TabelaPreco.objects.create(tipo_material=cls.material, metragem=1000, preco_metro=Decimal('8.00'))
+        cls.usuario = User.objects.create_user('ana')
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+
+    def enviar(self, corpo):
+        return self.client.post('/api/calcular/lote/', json.dumps(corpo), content_type='application/json')
+
+    def item(self, metros, **extra):
+        return {'tipo_material': self.material.pk, 'tipo_corte': self.corte.pk, 'largura_mm': 20,
+                'comprimento_mm': 50, 'quantidade_metros': metros, **extra}
+
+    def test_ordem_erros_e_ref(self):
+        resposta = self.enviar({'itens': [
+            self.item(1200, ref='grande'), 'não é objeto', self.item(600, ref={'linha': 3}), self.item(600),
+        ]})
+        self.assertEqual(resposta.status_code, 200)
+        dados = resposta.json()
+        self.assertEqual(dados['versao_precos'], versao_atual())
+
+        resultados = dados['resultados']
+        self.assertEqual([r['indice'] for r in resultados], [0, 1, 2, 3])
+        self.assertEqual([r['success'] for r in resultados], [True, False, True, True])
+        self.assertIn('objeto JSON', resultados[1]['error'])
+        self.assertEqual([r.get('ref') for r in resultados], ['grande', None, {'linha': 3}, None])
+        self.assertNotIn('ref', resultados[3])
+        # Cada item calculado com a sua metragem, como o cálculo avulso
+        individual = self.client.post('/api/calcular/', self.item(1200)).json()
+        self.assertEqual(resultados[0]['valor_total'], individual['valor_total'])
+        self.assertEqual(resultados[2]['valor_total'], resultados[3]['valor_total'])
+        self.assertNotEqual(resultados[0]['valor_total'], resultados[2]['valor_total'])
+
+    def test_limite_e_corpo_invalido(self):
+        from django.test import override_settings
+
+        with override_settings(CALCULO_LOTE_MAXIMO=2):
+            self.assertEqual(self.enviar([self.item(600)] * 2).status_code, 200)
+            resposta = self.enviar([self.item(600)] * 3)
+        self.assertEqual(resposta.status_code, 400)
+        self.assertIn('Máximo de 2', resposta.json()['error'])
+
+        resposta = self.client.post('/api/calcular/lote/', '{', content_type='application/json')
+        self.assertEqual(resposta.status_code, 400)
+        self.assertEqual(self.enviar({'itens': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/calcular/lote/').status_code, 405)
+
+
+class BuscaClienteTest(TestCase):
+    """Busca por cliente sem diferenciar acentos e maiúsculas"""
+
+    def test_normaliza_e_filtra(self):
+        from .busca import normalizar_busca
+
+        self.assertEqual(normalizar_busca('  Confecções  SÃO   João '), 'confeccoes sao joao')
+
+        material = TipoMaterial.objects.create(nome='Tafetá', codigo='TAFETA')
+        corte = TipoCorte.objects.create(nome='MITRA', codigo='MITRA', codigo_calc=5)
+        orcamento = Orcamento.objects.create(
+            cliente='Malharia Conceição', tipo_material=material, tipo_corte=corte,
+            largura_mm=20, comprimento_mm=50, quantidade_metros=500)
+        self.assertEqual(orcamento.cliente_busca, 'malharia conceicao')
+        self.assertEqual(
+            list(Orcamento.objects.filter(cliente_busca__contains=normalizar_busca('CONCEICAO'))),
+            [orcamento])
+
+
+class TesteCargaTest(TestCase):
+    """Relatório do teste de carga e contagem de consultas por requisição"""
+
+    def test_percentis_do_relatorio(self):
+        from .carga import Medicoes, percentil
+
+        self.assertEqual(percentil(list(range(1, 101)), 95), 95)
+        self.assertEqual(percentil([7], 99), 7)
+
+        medicoes = Medicoes()
+        for ms in range(1, 101):
+            medicoes.registrar('GET orcamento_list', ms / 1000, ok=ms != 100, consultas=ms % 3)
+        medicoes.registrar('POST calcular_ajax', 0.5, ok=True)
+        lista, calculo, total = medicoes.relatorio(segundos=10)
+
+        self.assertEqual((lista['requisicoes'], lista['erros'], lista['rps']), (100, 1, 10.0))
+        self.assertAlmostEqual(lista['p50_ms'], 50)
+        self.assertAlmostEqual(lista['p99_ms'], 99)
+        self.assertEqual(lista['consultas_max'], 2)
+        self.assertIsNone(calculo['consultas'])
+        self.assertEqual((total['endpoint'], total['requisicoes'], total['p99_ms']), ('TOTAL', 101, 100))
+
+    def test_cabecalho_de_consultas(self):
+        from django.conf import settings
+        from django.contrib.auth.models import User
+        from django.test import Client, override_settings
+        from django.urls import reverse
+
+        usuario = User.objects.create_user('ana')
+        middleware = ['orcamento.middleware.ContagemConsultasMiddleware'] + [
+            m for m in settings.MIDDLEWARE if m != 'orcamento.middleware.ContagemConsultasMiddleware']
+
+        def acessar():
+            # Cliente novo: a pilha de middlewares é montada no primeiro acesso
+            cliente = Client()
+            cliente.force_login(usuario)
+            return cliente.get(reverse('orcamento:matriz_precos'))
+
+        with override_settings(MIDDLEWARE=middleware, CONTAR_CONSULTAS=True):
+            resposta = acessar()
+        # Sessão e usuário, no mínimo
+        self.assertGreaterEqual(int(resposta['X-Consultas']), 2)
+        self.assertIn('X-Tempo-Consultas', resposta)
+
+        with override_settings(MIDDLEWARE=middleware, CONTAR_CONSULTAS=False):
+            self.assertNotIn('X-Consultas', acessar())
@@ -1,6 +1,7 @@
 from django.urls import path
 from . import views
 from . import views_tabelas
+from . import views_matriz
 
 app_name = 'orcamento'
 
@@ -24,6 +25,9 @@ urlpatterns = [
     path('orcamentos/<int:pk>/editar/', views.OrcamentoUpdateView.as_view(), name='orcamento_update'),
     path('orcamentos/<int:pk>/status/<str:novo_status>/', views.alterar_status_orcamento, name='orcamento_status'),
     path('orcamentos/<int:pk>/reverter-status/', views.reverter_status_orcamento, name='orcamento_reverter_status'),
+
+    # Tabela de preços de venda (matriz largura x metragem)
+    path('tabela-vendas/', views_matriz.matriz_precos, name='matriz_precos'),
     
     # Menu Tabelas - Dashboard
     path('tabelas/', views_tabelas.tabelas_index, name='tabelas_index'),
@@ -46,6 +50,7 @@ urlpatterns = [
     path('tabelas/coeficientes/novo/', views_tabelas.CoeficienteFatorCreateView.as_view(), name='coeficientefator_create'),
     path('tabelas/coeficientes/<int:pk>/editar/', views_tabelas.CoeficienteFatorUpdateView.as_view(), name='coeficientefator_update'),
     path('tabelas/coeficientes/<int:pk>/deletar/', views_tabelas.CoeficienteFatorDeleteView.as_view(), name='coeficientefator_delete'),
+    path('tabelas/coeficientes/pivot/', views_tabelas.CoeficienteFatorPivotView.as_view(), name='coeficientefator_pivot'),
     
     # Tabela de Preços (CRUD)
     path('tabelas/precos/', views_tabelas.TabelaPrecoListView.as_view(), name='tabelapreco_list'),
@@ -54,6 +59,9 @@ urlpatterns = [
     path('tabelas/precos/<int:pk>/deletar/', views_tabelas.TabelaPrecoDeleteView.as_view(), name='tabelapreco_delete'),
     path('tabelas/precos/copiar/', views_tabelas.TabelaPrecoCopyView.as_view(), name='tabelapreco_copy'),
     path('tabelas/precos/pivot/', views_tabelas.TabelaPrecoPivotView.as_view(), name='tabelapreco_pivot'),
+    path('tabelas/precos/ajuste/', views_tabelas.AjustePrecosView.as_view(), name='ajuste_precos'),
+    path('tabelas/precos/alteracoes/', views_tabelas.AlteracaoPrecoListView.as_view(), name='alteracaopreco_list'),
+    path('tabelas/precos/alteracoes/<int:pk>/desfazer/', views_tabelas.DesfazerAlteracaoView.as_view(), name='alteracaopreco_desfazer'),
     
     # Acabamentos (CRUD)
     path('tabelas/acabamentos/', views_tabelas.AcabamentoListView.as_view(), name='acabamento_list'),
@@ -68,6 +76,8 @@ urlpatterns = [
     
     # AJAX/HTMX endpoints
     path('api/calcular/', views.calcular_orcamento_ajax, name='calcular_ajax'),
+    path('api/calcular/lote/', views.calcular_orcamentos_lote_ajax, name='calcular_lote_ajax'),
+    path('api/calcular/metricas/', views.metricas_calculo, name='metricas_calculo'),
     path('api/precos-material/<int:material_id>/', views.obter_precos_material, name='precos_material'),
     path('api/material/<int:material_id>/batidas/', views.obter_batidas_material, name='batidas_material'),
     path('api/material/<int:material_id>/opcoes-batidas/', views.obter_opcoes_batidas, name='opcoes_batidas'),
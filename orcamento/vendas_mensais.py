@@ -0,0 +1,86 @@
+"""
+Manutenção do resumo mensal de vendas por vendedor (VendaMensalVendedor).
+
+Cada orçamento ativo com vendedor contribui com 1 unidade e o seu
+valor_total na linha (vendedor, mês de emissão, status). Ao salvar ou
+excluir um orçamento aplicamos apenas a diferença entre a contribuição
+anterior e a nova; reconstruir_vendas_mensais() refaz a tabela inteira a
+partir dos orçamentos.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+
+
+def contribuicao(vendedor_id, data_emissao, status, valor_total, ativo):
+    """Chave (vendedor_id, mes, status) e valor do orçamento, ou None se não conta"""
+    if not vendedor_id or not ativo or data_emissao is None:
+        return None
+    return (vendedor_id, data_emissao.replace(day=1), status), valor_total or Decimal('0.0')
+
+
+def acumular_delta(deltas, antes, depois):
+    """Soma em deltas a troca da contribuição antes -> depois"""
+    if antes == depois:
+        return
+    if antes is not None:
+        chave, valor = antes
+        atual = deltas.setdefault(chave, [0, Decimal('0.0')])
+        atual[0] -= 1
+        atual[1] -= valor
+    if depois is not None:
+        chave, valor = depois
+        atual = deltas.setdefault(chave, [0, Decimal('0.0')])
+        atual[0] += 1
+        atual[1] += valor
+
+
+def aplicar_deltas(deltas):
+    """Aplica {(vendedor_id, mes, status): [quantidade, valor]} com UPDATE atômico (F)"""
+    from .models import VendaMensalVendedor
+
+    for (vendedor_id, mes, status), (quantidade, valor) in deltas.items():
+        if not quantidade and not valor:
+            continue
+        linhas = VendaMensalVendedor.objects.filter(vendedor_id=vendedor_id, mes=mes, status=status)
+        if not linhas.update(quantidade=F('quantidade') + quantidade,
+                             valor_total=F('valor_total') + valor):
+            VendaMensalVendedor.objects.get_or_create(vendedor_id=vendedor_id, mes=mes, status=status)
+            linhas.update(quantidade=F('quantidade') + quantidade,
+                          valor_total=F('valor_total') + valor)
+
+
+def registrar_alteracao(antes, depois):
+    """Atualiza o resumo para um orçamento que passou da contribuição antes para depois"""
+    deltas = {}
+    acumular_delta(deltas, antes, depois)
+    aplicar_deltas(deltas)
+
+
+def reconstruir_vendas_mensais():
+    """Refaz o resumo a partir dos orçamentos; retorna a quantidade de linhas criadas"""
+    from .models import Orcamento, VendaMensalVendedor
+
+    agregados = Orcamento.objects.filter(
+        ativo=True, vendedor__isnull=False
+    ).annotate(mes=TruncMonth('data_emissao')).order_by().values(
+        'vendedor_id', 'mes', 'status'
+    ).annotate(quantidade=Count('pk'), total=Sum('valor_total'))
+
+    linhas = [
+        VendaMensalVendedor(
+            vendedor_id=item['vendedor_id'],
+            mes=item['mes'],
+            status=item['status'],
+            quantidade=item['quantidade'],
+            valor_total=item['total'] or Decimal('0.0'),
+        )
+        for item in agregados
+    ]
+
+    with transaction.atomic():
+        VendaMensalVendedor.objects.all().delete()
+        VendaMensalVendedor.objects.bulk_create(linhas, batch_size=1000)
+    return len(linhas)
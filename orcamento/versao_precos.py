@@ -0,0 +1,150 @@
+"""
+Versão dos dados de precificação e registro de alterações.
+
+VersaoPrecos guarda um contador único no banco, incrementado na mesma
+transação de qualquer inclusão, alteração ou exclusão nas tabelas de preço
+(signals.py cobre save/delete, inclusive pelo admin). Operações em massa não
+disparam signals (QuerySet.update, bulk_create, bulk_update): quem as usar
+chama registrar_em_massa() na mesma transação.
+
+Dentro de alteracao_precos() todas as mudanças da transação compartilham uma
+versão e levam o usuário e a descrição informados; fora dele cada alteração
+gera uma versão própria. Versões iguais garantem os mesmos dados de preço,
+então caches, exportações e recálculos podem usar versao_atual() como chave.
+"""
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import F
+
+from .invalidacao_precos import publicar_versao
+from .models import AlteracaoPreco, VersaoPrecos
+from .savepoints import ainda_aberto, caminho_atual, caminho_comum
+from .snapshot_precos import invalidar_snapshot
+
+_local = threading.local()
+
+
+class _Contexto:
+    def __init__(self, usuario, descricao):
+        self.usuario = usuario if usuario is not None and usuario.is_authenticated else None
+        self.descricao = descricao
+        self.versao = None
+        # Registro gravado junto com o incremento e savepoints abertos nele
+        self.alteracao = None
+        self.caminho = ()
+
+    def versao_vigente(self):
+        """
+        Versão já incrementada nesta transação, ou None. Se um savepoint
+        aberto no incremento foi fechado, o registro gravado junto com ele
+        diz se o savepoint foi liberado ou desfeito.
+        """
+        if self.versao is not None and not ainda_aberto(self.caminho):
+            if AlteracaoPreco.objects.filter(pk=self.alteracao).exists():
+                self.caminho = caminho_comum(self.caminho)
+            else:
+                self.versao = self.alteracao = None
+        return self.versao
+
+
+def _contexto_atual():
+    pilha = getattr(_local, 'pilha', None)
+    return pilha[-1] if pilha else None
+
+
+def dados_objeto(obj):
+    """{attname: valor} dos campos concretos, no formato gravado em AlteracaoPreco.dados"""
+    return {campo.attname: getattr(obj, campo.attname) for campo in obj._meta.concrete_fields}
+
+
+def dados_banco(modelo, pk):
+    """Valores gravados de um objeto (antes de um save), ou None"""
+    campos = [campo.attname for campo in modelo._meta.concrete_fields]
+    return modelo._default_manager.filter(pk=pk).values(*campos).first()
+
+
+def versao_atual():
+    """Versão dos dados de preço confirmada no banco (0 se nunca houve alteração)"""
+    return VersaoPrecos.objects.filter(pk=1).values_list('versao', flat=True).first() or 0
+
+
+def _incrementar():
+    """
+    Incrementa a versão e devolve o novo valor. O UPDATE bloqueia a linha até
+    o fim da transação, então versões são atribuídas na ordem dos commits.
+    Após o commit, avisa os outros processos pelo backend de invalidação.
+    """
+    if not VersaoPrecos.objects.filter(pk=1).update(versao=F('versao') + 1):
+        VersaoPrecos.objects.get_or_create(pk=1)
+        VersaoPrecos.objects.filter(pk=1).update(versao=F('versao') + 1)
+    transaction.on_commit(publicar_versao)
+    return VersaoPrecos.objects.filter(pk=1).values_list('versao', flat=True).get()
+
+
+@contextmanager
+def alteracao_precos(usuario=None, descricao=''):
+    """
+    Agrupa as alterações do bloco em uma transação e uma única versão. A
+    versão só é incrementada se algo mudar. Blocos aninhados usam o externo
+    (a descrição do interno vale se o externo não tiver uma).
+    """
+    externo = _contexto_atual()
+    if externo is not None:
+        externo.descricao = externo.descricao or descricao
+        yield externo
+        return
+
+    contexto = _Contexto(usuario, descricao)
+    if not hasattr(_local, 'pilha'):
+        _local.pilha = []
+    _local.pilha.append(contexto)
+    try:
+        with transaction.atomic():
+            yield contexto
+    finally:
+        _local.pilha.pop()
+
+
+def registrar_alteracao(modelo, operacao, objeto_id=None, antes=None, depois=None, descricao=''):
+    """Incrementa a versão (ou usa a do alteracao_precos em curso) e grava o registro"""
+    contexto = _contexto_atual()
+    usuario = None
+    versao = None
+    if contexto is not None:
+        versao = contexto.versao_vigente()
+        usuario = contexto.usuario
+        descricao = descricao or contexto.descricao
+    incrementar = versao is None
+    with transaction.atomic():
+        if incrementar:
+            versao = _incrementar()
+        alteracao = AlteracaoPreco.objects.create(
+            versao=versao,
+            modelo=modelo.__name__,
+            objeto_id=objeto_id,
+            operacao=operacao,
+            dados={'antes': antes, 'depois': depois},
+            descricao=descricao[:200],
+            usuario=usuario,
+        )
+    if contexto is not None and incrementar:
+        contexto.versao, contexto.alteracao, contexto.caminho = versao, alteracao.pk, caminho_atual()
+    return alteracao
+
+
+def registrar_em_massa(modelo, antes=None, depois=None, descricao=''):
+    """
+    Para operações que não disparam signals: registra as linhas afetadas
+    (listas de dicts) e invalida o snapshot como os signals fariam.
+    """
+    alteracao = registrar_alteracao(modelo, 'bulk', antes=antes, depois=depois, descricao=descricao)
+    invalidar_snapshot()
+    transaction.on_commit(invalidar_snapshot)
+    return alteracao
+
+
+def alteracoes_desde(versao):
+    """Registros posteriores à versão informada, do mais antigo ao mais recente"""
+    return AlteracaoPreco.objects.filter(versao__gt=versao).order_by('versao', 'pk')
@@ -1,22 +1,28 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.views.generic import ListView, CreateView, UpdateView, DetailView
 from django.urls import reverse_lazy
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.forms import AuthenticationForm
 from django.core.exceptions import PermissionDenied
-from django.db import models
-from decimal import Decimal
+from django.db import models, transaction
+from django.conf import settings
+from django.core.cache import cache
+import hashlib
 import json
 from .models import (
     Orcamento, TipoMaterial, TipoCorte, TabelaPreco,
-    CoeficienteFator, ValorGoma, Textura, Vendedor, CorOrcamento,
+    CoeficienteFator, ValorGoma, Textura, Vendedor,
     HistoricoStatusOrcamento, Batida
 )
+from .busca import normalizar_busca
 from .forms import OrcamentoForm
+from .paginacao import paginar_por_cursor
+from .papeis import papeis_do_usuario
+from .resumos import resumo_status, resumo_vendas_vendedor
 
 
 def login_view(request):
@@ -68,17 +74,37 @@ def index(request):
 
 
 class OrcamentoListView(LoginRequiredMixin, ListView):
-    """Lista de orçamentos - filtrada por vendedor se não for gestor"""
+    """
+    Lista de orçamentos - filtrada por vendedor se não for gestor.
+    Por padrão pagina por cursor (data_emissao, id); ORCAMENTO_LISTA_PAGINACAO =
+    'offset' volta à paginação por número de página.
+    """
     model = Orcamento
     template_name = 'orcamento/orcamento_list.html'
     context_object_name = 'orcamentos'
     paginate_by = 20
     login_url = 'orcamento:login'
-    
+
+    # Colunas exibidas na listagem (evita carregar observações, endereço etc.)
+    CAMPOS_LISTA = [
+        'numero_pedido', 'status', 'cliente', 'tipo_cliente', 'vendedor', 'tipo_material',
+        'largura_mm', 'comprimento_mm', 'quantidade_metros', 'quantidade_unidades',
+        'data_emissao', 'valor_total', 'vendedor__nome_completo', 'tipo_material__nome',
+        'qtd_cores_densidade1', 'qtd_cores_densidade2',
+    ]
+
+    @property
+    def paginacao_cursor(self):
+        return getattr(settings, 'ORCAMENTO_LISTA_PAGINACAO', 'cursor') == 'cursor'
+
+    def get_paginate_by(self, queryset):
+        # No modo cursor a página é montada em get_context_data
+        return None if self.paginacao_cursor else self.paginate_by
+
     def get_queryset(self):
         queryset = Orcamento.objects.filter(ativo=True).select_related(
-            'tipo_material', 'tipo_corte', 'vendedor'
-        ).order_by('-data_emissao')
+            'tipo_material', 'vendedor'
+        ).only(*self.CAMPOS_LISTA).order_by('-data_emissao', '-id')
         
         # Se não for gestor, mostra apenas seus orçamentos
         try:
@@ -97,7 +123,8 @@ class OrcamentoListView(LoginRequiredMixin, ListView):
         status = self.request.GET.get('status')
         
         if cliente:
-            queryset = queryset.filter(cliente__icontains=cliente)
+            # Coluna normalizada (sem acentos/minúscula), indexada por trigram no PostgreSQL
+            queryset = queryset.filter(cliente_busca__contains=normalizar_busca(cliente))
         if tipo_material:
             queryset = queryset.filter(tipo_material_id=tipo_material)
         if vendedor_id:
@@ -107,7 +134,35 @@ class OrcamentoListView(LoginRequiredMixin, ListView):
         
         return queryset
     
+    def _total_em_cache(self, queryset):
+        """COUNT opcional da lista filtrada, guardado por alguns segundos"""
+        if not getattr(settings, 'ORCAMENTO_LISTA_CONTAR', True):
+            return None
+        filtros = sorted(
+            (chave, valor) for chave, valor in self.request.GET.items()
+            if chave not in ('cursor', 'page')
+        )
+        chave = 'orcamento:lista:total:%s:%s' % (
+            self.request.user.pk,
+            hashlib.md5(repr(filtros).encode()).hexdigest(),
+        )
+        return cache.get_or_set(
+            chave, queryset.count, getattr(settings, 'ORCAMENTO_LISTA_CONTAR_TTL', 60)
+        )
+
     def get_context_data(self, **kwargs):
+        if self.paginacao_cursor:
+            pagina = paginar_por_cursor(
+                self.object_list, self.request.GET.get('cursor'), self.paginate_by
+            )
+            kwargs['object_list'] = pagina.itens
+            parametros = self.request.GET.copy()
+            parametros.pop('cursor', None)
+            parametros.pop('page', None)
+            kwargs['pagina_cursor'] = pagina
+            kwargs['filtros_querystring'] = parametros.urlencode()
+            kwargs['total_resultados'] = self._total_em_cache(self.object_list)
+
         context = super().get_context_data(**kwargs)
         context['tipos_material'] = TipoMaterial.objects.filter(ativo=True)
         
@@ -131,22 +186,29 @@ class OrcamentoListView(LoginRequiredMixin, ListView):
             else:
                 orcamentos_base = Orcamento.objects.none()
         
-        # Contagem de orçamentos por status
-        status_counts = {
-            'digitando': orcamentos_base.filter(status='digitando').count(),
-            'aguardando': orcamentos_base.filter(status='aguardando').count(),
-            'aprovado': orcamentos_base.filter(status='aprovado').count(),
-            'em_producao': orcamentos_base.filter(status='em_producao').count(),
-            'finalizado': orcamentos_base.filter(status='finalizado').count(),
-            'entregue': orcamentos_base.filter(status='entregue').count(),
-            'cancelado': orcamentos_base.filter(status='cancelado').count(),
-            'reprovado': orcamentos_base.filter(status='reprovado').count(),
-        }
-        context['status_counts'] = status_counts
+        # Contagem de orçamentos por status (uma única consulta)
+        context['status_counts'] = resumo_status(orcamentos_base)['status_counts']
         
         return context
 
 
+def _erro_cores(request):
+    """Mensagem de erro das cores enviadas pelo formulário (cores_data), ou None"""
+    from .cores import ler_cores
+    try:
+        ler_cores(request.POST.get('cores_data', '{}'))
+    except (ValueError, TypeError, AttributeError) as e:
+        # JSON inválido, posição repetida ou item que não é um objeto
+        return f'Cores inválidas: {e}. Nada foi salvo; corrija as cores e salve de novo.'
+    return None
+
+
+def _salvar_cores(request, orcamento):
+    """Grava as cores enviadas pelo formulário (cores_data), já validadas, no orçamento salvo"""
+    from .cores import sincronizar_cores
+    return sincronizar_cores(orcamento, request.POST.get('cores_data', '{}'))
+
+
 class OrcamentoCreateView(LoginRequiredMixin, CreateView):
     """Criar novo orçamento - vincula automaticamente ao vendedor logado"""
     model = Orcamento
@@ -168,7 +230,13 @@ class OrcamentoCreateView(LoginRequiredMixin, CreateView):
         kwargs['user'] = self.request.user
         return kwargs
     
+    @transaction.atomic
     def form_valid(self, form):
+        erro_cores = _erro_cores(self.request)
+        if erro_cores:
+            messages.error(self.request, erro_cores)
+            return self.form_invalid(form)
+
         # Vincula automaticamente ao vendedor logado
         try:
             vendedor = self.request.user.vendedor
@@ -181,7 +249,7 @@ class OrcamentoCreateView(LoginRequiredMixin, CreateView):
         # Define status inicial sempre como 'digitando' ao criar
         form.instance.status = 'digitando'
 
-        # Salvar o orçamento primeiro
+        # Salvar o orçamento (precificado uma única vez no save)
         response = super().form_valid(form)
         
         # Registrar histórico inicial
@@ -192,42 +260,13 @@ class OrcamentoCreateView(LoginRequiredMixin, CreateView):
             observacao='Criação do orçamento'
         )
 
-        # Processar e salvar cores
-        self._processar_cores(form.instance)
-        
-        # IMPORTANTE: Recalcular valores após salvar cores
-        form.instance.calcular_valores()
-        form.instance.save()
+        # Sincronizar cores (não entram no preço, só no debug do cálculo)
+        _salvar_cores(self.request, form.instance)
         
         messages.success(self.request, 'Orçamento criado com sucesso!')
         # Redireciona para a visualização do orçamento
         return redirect('orcamento:orcamento_detail', pk=form.instance.pk)
     
-    def _processar_cores(self, orcamento):
-        """Processa e salva as cores do orçamento"""
-        cores_data = self.request.POST.get('cores_data', '{}')
-        
-        try:
-            cores_json = json.loads(cores_data)
-            
-            # Remover cores antigas se estiver editando
-            orcamento.cores.all().delete()
-            
-            # Salvar cores
-            for i, cor in enumerate(cores_json.get('cores1', [])):
-                if cor.get('codigo'):  # Só salva se tiver código
-                    CorOrcamento.objects.create(
-                        orcamento=orcamento,
-                        posicao=cor.get('posicao', 'Fd'),
-                        densidade='1',
-                        codigo_cor=cor.get('codigo', ''),
-                        quantidade_unidades=int(cor.get('unidades', 0)),
-                        quantidade_demais=int(cor.get('demais', 0)),
-                        ordem=i
-                    )
-        except (json.JSONDecodeError, ValueError) as e:
-            # Log do erro mas não impede o salvamento do orçamento
-            print(f"Erro ao processar cores: {e}")
 
 
 class OrcamentoUpdateView(LoginRequiredMixin, UpdateView):
@@ -268,12 +307,12 @@ class OrcamentoUpdateView(LoginRequiredMixin, UpdateView):
         
         # Adicionar cores existentes para carregar no formulário
         orcamento = self.object
-        cores1 = list(orcamento.cores.filter(densidade='1').order_by('ordem').values(
-            'posicao', 'codigo_cor', 'quantidade_unidades', 'quantidade_demais'
-        ))
-        cores2 = list(orcamento.cores.filter(densidade='2').order_by('ordem').values(
-            'posicao', 'codigo_cor', 'quantidade_unidades', 'quantidade_demais'
-        ))
+        # Uma consulta para as duas densidades, e nenhuma se não há cores
+        cores = list(orcamento.cores.order_by('densidade', 'ordem').values(
+            'densidade', 'posicao', 'codigo_cor', 'quantidade_unidades', 'quantidade_demais'
+        )) if orcamento.qtd_cores else []
+        cores1 = [c for c in cores if c['densidade'] == '1']
+        cores2 = [c for c in cores if c['densidade'] == '2']
         
         # Formatar para o formato esperado pelo Alpine.js
         context['cores1_json'] = json.dumps([{
@@ -293,8 +332,8 @@ class OrcamentoUpdateView(LoginRequiredMixin, UpdateView):
         # Adicionar dados de debug ao contexto
         from django.conf import settings
         if getattr(settings, 'DEBUG_CALCULOS', False):
-            from .calculadora import CalculadoraOrcamento
-            calculadora = CalculadoraOrcamento(orcamento)
+            from .calculadora import CalculadoraOrcamento, RASTRO_COMPLETO
+            calculadora = CalculadoraOrcamento(orcamento, rastro=RASTRO_COMPLETO)
             valores = calculadora.calcular()
             context['valores'] = valores  # Passa valores para preencher campos iniciais
             context['debug_calculos'] = True
@@ -306,7 +345,13 @@ class OrcamentoUpdateView(LoginRequiredMixin, UpdateView):
         kwargs['user'] = self.request.user
         return kwargs
     
+    @transaction.atomic
     def form_valid(self, form):
+        erro_cores = _erro_cores(self.request)
+        if erro_cores:
+            messages.error(self.request, erro_cores)
+            return self.form_invalid(form)
+
         # Se for vendedor editando, garante status digitando ou aguardando se for submissão
         acao = self.request.POST.get('acao', 'salvar') # salvar ou enviar_aprovacao
         
@@ -336,45 +381,16 @@ class OrcamentoUpdateView(LoginRequiredMixin, UpdateView):
                 observacao='Reiniciado edição após reprovação'
             )
 
-        # Salvar o orçamento primeiro
+        # Salvar o orçamento (só recalcula se algum campo de preço mudou)
         response = super().form_valid(form)
         
-        # Processar e salvar cores
-        self._processar_cores(form.instance)
-        
-        # IMPORTANTE: Recalcular valores após salvar cores
-        form.instance.calcular_valores()
-        form.instance.save()
+        # Sincronizar cores (não entram no preço, só no debug do cálculo)
+        _salvar_cores(self.request, form.instance)
         
         messages.success(self.request, 'Orçamento atualizado com sucesso!')
         # Redireciona para a visualização do orçamento
         return redirect('orcamento:orcamento_detail', pk=form.instance.pk)
     
-    def _processar_cores(self, orcamento):
-        """Processa e salva as cores do orçamento"""
-        cores_data = self.request.POST.get('cores_data', '{}')
-        
-        try:
-            cores_json = json.loads(cores_data)
-            
-            # Remover cores antigas
-            orcamento.cores.all().delete()
-            
-            # Salvar cores
-            for i, cor in enumerate(cores_json.get('cores1', [])):
-                if cor.get('codigo'):  # Só salva se tiver código
-                    CorOrcamento.objects.create(
-                        orcamento=orcamento,
-                        posicao=cor.get('posicao', 'Fd'),
-                        densidade='1',
-                        codigo_cor=cor.get('codigo', ''),
-                        quantidade_unidades=int(cor.get('unidades', 0)),
-                        quantidade_demais=int(cor.get('demais', 0)),
-                        ordem=i
-                    )
-        except (json.JSONDecodeError, ValueError) as e:
-            # Log do erro mas não impede o salvamento do orçamento
-            print(f"Erro ao processar cores: {e}")
 
 
 class OrcamentoDetailView(LoginRequiredMixin, DetailView):
@@ -413,8 +429,8 @@ class OrcamentoDetailView(LoginRequiredMixin, DetailView):
         # Adicionar dados de debug se flag estiver ativa
         from django.conf import settings
         if getattr(settings, 'DEBUG_CALCULOS', False):
-            from .calculadora import CalculadoraOrcamento
-            calculadora = CalculadoraOrcamento(self.object)
+            from .calculadora import CalculadoraOrcamento, RASTRO_COMPLETO
+            calculadora = CalculadoraOrcamento(self.object, rastro=RASTRO_COMPLETO)
             valores = calculadora.calcular()
             context['debug_info'] = valores.get('debug_info', {})
             context['debug_calculos'] = True
@@ -422,54 +438,112 @@ class OrcamentoDetailView(LoginRequiredMixin, DetailView):
         return context
 
 
+def _inteiro(valor, padrao=0):
+    """Converte valores de formulário/JSON para int ('' e None viram o padrão)"""
+    if valor in (None, ''):
+        return padrao
+    return int(valor)
+
+
+def _booleano(valor):
+    """Aceita checkbox HTML ('on'), strings 'true'/'1'/'sim' e bool de JSON"""
+    if isinstance(valor, bool):
+        return valor
+    return str(valor).lower() in ('true', 'on', '1', 'sim')
+
+
+def _total_unidades_cores_json(cores_data):
+    """Soma unidades + demais das cores enviadas pelo formulário (cores_data)"""
+    if not cores_data:
+        return 0
+    cores_json = json.loads(cores_data) if isinstance(cores_data, str) else cores_data
+    total = 0
+    for chave in ('cores1', 'cores2'):
+        for cor in cores_json.get(chave, []):
+            if cor.get('codigo'):
+                total += _inteiro(cor.get('unidades')) + _inteiro(cor.get('demais'))
+    return total
+
+
+def _orcamento_temporario(dados):
+    """
+    Monta um Orcamento não salvo a partir dos dados do formulário (request.POST)
+    ou de um item JSON do cálculo em lote
+    """
+    return Orcamento(
+        tipo_material_id=_inteiro(dados.get('tipo_material'), None),
+        largura_mm=_inteiro(dados.get('largura_mm')),
+        comprimento_mm=_inteiro(dados.get('comprimento_mm')),
+        quantidade_metros=_inteiro(dados.get('quantidade_metros')),
+        quantidade_unidades=_inteiro(dados.get('quantidade_unidades')),
+        tabela_manual_metragem=_inteiro(dados.get('tabela_manual_metragem'), None),
+        tipo_corte_id=_inteiro(dados.get('tipo_corte'), None),
+        acabamento_id=_inteiro(dados.get('acabamento'), None),
+        batida_id=_inteiro(dados.get('batida'), None),
+        tem_ultrassonico=_booleano(dados.get('tem_ultrassonico', False)),
+        tipo_cliente=dados.get('tipo_cliente') or 'comercio_novo',
+    )
+
+
+def _valores_json(valores):
+    """Serializa o resultado da calculadora para resposta JSON"""
+    return {
+        'valor_metro': str(valores['valor_metro']),
+        'valor_milheiro': str(valores['valor_milheiro']),
+        'valor_unidade': str(valores['valor_unidade']),
+        'valor_total': str(valores['valor_total']),
+        'unidades': str(valores['unidades']),
+        'milheiros': str(valores['milheiros']),
+        'preco_base': str(valores['preco_base']),
+        'coef_fator': str(valores['coef_fator']),
+        'area_m2': str(valores['area_m2']),
+    }
+
+
+def _resposta_obsoleta(pedido):
+    """204 para pedido de cálculo superado: o HTMX não troca o conteúdo"""
+    response = HttpResponse(status=204)
+    response['X-Calculo-Obsoleto'] = str(pedido.seq)
+    return response
+
+
 @login_required
 def calcular_orcamento_ajax(request):
     """
-    Endpoint AJAX/HTMX para calcular valores em tempo real
+    Endpoint AJAX/HTMX para calcular valores em tempo real.
+    Pedidos numerados (calculo_seq/calculo_sessao) superados por um mais
+    novo do mesmo formulário recebem 204 (ver coalescencia.py).
+    O campo 'rastro' (nenhum/resumo/completo) escolhe o debug_info; o padrão
+    é completo com DEBUG_CALCULOS e nenhum sem
     """
     if request.method == 'POST':
+        from .coalescencia import PedidoCalculo
+        pedido = PedidoCalculo.da_requisicao(request)
+        if pedido and not pedido.registrar():
+            return _resposta_obsoleta(pedido)
+
         try:
-            # Obter dados do formulário
-            tipo_material_id = request.POST.get('tipo_material')
-            largura_mm = int(request.POST.get('largura_mm', 0))
-            comprimento_mm = int(request.POST.get('comprimento_mm', 0))
-            quantidade_metros = int(request.POST.get('quantidade_metros', 0))
-            quantidade_unidades = int(request.POST.get('quantidade_unidades', 0))
-            tipo_corte_id = request.POST.get('tipo_corte')
-            tem_goma = request.POST.get('tem_goma') == 'true'
-            tipo_goma = request.POST.get('tipo_goma', '')
-            tem_ultrassonico = request.POST.get('tem_ultrassonico') == 'true'
-            tipo_cliente = request.POST.get('tipo_cliente', 'comercio_novo')
-            
             # Criar objeto temporário para cálculo
-            orcamento_temp = Orcamento(
-                tipo_material_id=tipo_material_id,
-                largura_mm=largura_mm,
-                comprimento_mm=comprimento_mm,
-                quantidade_metros=quantidade_metros,
-                quantidade_unidades=quantidade_unidades,
-                tipo_corte_id=tipo_corte_id,
-                tem_goma=tem_goma,
-                tipo_goma=tipo_goma if tem_goma else '',
-                tem_ultrassonico=tem_ultrassonico,
-                tipo_cliente=tipo_cliente,
-            )
+            orcamento_temp = _orcamento_temporario(request.POST)
+            total_cores = _total_unidades_cores_json(request.POST.get('cores_data'))
             
-            # Calcular valores
-            from .calculadora import CalculadoraOrcamento
-            calculadora = CalculadoraOrcamento(orcamento_temp)
-            valores = calculadora.calcular()
+            from .calculadora import RASTRO_COMPLETO, RASTRO_NENHUM
+            from django.conf import settings
+            rastro = request.POST.get('rastro') or (
+                RASTRO_COMPLETO if getattr(settings, 'DEBUG_CALCULOS', False) else RASTRO_NENHUM
+            )
+
+            # Calcular valores (combinações repetidas vêm do memo)
+            from .memo_calculo import calcular_com_memo
+            valores = calcular_com_memo(
+                orcamento_temp, total_unidades_cores=total_cores, rastro=rastro)
+            if pedido and pedido.superado():
+                return _resposta_obsoleta(pedido)
             
             # Preparar resposta
             response_data = {
                 'success': True,
-                'valor_metro': str(valores['valor_metro']),
-                'valor_milheiro': str(valores['valor_milheiro']),
-                'valor_unidade': str(valores['valor_unidade']),
-                'valor_total': str(valores['valor_total']),
-                'preco_base': str(valores['preco_base']),
-                'coef_fator': str(valores['coef_fator']),
-                'area_m2': str(valores['area_m2']),
+                **_valores_json(valores),
                 'debug_info': valores.get('debug_info', {}),
             }
             
@@ -492,6 +566,86 @@ def calcular_orcamento_ajax(request):
     return JsonResponse({'success': False, 'error': 'Método não permitido'}, status=405)
 
 
+@login_required
+def metricas_calculo(request):
+    """Contadores do memo e da coalescência da pré-visualização (gestores)"""
+    if not papeis_do_usuario(request.user, request.session).pode_gerenciar:
+        raise PermissionDenied
+    from .coalescencia import estatisticas
+    from .memo_calculo import obter_memo
+    return JsonResponse({'memo': obter_memo().estatisticas(), 'coalescencia': estatisticas()})
+
+
+@login_required
+def calcular_orcamentos_lote_ajax(request):
+    """
+    Calcula vários orçamentos em uma única requisição (tabelas de quebra de
+    quantidade, integrações).
+
+    Corpo JSON: lista de itens (ou {"itens": [...]}) com os mesmos campos do
+    formulário: tipo_material, tipo_corte, largura_mm, comprimento_mm,
+    quantidade_metros, tabela_manual_metragem, acabamento, batida,
+    tem_ultrassonico, tipo_cliente e total_unidades_cores (ou cores).
+    Todos os itens usam o mesmo snapshot de preços; os resultados voltam na
+    ordem de entrada, com erro por item.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Método não permitido'}, status=405)
+
+    try:
+        itens = json.loads(request.body)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return JsonResponse({'success': False, 'error': 'JSON inválido'}, status=400)
+
+    if isinstance(itens, dict):
+        itens = itens.get('itens')
+    if not isinstance(itens, list):
+        return JsonResponse({'success': False, 'error': 'Envie uma lista de itens'}, status=400)
+
+    from django.conf import settings
+    limite = getattr(settings, 'CALCULO_LOTE_MAXIMO', 500)
+    if len(itens) > limite:
+        return JsonResponse({
+            'success': False,
+            'error': f'Máximo de {limite} itens por requisição'
+        }, status=400)
+
+    from .calculadora import CalculadoraOrcamento
+    from .snapshot_precos import obter_snapshot
+    snapshot = obter_snapshot()
+
+    resultados = []
+    for indice, item in enumerate(itens):
+        try:
+            if not isinstance(item, dict):
+                raise ValueError('Item deve ser um objeto JSON')
+
+            if item.get('total_unidades_cores') is not None:
+                total_cores = _inteiro(item['total_unidades_cores'])
+            else:
+                total_cores = _total_unidades_cores_json(item.get('cores'))
+
+            calculadora = CalculadoraOrcamento(
+                _orcamento_temporario(item),
+                snapshot=snapshot,
+                total_unidades_cores=total_cores,
+            )
+            resultado = {'indice': indice, 'success': True, **_valores_json(calculadora.calcular())}
+        except Exception as e:
+            resultado = {'indice': indice, 'success': False, 'error': str(e)}
+
+        if isinstance(item, dict) and 'ref' in item:
+            # Identificador livre do cliente, devolvido como veio
+            resultado['ref'] = item['ref']
+        resultados.append(resultado)
+
+    return JsonResponse({
+        'success': True,
+        'versao_precos': snapshot.versao_precos,
+        'resultados': resultados,
+    })
+
+
 @login_required
 def obter_precos_material(request, material_id):
     """Retorna os preços disponíveis para um determinado material"""
@@ -544,7 +698,6 @@ def obter_opcoes_batidas(request, material_id):
 @login_required
 def dashboard_vendedor(request):
     """Dashboard do vendedor - vê apenas seus dados"""
-    from django.db.models import Sum, Count
     from datetime import datetime
     
     try:
@@ -559,26 +712,10 @@ def dashboard_vendedor(request):
     # Estatísticas do vendedor
     meus_orcamentos = Orcamento.objects.filter(vendedor=vendedor, ativo=True)
     
-    # Contagem de orçamentos por status
-    status_counts = {
-        'digitando': meus_orcamentos.filter(status='digitando').count(),
-        'aguardando': meus_orcamentos.filter(status='aguardando').count(),
-        'aprovado': meus_orcamentos.filter(status='aprovado').count(),
-        'em_producao': meus_orcamentos.filter(status='em_producao').count(),
-        'finalizado': meus_orcamentos.filter(status='finalizado').count(),
-        'entregue': meus_orcamentos.filter(status='entregue').count(),
-        'cancelado': meus_orcamentos.filter(status='cancelado').count(),
-        'reprovado': meus_orcamentos.filter(status='reprovado').count(),
-    }
-    
     context = {
         'vendedor': vendedor,
-        'total_orcamentos': meus_orcamentos.count(),
-        'orcamentos_mes': meus_orcamentos.filter(data_emissao__gte=mes_atual).count(),
-        'valor_total_mes': meus_orcamentos.filter(
-            data_emissao__gte=mes_atual
-        ).aggregate(total=Sum('valor_total'))['total'] or Decimal('0.0'),
-        'status_counts': status_counts,
+        # Contagens por status, total e números do mês (resumo mensal)
+        **resumo_vendas_vendedor(vendedor, mes_atual),
         'orcamentos_recentes': meus_orcamentos.order_by('-criado_em')[:10],
         'meta_mensal': vendedor.meta_mensal,
         'percentual_meta': vendedor.percentual_meta(),
@@ -591,6 +728,7 @@ def dashboard_vendedor(request):
 def dashboard_gestor(request):
     """Dashboard do gestor - vê todos os dados"""
     from django.db.models import Sum, Count, Avg, Q
+    from django.db.models.functions import Coalesce
     from datetime import datetime
     
     # Verificar se é gestor
@@ -607,45 +745,25 @@ def dashboard_gestor(request):
     hoje = datetime.now().date()
     mes_atual = hoje.replace(day=1)
     
-    # Contagem de orçamentos por status
     orcamentos_ativos = Orcamento.objects.filter(ativo=True)
-    status_counts = {
-        'digitando': orcamentos_ativos.filter(status='digitando').count(),
-        'aguardando': orcamentos_ativos.filter(status='aguardando').count(),
-        'aprovado': orcamentos_ativos.filter(status='aprovado').count(),
-        'em_producao': orcamentos_ativos.filter(status='em_producao').count(),
-        'finalizado': orcamentos_ativos.filter(status='finalizado').count(),
-        'entregue': orcamentos_ativos.filter(status='entregue').count(),
-        'cancelado': orcamentos_ativos.filter(status='cancelado').count(),
-        'reprovado': orcamentos_ativos.filter(status='reprovado').count(),
-    }
-    
+
     context = {
-        'total_orcamentos': orcamentos_ativos.count(),
-        'orcamentos_mes': Orcamento.objects.filter(
-            data_emissao__gte=mes_atual,
-            ativo=True
-        ).count(),
-        'valor_total_mes': Orcamento.objects.filter(
-            data_emissao__gte=mes_atual,
-            ativo=True
-        ).aggregate(total=Sum('valor_total'))['total'] or Decimal('0.0'),
-        'status_counts': status_counts,
+        # Contagens por status, total e números do mês (uma única consulta)
+        **resumo_status(orcamentos_ativos, mes_atual),
         'orcamentos_recentes': Orcamento.objects.filter(
             ativo=True
         ).select_related('vendedor', 'tipo_material').order_by('-criado_em')[:10],
         'materiais_mais_usados': TipoMaterial.objects.annotate(
             total=Count('orcamento')
         ).order_by('-total')[:5],
+        # Ranking lido do resumo mensal (VendaMensalVendedor)
         'vendedores_ranking': Vendedor.objects.filter(ativo=True).annotate(
-            total_vendas=Sum('orcamentos__valor_total', filter=Q(
-                orcamentos__data_emissao__gte=mes_atual,
-                orcamentos__ativo=True
+            total_vendas=Sum('vendas_mensais__valor_total', filter=Q(
+                vendas_mensais__mes__gte=mes_atual
             )),
-            qtd_orcamentos=Count('orcamentos', filter=Q(
-                orcamentos__data_emissao__gte=mes_atual,
-                orcamentos__ativo=True
-            ))
+            qtd_orcamentos=Coalesce(Sum('vendas_mensais__quantidade', filter=Q(
+                vendas_mensais__mes__gte=mes_atual
+            )), 0)
         ).order_by('-total_vendas')[:10],
         'is_gestor': True,
     }
@@ -687,7 +805,7 @@ def alterar_status_orcamento(request, pk, novo_status):
     status_anterior = orcamento.status
     if status_anterior != novo_status:
         orcamento.status = novo_status
-        orcamento.save()
+        orcamento.save(update_fields=['status', 'atualizado_em'])
         
         HistoricoStatusOrcamento.objects.create(
             orcamento=orcamento,
@@ -725,7 +843,7 @@ def reverter_status_orcamento(request, pk):
 
     # Reverte o status
     orcamento.status = status_anterior
-    orcamento.save()
+    orcamento.save(update_fields=['status', 'atualizado_em'])
 
     # Registra o revert no histórico
     HistoricoStatusOrcamento.objects.create(
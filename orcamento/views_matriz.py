@@ -0,0 +1,35 @@
+from django.contrib.auth.decorators import login_required
+from django.http import HttpResponse
+from django.shortcuts import render
+from django.utils.text import slugify
+
+from .forms import MatrizPrecosForm
+from .matriz_precos import FORMATOS, exportar, obter_matriz
+
+
+@login_required
+def matriz_precos(request):
+    """
+    Tabela de preços de venda (larguras x metragens por comprimento).
+    ?formato=csv|xlsx|html devolve o arquivo para download.
+    """
+    form = MatrizPrecosForm(request.GET or None)
+    matriz = None
+    if form.is_valid():
+        parametros = form.parametros()
+        formato = request.GET.get('formato')
+        if formato in FORMATOS:
+            content_type, extensao = FORMATOS[formato]
+            nome = slugify(
+                f"tabela {form.cleaned_data['tipo_material'].codigo} {form.cleaned_data['tipo_corte'].codigo}"
+            )
+            response = HttpResponse(exportar(formato, **parametros), content_type=content_type)
+            response['Content-Disposition'] = f'attachment; filename="{nome}.{extensao}"'
+            return response
+        matriz = obter_matriz(**parametros)
+
+    return render(request, 'orcamento/matriz_precos.html', {
+        'form': form,
+        'matriz': matriz,
+        'query': request.GET.urlencode(),
+    })
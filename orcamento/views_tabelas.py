@@ -3,17 +3,21 @@ Views para gerenciamento de tabelas auxiliares (CRUD)
 Menu: Tabelas
 """
 from django.contrib.auth.decorators import login_required, user_passes_test
-from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
+from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib import messages
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse_lazy
-from django.views.generic import ListView, CreateView, UpdateView, DeleteView, View, TemplateView
+from django.views.generic import ListView, CreateView, UpdateView, DeleteView, View
 from django.db.models import Count, Q
 from .models import TipoMaterial, Batida, TabelaPreco, CoeficienteFator, ValorGoma, ValorCorte, Configuracao, Textura, TipoCorte, Acabamento, PrecoAcabamento
-from .forms import TipoMaterialForm, BatidaForm, CoeficienteFatorForm, TabelaPrecoForm
-from .forms_tabelas import AcabamentoForm, PrecoAcabamentoForm
-from .views_tabelas_pivot import AcabamentoPivotView
-from .mixins import GestorRequiredMixin, is_gestor_or_superuser
+from .forms import CoeficienteFatorForm, TabelaPrecoForm
+from .forms_tabelas import AcabamentoForm
+from .views_tabelas_ajustes import AjustePrecosView, AlteracaoPrecoListView, DesfazerAlteracaoView
+from .views_tabelas_pivot import AcabamentoPivotView, CoeficienteFatorPivotView, TabelaPrecoPivotView
+from .mixins import GestorRequiredMixin, ReprecificacaoMixin, is_gestor_or_superuser
+from .versao_precos import alteracao_precos
+from .ajustes_precos import Ajuste, aplicar as aplicar_ajuste
+from .dependencias import reprecificacao_incremental
 
 
 @login_required
@@ -87,7 +91,7 @@ class TipoMaterialListView(LoginRequiredMixin, GestorRequiredMixin, ListView):
         return context
 
 
-class TipoMaterialCreateView(LoginRequiredMixin, GestorRequiredMixin, CreateView):
+class TipoMaterialCreateView(LoginRequiredMixin, GestorRequiredMixin, ReprecificacaoMixin, CreateView):
     """Criar novo tipo de material"""
     model = TipoMaterial
     template_name = 'orcamento/tabelas/tipomaterial_form.html'
@@ -99,7 +103,7 @@ class TipoMaterialCreateView(LoginRequiredMixin, GestorRequiredMixin, CreateView
         return super().form_valid(form)
 
 
-class TipoMaterialUpdateView(LoginRequiredMixin, GestorRequiredMixin, UpdateView):
+class TipoMaterialUpdateView(LoginRequiredMixin, GestorRequiredMixin, ReprecificacaoMixin, UpdateView):
     """Editar tipo de material"""
     model = TipoMaterial
     template_name = 'orcamento/tabelas/tipomaterial_form.html'
@@ -117,7 +121,7 @@ class TipoMaterialUpdateView(LoginRequiredMixin, GestorRequiredMixin, UpdateView
         return super().form_valid(form)
 
 
-class TipoMaterialDeleteView(LoginRequiredMixin, GestorRequiredMixin, DeleteView):
+class TipoMaterialDeleteView(LoginRequiredMixin, GestorRequiredMixin, ReprecificacaoMixin, DeleteView):
     """Deletar tipo de material"""
     model = TipoMaterial
     template_name = 'orcamento/tabelas/tipomaterial_confirm_delete.html'
@@ -175,7 +179,7 @@ class BatidaListView(LoginRequiredMixin, GestorRequiredMixin, ListView):
         return context
 
 
-class BatidaCreateView(LoginRequiredMixin, GestorRequiredMixin, CreateView):
+class BatidaCreateView(LoginRequiredMixin, GestorRequiredMixin, ReprecificacaoMixin, CreateView):
     """Criar nova batida"""
     model = Batida
     template_name = 'orcamento/tabelas/batida_form.html'
@@ -190,7 +194,7 @@ class BatidaCreateView(LoginRequiredMixin, GestorRequiredMixin, CreateView):
         return super().form_valid(form)
 
 
-class BatidaUpdateView(LoginRequiredMixin, GestorRequiredMixin, UpdateView):
+class BatidaUpdateView(LoginRequiredMixin, GestorRequiredMixin, ReprecificacaoMixin, UpdateView):
     """Editar batida"""
     model = Batida
     template_name = 'orcamento/tabelas/batida_form.html'
@@ -205,7 +209,7 @@ class BatidaUpdateView(LoginRequiredMixin, GestorRequiredMixin, UpdateView):
         return super().form_valid(form)
 
 
-class BatidaDeleteView(LoginRequiredMixin, GestorRequiredMixin, DeleteView):
+class BatidaDeleteView(LoginRequiredMixin, GestorRequiredMixin, ReprecificacaoMixin, DeleteView):
     """Deletar batida"""
     model = Batida
     template_name = 'orcamento/tabelas/batida_confirm_delete.html'
@@ -232,11 +236,12 @@ def batida_quick_add(request, material_id):
         
         if numero_batidas:
             try:
-                batida = Batida.objects.create(
-                    tipo_material=material,
-                    numero_batidas=int(numero_batidas),
-                    ordem=material.batidas.count() + 1
-                )
+                with reprecificacao_incremental(), alteracao_precos(usuario=request.user):
+                    batida = Batida.objects.create(
+                        tipo_material=material,
+                        numero_batidas=int(numero_batidas),
+                        ordem=material.batidas.count() + 1
+                    )
                 messages.success(request, f'Batida {numero_batidas} adicionada ao {material.nome}!')
                 return redirect('orcamento:tipomaterial_update', pk=material_id)
             except Exception as e:
@@ -294,7 +299,7 @@ class CoeficienteFatorListView(LoginRequiredMixin, GestorRequiredMixin, ListView
         return context
 
 
-class CoeficienteFatorCreateView(LoginRequiredMixin, GestorRequiredMixin, CreateView):
+class CoeficienteFatorCreateView(LoginRequiredMixin, GestorRequiredMixin, ReprecificacaoMixin, CreateView):
     """Cria novo coeficiente"""
     model = CoeficienteFator
     form_class = CoeficienteFatorForm
@@ -309,7 +314,7 @@ class CoeficienteFatorCreateView(LoginRequiredMixin, GestorRequiredMixin, Create
         return super().form_valid(form)
 
 
-class CoeficienteFatorUpdateView(LoginRequiredMixin, GestorRequiredMixin, UpdateView):
+class CoeficienteFatorUpdateView(LoginRequiredMixin, GestorRequiredMixin, ReprecificacaoMixin, UpdateView):
     """Edita coeficiente"""
     model = CoeficienteFator
     form_class = CoeficienteFatorForm
@@ -324,7 +329,7 @@ class CoeficienteFatorUpdateView(LoginRequiredMixin, GestorRequiredMixin, Update
         return super().form_valid(form)
 
 
-class CoeficienteFatorDeleteView(LoginRequiredMixin, GestorRequiredMixin, DeleteView):
+class CoeficienteFatorDeleteView(LoginRequiredMixin, GestorRequiredMixin, ReprecificacaoMixin, DeleteView):
     """Remove coeficiente"""
     model = CoeficienteFator
     template_name = 'orcamento/tabelas/coeficientefator_confirm_delete.html'
@@ -371,7 +376,7 @@ class TabelaPrecoListView(LoginRequiredMixin, GestorRequiredMixin, ListView):
         return context
 
 
-class TabelaPrecoCreateView(LoginRequiredMixin, GestorRequiredMixin, CreateView):
+class TabelaPrecoCreateView(LoginRequiredMixin, GestorRequiredMixin, ReprecificacaoMixin, CreateView):
     """Cria nova tabela de preço"""
     model = TabelaPreco
     form_class = TabelaPrecoForm
@@ -386,7 +391,7 @@ class TabelaPrecoCreateView(LoginRequiredMixin, GestorRequiredMixin, CreateView)
         return super().form_valid(form)
 
 
-class TabelaPrecoUpdateView(LoginRequiredMixin, GestorRequiredMixin, UpdateView):
+class TabelaPrecoUpdateView(LoginRequiredMixin, GestorRequiredMixin, ReprecificacaoMixin, UpdateView):
     """Edita tabela de preço"""
     model = TabelaPreco
     form_class = TabelaPrecoForm
@@ -401,7 +406,7 @@ class TabelaPrecoUpdateView(LoginRequiredMixin, GestorRequiredMixin, UpdateView)
         return super().form_valid(form)
 
 
-class TabelaPrecoDeleteView(LoginRequiredMixin, GestorRequiredMixin, DeleteView):
+class TabelaPrecoDeleteView(LoginRequiredMixin, GestorRequiredMixin, ReprecificacaoMixin, DeleteView):
     """Remove tabela de preço"""
     model = TabelaPreco
     template_name = 'orcamento/tabelas/tabelapreco_confirm_delete.html'
@@ -413,7 +418,7 @@ class TabelaPrecoDeleteView(LoginRequiredMixin, GestorRequiredMixin, DeleteView)
         return super().delete(request, *args, **kwargs)
 
 
-class TabelaPrecoCopyView(LoginRequiredMixin, GestorRequiredMixin, View):
+class TabelaPrecoCopyView(LoginRequiredMixin, GestorRequiredMixin, ReprecificacaoMixin, View):
     """Copia preços de um material para outro"""
     
     def post(self, request, *args, **kwargs):
@@ -432,25 +437,15 @@ class TabelaPrecoCopyView(LoginRequiredMixin, GestorRequiredMixin, View):
             source_material = TipoMaterial.objects.get(pk=source_id)
             dest_material = TipoMaterial.objects.get(pk=dest_id)
             
-            source_precos = TabelaPreco.objects.filter(tipo_material=source_material)
-            
-            if not source_precos.exists():
+            if not TabelaPreco.objects.filter(tipo_material=source_material).exists():
                 messages.warning(request, f'Não há preços cadastrados para {source_material.nome}.')
                 return redirect('orcamento:tabelapreco_list')
             
-            count_created = 0
-            count_updated = 0
-            
-            for preco in source_precos:
-                obj, created = TabelaPreco.objects.update_or_create(
-                    tipo_material=dest_material,
-                    metragem=preco.metragem,
-                    defaults={'preco_metro': preco.preco_metro}
-                )
-                if created:
-                    count_created += 1
-                else:
-                    count_updated += 1
+            # Cópia sem ajuste: um UPDATE e um INSERT ... SELECT (ajustes_precos.py)
+            descricao = f'Cópia de preços de {source_material.nome} para {dest_material.nome}'
+            resumo = aplicar_ajuste(Ajuste('tabela_precos', grupos=[source_material.pk], destino=dest_material.pk),
+                                    descricao=descricao)
+            count_created, count_updated = resumo['criadas'], resumo['alteradas']
             
             messages.success(
                 request, 
@@ -465,58 +460,6 @@ class TabelaPrecoCopyView(LoginRequiredMixin, GestorRequiredMixin, View):
         return redirect('orcamento:tabelapreco_list')
 
 
-class TabelaPrecoPivotView(LoginRequiredMixin, GestorRequiredMixin, TemplateView):
-    """Visão pivot da tabela de preços (Materiais x Metragens)"""
-    template_name = 'orcamento/tabelas/tabelapreco_pivot.html'
-    
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        
-        # Buscar todas as metragens únicas, ordenadas
-        metragens = list(TabelaPreco.objects.values_list('metragem', flat=True)
-                         .distinct().order_by('metragem'))
-        
-        # Buscar todos os materiais ativos, ordenados
-        materiais = TipoMaterial.objects.filter(ativo=True).order_by('ordem', 'nome')
-        
-        # Montar a estrutura de dados para a tabela pivot
-        # [
-        #   {
-        #     'material': material_obj,
-        #     'precos': {metragem: preco, ...}
-        #   },
-        #   ...
-        # ]
-        
-        pivot_data = []
-        
-        for material in materiais:
-            # Buscar preços deste material
-            precos = TabelaPreco.objects.filter(tipo_material=material)
-            precos_map = {p.metragem: p.preco_metro for p in precos}
-            
-            row = {
-                'material': material,
-                'precos': []
-            }
-            
-            # Preencher a lista de preços na ordem das colunas de metragens
-            for m in metragens:
-                valor = precos_map.get(m)
-                row['precos'].append({
-                    'metragem': m,
-                    'valor': valor,
-                    'existe': valor is not None
-                })
-                
-            pivot_data.append(row)
-            
-        context['metragens'] = metragens
-        context['pivot_data'] = pivot_data
-        
-        return context
-
-
 # ================== ACABAMENTOS ==================
 
 class AcabamentoListView(LoginRequiredMixin, GestorRequiredMixin, ListView):
@@ -550,7 +493,7 @@ class AcabamentoListView(LoginRequiredMixin, GestorRequiredMixin, ListView):
         return context
 
 
-class AcabamentoCreateView(LoginRequiredMixin, GestorRequiredMixin, CreateView):
+class AcabamentoCreateView(LoginRequiredMixin, GestorRequiredMixin, ReprecificacaoMixin, CreateView):
     """Criar novo acabamento"""
     model = Acabamento
     form_class = AcabamentoForm
@@ -562,7 +505,7 @@ class AcabamentoCreateView(LoginRequiredMixin, GestorRequiredMixin, CreateView):
         return super().form_valid(form)
 
 
-class AcabamentoUpdateView(LoginRequiredMixin, GestorRequiredMixin, UpdateView):
+class AcabamentoUpdateView(LoginRequiredMixin, GestorRequiredMixin, ReprecificacaoMixin, UpdateView):
     """Editar acabamento"""
     model = Acabamento
     form_class = AcabamentoForm
@@ -574,7 +517,7 @@ class AcabamentoUpdateView(LoginRequiredMixin, GestorRequiredMixin, UpdateView):
         return super().form_valid(form)
 
 
-class AcabamentoDeleteView(LoginRequiredMixin, GestorRequiredMixin, DeleteView):
+class AcabamentoDeleteView(LoginRequiredMixin, GestorRequiredMixin, ReprecificacaoMixin, DeleteView):
     """Deletar acabamento"""
     model = Acabamento
     template_name = 'orcamento/tabelas/acabamento_confirm_delete.html'
@@ -588,7 +531,7 @@ class AcabamentoDeleteView(LoginRequiredMixin, GestorRequiredMixin, DeleteView):
 
 # ================== PREÇOS DE ACABAMENTO ==================
 
-class PrecoAcabamentoCreateView(LoginRequiredMixin, GestorRequiredMixin, View):
+class PrecoAcabamentoCreateView(LoginRequiredMixin, GestorRequiredMixin, ReprecificacaoMixin, View):
     """Criar preço de acabamento (via modal na tela de edição)"""
     
     def post(self, request, acabamento_id):
@@ -607,7 +550,7 @@ class PrecoAcabamentoCreateView(LoginRequiredMixin, GestorRequiredMixin, View):
         return redirect('orcamento:acabamento_update', pk=acabamento_id)
 
 
-class PrecoAcabamentoDeleteView(LoginRequiredMixin, GestorRequiredMixin, DeleteView):
+class PrecoAcabamentoDeleteView(LoginRequiredMixin, GestorRequiredMixin, ReprecificacaoMixin, DeleteView):
     """Deletar preço de acabamento"""
     model = PrecoAcabamento
     
@@ -0,0 +1,84 @@
+from django.contrib import messages
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core.exceptions import ValidationError
+from django.shortcuts import get_object_or_404, redirect
+from django.views.generic import FormView, ListView, View
+from .ajustes_precos import aplicar, desfazer, previsao
+from .forms_tabelas import AjustePrecosForm
+from .mixins import GestorRequiredMixin, ReprecificacaoMixin
+from .models import AlteracaoPreco
+
+
+class AjustePrecosView(LoginRequiredMixin, GestorRequiredMixin, ReprecificacaoMixin, FormView):
+    """
+    Ajuste em massa das tabelas de preço: "previsualizar" mostra o antes e
+    depois sem gravar; "aplicar" grava (ver ajustes_precos.py)
+    """
+    template_name = 'orcamento/tabelas/ajuste_precos.html'
+    form_class = AjustePrecosForm
+
+    def get_initial(self):
+        # Links das grades pré-selecionam tabela e material/acabamento
+        initial = super().get_initial()
+        for campo in ('tabela', 'materiais', 'acabamentos'):
+            if campo in self.request.GET:
+                initial[campo] = self.request.GET.getlist(campo) if campo != 'tabela' else self.request.GET[campo]
+        return initial
+
+    def form_valid(self, form):
+        ajuste = form.ajuste()
+        if 'aplicar' not in self.request.POST:
+            return self.render_to_response(self.get_context_data(form=form, previsao=previsao(ajuste)))
+        try:
+            resumo = aplicar(ajuste)
+        except ValidationError as e:
+            form.add_error(None, e)
+            return self.render_to_response(self.get_context_data(form=form, previsao=previsao(ajuste)))
+        if resumo['alteracao'] is None:
+            messages.info(self.request, 'Nenhum valor mudou com este ajuste.')
+            return self.render_to_response(self.get_context_data(form=form))
+        messages.success(
+            self.request,
+            f'{resumo["alteradas"]} valores alterados e {resumo["criadas"]} criados (versão '
+            f'{resumo["alteracao"].versao}). Os orçamentos abertos afetados serão reprecificados.'
+        )
+        return redirect('orcamento:alteracaopreco_list')
+
+
+class AlteracaoPrecoListView(LoginRequiredMixin, GestorRequiredMixin, ListView):
+    """Registro de alterações dos preços, com a opção de desfazer"""
+    model = AlteracaoPreco
+    template_name = 'orcamento/tabelas/alteracaopreco_list.html'
+    context_object_name = 'alteracoes'
+    paginate_by = 50
+
+    def get_queryset(self):
+        queryset = super().get_queryset().select_related('usuario')
+        modelo = self.request.GET.get('modelo')
+        if modelo:
+            queryset = queryset.filter(modelo=modelo)
+        return queryset
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['modelos'] = AlteracaoPreco.objects.order_by('modelo').values_list('modelo', flat=True).distinct()
+        context['modelo'] = self.request.GET.get('modelo', '')
+        return context
+
+
+class DesfazerAlteracaoView(LoginRequiredMixin, GestorRequiredMixin, ReprecificacaoMixin, View):
+    """Reverte um registro de alteração (gera uma nova versão)"""
+
+    def post(self, request, pk):
+        alteracao = get_object_or_404(AlteracaoPreco, pk=pk)
+        try:
+            resumo = desfazer(alteracao)
+        except ValidationError as e:
+            messages.error(request, ' '.join(e.messages))
+        else:
+            messages.success(
+                request,
+                f'Versão {alteracao.versao} desfeita: {resumo["restauradas"]} restaurados, '
+                f'{resumo["recriadas"]} recriados e {resumo["excluidas"]} excluídos.'
+            )
+        return redirect('orcamento:alteracaopreco_list')
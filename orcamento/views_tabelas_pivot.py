@@ -1,55 +1,141 @@
+import hashlib
+import json
+
+from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core.exceptions import ValidationError
+from django.middleware.csrf import get_token
+from django.shortcuts import redirect
+from django.utils.cache import get_conditional_response, patch_cache_control, quote_etag
 from django.views.generic import TemplateView
-from .mixins import GestorRequiredMixin
-from .models import Acabamento, PrecoAcabamento
+from .edicao_precos import aplicar_edicao
+from .mixins import GestorRequiredMixin, ReprecificacaoMixin
+from .pivots_precos import obter_pivot
+from .versao_precos import versao_atual
+
+
+class PivotPrecosMixin:
+    """
+    Grade em cache pela versão dos preços, com ETag/304. O ETag muda com a
+    versão, o usuário (cabeçalho da página), o segredo CSRF (formulário de
+    edição) e a query string; com mensagens pendentes a página é sempre
+    renderizada para exibi-las.
+    """
+    pivot = None
+
+    def get(self, request, *args, **kwargs):
+        self.versao_precos = versao_atual()
+        # Garante o segredo CSRF já nesta resposta, para o ETag não mudar na próxima
+        get_token(request)
+        conteudo = (f'{self.pivot}:{self.versao_precos}:{request.user.pk}:'
+                    f'{request.META.get("CSRF_COOKIE", "")}:{request.GET.urlencode()}')
+        etag = quote_etag(hashlib.sha1(conteudo.encode()).hexdigest())
+        response = None
+        if not len(messages.get_messages(request)):
+            response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        # Também no 304, que atualiza os cabeçalhos guardados pelo navegador
+        response['ETag'] = etag
+        # Revalida sempre: a grade pode ter mudado em outra aba ou por outro gestor
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    def obter_pivot(self):
+        return obter_pivot(self.pivot, getattr(self, 'versao_precos', None))
+
+
+class EdicaoPivotMixin(ReprecificacaoMixin):
+    """
+    POST com o lote de células alteradas (JSON em "alteracoes", ver
+    edicao_precos.py). Com erro, a grade é exibida de novo com as edições
+    pendentes para o usuário corrigir.
+    """
+    descricao_edicao = 'Edição em lote'
+
+    def get_fixo(self):
+        return None
+
+    def post(self, request, *args, **kwargs):
+        try:
+            alteracoes = json.loads(request.POST.get('alteracoes') or '[]')
+            if not isinstance(alteracoes, list):
+                raise ValueError
+        except ValueError:
+            alteracoes = None
+        try:
+            if alteracoes is None:
+                raise ValidationError('Lote de alterações inválido.')
+            resumo = aplicar_edicao(self.pivot, alteracoes, self.get_fixo(),
+                                    descricao=self.descricao_edicao)
+        except ValidationError as e:
+            context = self.get_context_data(**kwargs)
+            context['erros_edicao'] = e.messages
+            context['alteracoes_pendentes'] = alteracoes or []
+            return self.render_to_response(context, status=400)
+        if resumo['alterados'] or resumo['criados']:
+            messages.success(
+                request,
+                f'{resumo["alterados"]} valores alterados e {resumo["criados"]} criados. '
+                f'Os orçamentos abertos afetados serão reprecificados.'
+            )
+        else:
+            messages.info(request, 'Nenhuma alteração para salvar.')
+        return redirect(request.get_full_path())
+
+
+class TabelaPrecoPivotView(LoginRequiredMixin, GestorRequiredMixin, PivotPrecosMixin, EdicaoPivotMixin, TemplateView):
+    """Visão pivot da tabela de preços (Materiais x Metragens)"""
+    template_name = 'orcamento/tabelas/tabelapreco_pivot.html'
+    pivot = 'tabela_precos'
+    descricao_edicao = 'Edição em lote da tabela de preços'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        pivot = self.obter_pivot()
+        context['metragens'] = pivot['metragens']
+        context['pivot_data'] = pivot['linhas']
+        return context
 
-class AcabamentoPivotView(LoginRequiredMixin, GestorRequiredMixin, TemplateView):
+
+class AcabamentoPivotView(LoginRequiredMixin, GestorRequiredMixin, PivotPrecosMixin, EdicaoPivotMixin, TemplateView):
     """Visão pivot de acabamentos (Materiais x Larguras)"""
     template_name = 'orcamento/tabelas/acabamento_pivot.html'
-    
+    pivot = 'acabamentos'
+    descricao_edicao = 'Edição em lote dos preços de acabamento'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        pivot = self.obter_pivot()
+        context['larguras'] = pivot['larguras']
+        context['pivot_data'] = pivot['linhas']
+        return context
+
+
+class CoeficienteFatorPivotView(LoginRequiredMixin, GestorRequiredMixin, PivotPrecosMixin, EdicaoPivotMixin, TemplateView):
+    """Visão pivot dos coeficientes de um material (Larguras x Cortes)"""
+    template_name = 'orcamento/tabelas/coeficientefator_pivot.html'
+    pivot = 'coeficientes'
+    descricao_edicao = 'Edição em lote dos coeficientes'
+
+    def get_fixo(self):
+        try:
+            return int(self.request.GET.get('material', ''))
+        except ValueError:
+            return None
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        
-        # Buscar todas as larguras únicas, ordenadas
-        larguras = list(PrecoAcabamento.objects.values_list('largura_mm', flat=True)
-                         .distinct().order_by('largura_mm'))
-        
-        # Buscar todos os acabamentos ativos, ordenados
-        acabamentos = Acabamento.objects.filter(ativo=True).order_by('ordem', 'nome')
-        
-        # Montar a estrutura de dados para a tabela pivot
-        # [
-        #   {
-        #     'acabamento': acabamento_obj,
-        #     'precos': {largura_mm: preco, ...}
-        #   },
-        #   ...
-        # ]
-        
-        pivot_data = []
-        
-        for acabamento in acabamentos:
-            # Buscar preços deste acabamento
-            precos = PrecoAcabamento.objects.filter(acabamento=acabamento)
-            precos_map = {p.largura_mm: p.preco for p in precos}
-            
-            row = {
-                'acabamento': acabamento,
-                'precos': []
-            }
-            
-            # Preencher a lista de preços na ordem das colunas de larguras
-            for l in larguras:
-                valor = precos_map.get(l)
-                row['precos'].append({
-                    'largura_mm': l,
-                    'valor': valor,
-                    'existe': valor is not None
-                })
-                
-            pivot_data.append(row)
-            
-        context['larguras'] = larguras
-        context['pivot_data'] = pivot_data
-        
+        pivots = self.obter_pivot()
+        materiais = [pivot['material'] for pivot in pivots.values()]
+        material_id = self.get_fixo()
+        if material_id not in pivots:
+            material_id = materiais[0]['id'] if materiais else None
+        pivot = pivots.get(material_id, {'material': None, 'cortes': [], 'linhas': []})
+        context['materiais'] = materiais
+        context['material'] = pivot['material']
+        context['cortes'] = pivot['cortes']
+        context['pivot_data'] = pivot['linhas']
+        # O lote de edição vale para o material exibido
+        context['parametros_edicao'] = f'material={material_id}' if pivot['material'] else ''
         return context